@@ -1,10 +1,14 @@
 from flask import Flask
-from app.routes.video import video_bp
 
-def create_app():
+def create_app(start_services=False):
+    # Imported here so tools and benchmarks can use app.* modules without
+    # starting the web app
+    from app.routes.video import video_bp, service
+
     app = Flask(__name__)
     app.register_blueprint(video_bp)
-    return app
-
-
 
+    # Otherwise cameras and the model are opened on the first request
+    if start_services:
+        service.start()
+    return app
@@ -0,0 +1,97 @@
+"""
+ASGI server mode (SERVER_MODE=asgi python run.py, or
+uvicorn --factory app.asgi:create_asgi_app).
+
+The MJPEG feeds and the server-sent events are served by async handlers
+reading straight from the FrameBroadcasters and EventChannels, so each
+viewer is a coroutine rather than a thread.
+Every other route goes to the Flask app through asgiref's WSGI adapter.
+"""
+import asyncio
+import re
+from app import create_app
+from app.monitoring.prometheus import SKIPPED_FRAMES, STREAMED_BYTES
+from app.routes.video import service
+from app.streaming.asgi_feed import parse_max_rate, parse_profile, send_text, serve_events, serve_feed
+
+FEED_PATH = re.compile(r'^(?:/camera/(?P<camera>[^/]+))?/(?P<feed>video_feed|raw_feed|diff_feed|object_feed)$')
+FEED_TYPES = {'video_feed': 'motion', 'raw_feed': 'raw', 'diff_feed': 'diff', 'object_feed': 'object'}
+EVENTS_PATH = re.compile(r'^(?:/camera/(?P<camera>[^/]+))?/events$')
+
+def create_asgi_app(start_services=True):
+    """Returns: the ASGI application"""
+    from asgiref.wsgi import WsgiToAsgi
+
+    flask_app = WsgiToAsgi(create_app(start_services=start_services))
+
+    async def application(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await handle_lifespan(receive, send)
+            return
+        if scope['type'] == 'http':
+            match = FEED_PATH.match(scope['path'])
+            if match:
+                await stream_feed(scope, receive, send, FEED_TYPES[match['feed']], match['camera'])
+                return
+            match = EVENTS_PATH.match(scope['path'])
+            if match:
+                await stream_events(scope, receive, send, match['camera'])
+                return
+        await flask_app(scope, receive, send)
+
+    return application
+
+async def handle_lifespan(receive, send):
+    """Acknowledge server startup and shutdown; the service runs in its own threads"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def find_pipeline(send, camera_name):
+    """Wait for the service to warm up and look up a camera; sends the error response and returns None if that fails"""
+    if service.state != "running":
+        running = await asyncio.get_running_loop().run_in_executor(None, service.wait_until_running)
+        if not running:
+            await send_text(send, 503, f"Video service is {service.state}")
+            return None
+
+    pipeline = service.registry.default if camera_name is None else service.registry.get(camera_name)
+    if pipeline is None:
+        await send_text(send, 404, f"Unknown camera '{camera_name}'")
+    return pipeline
+
+async def stream_events(scope, receive, send, camera_name):
+    """Push a camera's detections and metrics as server-sent events"""
+    try:
+        max_rate = parse_max_rate(scope.get('query_string', b''))
+    except ValueError:
+        await send_text(send, 400, "max_rate must be a positive number")
+        return
+
+    pipeline = await find_pipeline(send, camera_name)
+    if pipeline is not None:
+        await serve_events(pipeline.events, receive, send, max_rate)
+
+async def stream_feed(scope, receive, send, frame_type, camera_name):
+    """Stream one feed, holding the connection open while the service warms up"""
+    try:
+        profile = parse_profile(scope.get('query_string', b''))
+    except ValueError:
+        await send_text(send, 400, "width and quality must be integers, max_fps a number")
+        return
+
+    pipeline = await find_pipeline(send, camera_name)
+    if pipeline is None:
+        return
+
+    stream = f"{pipeline.name}-{frame_type}"
+    await serve_feed(
+        pipeline.broadcaster(frame_type), receive, send,
+        streamed_bytes=STREAMED_BYTES.labels(stream),
+        skipped=SKIPPED_FRAMES.labels(stream),
+        profile=profile,
+    )
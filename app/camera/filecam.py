@@ -0,0 +1,109 @@
+import cv2
+import time
+import threading
+from app.pipeline.frame_pool import FramePool
+
+class FileCamera:
+    """
+    Camera backed by a video file, for replaying recorded clips through the pipeline.
+    With realtime=True a reader thread decodes at the clip's native frame rate,
+    like a live camera. Otherwise every get_frame() call decodes the next frame,
+    so a consumer can run through the clip as fast as it can process it.
+    """
+    def __init__(self, path, realtime=False, loop=True):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise IOError(f"Cannot open video file: {path}")
+
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 0 else 30.0
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.frames_read = 0
+        # Set once a non-looping clip has been read to the end
+        self.finished = False
+
+        self.pool = FramePool(f"file-{path}")
+        self.ret, self.frame = False, None
+        self.lock = threading.Lock()
+        # Serialises on-demand decoding when several threads call get_frame()
+        self.read_lock = threading.Lock()
+        self.running = True
+
+        self.thread = None
+        if realtime:
+            self.thread = threading.Thread(target=self.update_frames, daemon=True)
+            self.thread.start()
+
+    def read_next(self):
+        """
+        Decode the next frame, rewinding at the end of the clip if looping
+        Returns: (success, frozen PooledFrame or None)
+        """
+        ret, frame = self.pool.read_frame(self.cap)
+        if not ret and self.loop and self.frames_read > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.pool.read_frame(self.cap)
+        if not ret:
+            self.finished = True
+            return False, None
+        self.frames_read += 1
+        return True, frame
+
+    def update_frames(self):
+        """Decode frames at the clip's native frame rate (realtime mode)"""
+        interval = 1.0 / self.fps
+        next_time = time.time()
+        while self.running:
+            ret, frame = self.read_next()
+            if not ret:
+                break
+            self._set_frame(ret, frame)
+
+            next_time += interval
+            delay = next_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Fell behind; don't try to catch up with a burst of frames
+                next_time = time.time()
+
+    def _set_frame(self, ret, frame):
+        """Swap in the newest frame and release the one it replaces"""
+        with self.lock:
+            previous = self.frame
+            self.ret, self.frame = ret, frame
+        if previous is not None:
+            previous.release()
+
+    def _advance(self):
+        """Decode the next frame on demand (when not in realtime mode)"""
+        if not self.realtime:
+            with self.read_lock:
+                self._set_frame(*self.read_next())
+
+    def get_frame(self):
+        """
+        Return the newest frame as an ndarray (the next frame of the clip unless realtime)
+        The buffer is recycled once newer frames arrive; use get_frame_ref to hold on to it.
+        """
+        self._advance()
+        with self.lock:
+            return self.ret, self.frame.array if self.frame is not None else None
+
+    def get_frame_ref(self):
+        """Return the newest frame as a PooledFrame with a reference held for the caller"""
+        self._advance()
+        with self.lock:
+            if self.frame is None:
+                return False, None
+            return self.ret, self.frame.retain()
+
+    def stop(self):
+        """Stop the reader thread and release the file"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.cap.release()
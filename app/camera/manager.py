@@ -0,0 +1,118 @@
+from app.camera.webcam import Webcam
+from app.camera.phonecam import Phonecam
+from app.camera.mjpeg import MjpegCamera
+import threading
+import time
+
+class CameraManager:
+    """
+    Owns the webcam and phone camera behind the default camera and switches between them.
+    With keep_warm the standby source stays open, so a switch is just a pointer swap;
+    otherwise the previous source is stopped and its device released in the background.
+    """
+    SOURCES = ("webcam", "phonecam")
+
+    def __init__(self, phonecam_url, initial="webcam", keep_warm=False, webcam_src=0, mjpeg=False):
+        self.phonecam_url = phonecam_url
+        # Read the phone camera as MJPEG without OpenCV
+        self.mjpeg = mjpeg
+        self.webcam_src = webcam_src
+        self.keep_warm = keep_warm
+
+        self.sources = {}
+        self.active = None
+        self.active_name = None
+        self.lock = threading.Lock()
+
+        self.switch_to(initial)
+        if keep_warm:
+            standby = "phonecam" if initial == "webcam" else "webcam"
+            threading.Thread(target=self._open_standby, args=(standby,), daemon=True).start()
+
+    def _open(self, name):
+        """Open a source by name"""
+        if name == "webcam":
+            return Webcam(self.webcam_src)
+        if self.mjpeg:
+            return MjpegCamera(self.phonecam_url)
+        return Phonecam(self.phonecam_url)
+
+    def _open_standby(self, name):
+        """Open the standby source ahead of the first switch"""
+        try:
+            camera = self._open(name)
+        except RuntimeError as e:
+            print(f"Cannot open standby camera: {e}")
+            return
+        with self.lock:
+            existing = self.sources.setdefault(name, camera)
+        if existing is not camera:
+            # A switch opened it first
+            camera.stop()
+
+    def switch_to(self, name):
+        """
+        Make name ('webcam' or 'phonecam') the active source
+        Returns: True if the active source changed
+        """
+        if name not in self.SOURCES:
+            print(f"Unknown camera source '{name}'")
+            return False
+        with self.lock:
+            if name == self.active_name:
+                return False
+            camera = self.sources.get(name)
+
+        # Opening can take a network timeout, so it happens outside the lock
+        opened = None
+        if camera is None:
+            camera = opened = self._open(name)
+
+        with self.lock:
+            if name == self.active_name:
+                # A concurrent switch got there first
+                discard, previous, changed = opened, None, False
+            else:
+                # Keep a source a concurrent switch or the standby opener has registered meanwhile
+                existing = self.sources.setdefault(name, camera)
+                discard = opened if existing is not camera else None
+                camera = existing
+                previous_name = self.active_name
+                self.active, self.active_name = camera, name
+                previous = None if self.keep_warm else self.sources.pop(previous_name, None)
+                changed = True
+
+        if discard is not None:
+            threading.Thread(target=discard.stop, daemon=True).start()
+        if previous is not None:
+            # Stopping joins the reader thread, which can take a frame interval or a network timeout
+            threading.Thread(target=previous.stop, daemon=True).start()
+        return changed
+
+    def wait_until_ready(self, timeout=5.0):
+        """Wait until the active source has delivered a frame"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            success, frame = self.active.get_frame()
+            if success and frame is not None:
+                return True
+            time.sleep(0.01)
+        return False
+
+    @property
+    def reconnects(self):
+        """Stream reconnects across the open sources"""
+        return sum(getattr(camera, 'reconnects', 0) for camera in list(self.sources.values()))
+
+    def get_frame(self):
+        return self.active.get_frame()
+
+    def get_frame_ref(self):
+        return self.active.get_frame_ref()
+
+    def stop(self):
+        """Stop every open source"""
+        with self.lock:
+            sources, self.sources = list(self.sources.values()), {}
+        for camera in sources:
+            camera.stop()
@@ -0,0 +1,119 @@
+import http.client
+import time
+import urllib.request
+from app.camera.phonecam import Phonecam
+from app.pipeline.frame_pool import JpegFrame, jpeg_shape
+
+def multipart_boundary(content_type):
+    """The boundary of a multipart Content-Type header, without leading dashes; None if not multipart"""
+    if not content_type.lower().startswith('multipart/'):
+        return None
+    for param in content_type.split(';')[1:]:
+        name, _, value = param.strip().partition('=')
+        if name.lower() == 'boundary' and value:
+            return value.strip('"').lstrip('-').encode()
+    return None
+
+def read_jpeg_parts(stream, boundary):
+    """
+    Yield the JPEG bytes of each part of a multipart/x-mixed-replace stream
+    Parts with a Content-Length are read in one go; otherwise the part runs to
+    the next boundary line. Parts that aren't JPEGs are skipped.
+    """
+    # DroidCam and some other servers omit the dashes on the boundary lines
+    def is_boundary(line):
+        return line.strip().lstrip(b'-') == boundary
+
+    line = stream.readline()
+    while line and not is_boundary(line):
+        line = stream.readline()
+
+    while line:
+        headers = {}
+        while True:
+            line = stream.readline()
+            if not line or not line.strip():
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if not line:
+            return
+
+        length = headers.get('content-length')
+        if length and length.isdigit():
+            data = stream.read(int(length))
+            if len(data) < int(length):
+                return
+            # Skip to the next boundary
+            line = stream.readline()
+            while line and not is_boundary(line):
+                line = stream.readline()
+        else:
+            chunks = []
+            line = stream.readline()
+            while line and not is_boundary(line):
+                chunks.append(line)
+                line = stream.readline()
+            data = b''.join(chunks)
+            # The line break before the boundary belongs to the boundary
+            if data.endswith(b'\r\n'):
+                data = data[:-2]
+            elif data.endswith(b'\n'):
+                data = data[:-1]
+
+        if data.startswith(b'\xff\xd8'):
+            yield data
+
+class MjpegCamera(Phonecam):
+    """
+    Phone camera that reads the MJPEG stream itself instead of through
+    cv2.VideoCapture. Frames are JpegFrames: the camera's JPEG bytes pass
+    straight through to the raw feed and recordings, and pixels are only
+    decoded when something needs them (motion analysis at reduced scale,
+    object detection, overlays being watched).
+    Reconnects with backoff like Phonecam.
+    """
+    def __init__(self, url, timeout=5.0, **kwargs):
+        self.timeout = timeout
+        self.parts = None
+        super().__init__(url, **kwargs)
+
+    def open_camera(self):
+        """Try opening the MJPEG stream once"""
+        try:
+            response = urllib.request.urlopen(self.url, timeout=self.timeout)
+        except (OSError, ValueError, http.client.HTTPException):
+            return False
+
+        boundary = multipart_boundary(response.headers.get('Content-Type', ''))
+        if boundary is None:
+            print(f"Not an MJPEG stream ({response.headers.get('Content-Type')}): {self.url}")
+            response.close()
+            return False
+
+        self.cap = response
+        self.parts = read_jpeg_parts(response, boundary)
+        print(f"MJPEG stream opened: {self.url}")
+        return True
+
+    def read_frame(self):
+        """Read the next JPEG off the stream, without decoding it"""
+        read_start = time.time()
+        try:
+            while True:
+                jpeg = next(self.parts)
+                # A part without a frame header isn't an image we can use
+                shape = jpeg_shape(jpeg)
+                if shape is not None:
+                    break
+        except (StopIteration, OSError, http.client.HTTPException):
+            return False, None
+        frame = JpegFrame(jpeg, shape)
+        frame.captured_at = time.time()
+        frame.read_seconds = frame.captured_at - read_start
+        return True, frame
+
+    def close_camera(self):
+        """Close the HTTP connection"""
+        self.parts = None
+        self.cap.close()
@@ -1,42 +1,108 @@
 import cv2
-import time
+import random
+import threading
+from app.pipeline.frame_pool import FramePool
 
 class Phonecam:
-    def __init__(self, url):
+    def __init__(self, url, backoff_initial=0.5, backoff_max=30.0):
         self.url = url
         self.cap = None
-        self.retry_count = 5  
-        self.open_camera()
+
+        # Reconnect delay doubles after every failed attempt, up to backoff_max
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.reconnects = 0
+
+        # Frames are read straight into recycled buffers; self.frame is a PooledFrame
+        self.pool = FramePool("phonecam")
+        self.ret, self.frame = False, None
+        self.lock = threading.Lock()
+        self.running = True
+        # Set to cut a backoff wait short when stopping
+        self.wake = threading.Event()
+
+        self.thread = threading.Thread(target=self.update_frames, daemon=True)
+        self.thread.start()
 
     def open_camera(self):
-        """Try opening the phone camera stream with retries"""
-        for i in range(self.retry_count):
-            self.cap = cv2.VideoCapture(self.url)
-            if self.cap.isOpened():
-                print(f"Phone camera stream opened: {self.url}")
-                return True
-            else:
-                print(f"Attempt {i+1}/{self.retry_count}: Cannot open phone camera stream")
-                time.sleep(2)  
-        return False
+        """Try opening the phone camera stream once"""
+        cap = cv2.VideoCapture(self.url)
+        if not cap.isOpened():
+            cap.release()
+            return False
+
+        # Keep the backend from queueing frames we would only read late
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.cap = cap
+        print(f"Phone camera stream opened: {self.url}")
+        return True
+
+    def update_frames(self):
+        """Read frames continuously, keeping only the newest, and reconnect on failure"""
+        delay = self.backoff_initial
+        while self.running:
+            if self.cap is None:
+                if not self.open_camera():
+                    # Exponential backoff with jitter so several cameras don't retry in lockstep
+                    wait = delay * random.uniform(0.5, 1.5)
+                    print(f"Cannot open phone camera stream, retrying in {wait:.1f}s")
+                    self.wake.wait(wait)
+                    delay = min(delay * 2, self.backoff_max)
+                    continue
+                delay = self.backoff_initial
+
+            ret, frame = self.read_frame()
+            if not ret:
+                print("Failed to capture frame from phone camera. Reconnecting...")
+                self.close_camera()
+                self.cap = None
+                self.reconnects += 1
+                self._set_frame(False, None)
+                continue
+
+            self._set_frame(ret, frame)
+
+    def read_frame(self):
+        """Read the next frame from the open stream; returns (success, PooledFrame or None)"""
+        return self.pool.read_frame(self.cap)
+
+    def close_camera(self):
+        """Close the open stream"""
+        self.cap.release()
+
+    def _set_frame(self, ret, frame):
+        """Swap in the newest frame and release the one it replaces"""
+        with self.lock:
+            previous = self.frame
+            self.ret, self.frame = ret, frame
+        if previous is not None:
+            previous.release()
 
     def get_frame(self):
-        """Read frame from phone camera stream"""
-        if self.cap is None or not self.cap.isOpened():
-            print("Camera is not initialized properly. Reconnecting...")
-            self.open_camera()
-            return False, None
+        """
+        Return the newest frame from the phone camera stream without blocking
+        The buffer is recycled once newer frames arrive; use get_frame_ref to hold on to it.
+        """
+        with self.lock:
+            return self.ret, self.frame.array if self.frame is not None else None
 
-        success, frame = self.cap.read()
-        if not success:
-            print("Failed to capture frame from phone camera")
-            self.open_camera()
-            return False, None
+    def get_frame_ref(self):
+        """Return the newest frame as a PooledFrame with a reference held for the caller"""
+        with self.lock:
+            if self.frame is None:
+                return False, None
+            return self.ret, self.frame.retain()
 
-        return True, frame
+    def stop(self):
+        """Stop the reader thread and release the camera resource"""
+        self.running = False
+        self.wake.set()
+        self.thread.join()
+        if self.cap:
+            self.close_camera()
+            self.cap = None
+            print("Camera released")
 
     def release(self):
         """Release the camera resource"""
-        if self.cap:
-            self.cap.release()
-            print("Camera released")
+        self.stop()
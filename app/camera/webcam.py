@@ -1,6 +1,7 @@
 import cv2
 import time
 import threading
+from app.pipeline.frame_pool import FramePool
 
 class Webcam:
     def __init__(self, src=0):
@@ -8,14 +9,16 @@ class Webcam:
         self.camera = cv2.VideoCapture(src)
 
         if not self.camera.isOpened():
-            print("Error: Cannot open webcam! Check permissions and index.")
-            exit()
+            self.camera.release()
+            raise RuntimeError(f"Cannot open webcam {src}! Check permissions and index.")
 
         self.camera.set(cv2.CAP_PROP_FPS, 30)
         self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
         self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
 
-        self.ret, self.frame = self.camera.read()
+        # Frames are read straight into recycled buffers; self.frame is a PooledFrame
+        self.pool = FramePool("webcam")
+        self.ret, self.frame = self.pool.read_frame(self.camera)
         self.lock = threading.Lock()
         self.running = True
 
@@ -24,18 +27,32 @@ class Webcam:
 
     def update_frames(self):
         while self.running:
-            ret, frame = self.camera.read()
+            ret, frame = self.pool.read_frame(self.camera)
             if not ret:
                 print("Warning: No frame received!")
                 time.sleep(0.1)
                 continue
 
             with self.lock:
+                previous = self.frame
                 self.ret, self.frame = ret, frame
+            if previous is not None:
+                previous.release()
 
     def get_frame(self):
+        """
+        Return the newest frame as an ndarray
+        The buffer is recycled once newer frames arrive; use get_frame_ref to hold on to it.
+        """
         with self.lock:
-            return self.ret, self.frame
+            return self.ret, self.frame.array if self.frame is not None else None
+
+    def get_frame_ref(self):
+        """Return the newest frame as a PooledFrame with a reference held for the caller"""
+        with self.lock:
+            if self.frame is None:
+                return False, None
+            return self.ret, self.frame.retain()
 
     def stop(self):
         self.running = False
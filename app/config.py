@@ -1,38 +1,164 @@
-import cv2
 import os
+import socket
+import http.client
+from urllib.parse import urlparse
 
 class Config:
     def __init__(self):
         # Get phone camera URL from environment variable or use default
         self.phonecam_url = os.getenv('PHONE_CAMERA_URL', 'http://10.45.7.149:4747/video')
-        self.CAMERA_SOURCE = self.select_camera()
+
+        # How often and how patiently the phone camera server is probed
+        self.phonecam_probe_interval = float(os.getenv('PHONECAM_PROBE_INTERVAL', '2.0'))
+        self.phonecam_probe_timeout = float(os.getenv('PHONECAM_PROBE_TIMEOUT', '0.5'))
+
+        # Read http(s) camera streams as MJPEG directly instead of through OpenCV: the camera's
+        # JPEGs pass through to the feeds and recordings and are only decoded when pixels are needed
+        self.phonecam_mjpeg = os.getenv('PHONECAM_MJPEG', '0') == '1'
+
+        # Keep the standby camera open so switching between webcam and phone camera is instant
+        self.camera_keep_warm = os.getenv('CAMERA_KEEP_WARM', '0') == '1'
+
+        # Object detection gating: 'always' or 'motion'
+        self.detection_mode = os.getenv('DETECTION_MODE', 'always')
+        self.detection_hold_seconds = float(os.getenv('DETECTION_HOLD_SECONDS', '2.0'))
+        self.detection_keyframe_interval = float(os.getenv('DETECTION_KEYFRAME_INTERVAL', '0'))
+
+        # Run object detection on at most every Nth frame
+        self.detection_stride = int(os.getenv('DETECTION_STRIDE', '1'))
+
+        # Track objects across frames: stable IDs, one stored event per object, and
+        # boxes that keep moving on frames where detection is skipped
+        self.tracking = os.getenv('TRACKING', '0') == '1'
+
+        # Run object detection on crops around motion instead of the full frame
+        self.detection_roi = os.getenv('DETECTION_ROI', '0') == '1'
+        self.detection_roi_padding = int(os.getenv('DETECTION_ROI_PADDING', '32'))
+
+        # Object detection inference backend: 'torch' (ultralytics), 'onnx' or 'openvino'
+        self.detection_backend = os.getenv('DETECTION_BACKEND', 'torch')
+        self.detection_imgsz = int(os.getenv('DETECTION_IMGSZ', '640'))
+        self.detection_threads = int(os.getenv('DETECTION_THREADS', '0'))  # 0 = library default
+        self.detection_int8 = os.getenv('DETECTION_INT8', '0') == '1'
+        self.model_cache_dir = os.getenv('MODEL_CACHE_DIR', 'models')
+        # Run object detection in this many worker processes instead of in-process (0)
+        self.detection_workers = int(os.getenv('DETECTION_WORKERS', '0'))
+        # Optional comma-separated class names to keep, e.g. "person,car"; empty keeps all
+        self.detection_classes = [name.strip() for name in os.getenv('DETECTION_CLASSES', '').split(',') if name.strip()]
+
+        # Run motion analysis on a downscaled (and optionally grayscale) frame
+        self.motion_analysis_scale = float(os.getenv('MOTION_ANALYSIS_SCALE', '1.0'))
+        self.motion_grayscale = os.getenv('MOTION_GRAYSCALE', '0') == '1'
+
+        # Shed load to keep the end-to-end latency of detected frames under this many
+        # seconds, by raising the detection stride and lowering the motion analysis
+        # scale and model input size step by step (0 disables)
+        self.latency_target = float(os.getenv('LATENCY_TARGET', '0'))
+        # Seconds of latency averaged per decision, and how long it must stay under
+        # half the target before a step is undone
+        self.governor_interval = float(os.getenv('GOVERNOR_INTERVAL', '2.0'))
+        self.governor_recover_seconds = float(os.getenv('GOVERNOR_RECOVER_SECONDS', '30'))
+
+        # SQLite file for the detection history; disabled unless DETECTION_DB is set
+        self.detection_db = os.getenv('DETECTION_DB', '')
+        # Without tracking, a frame is stored when the classes seen (and their counts)
+        # change, and otherwise at most every DETECTION_DB_INTERVAL seconds
+        self.detection_db_interval = float(os.getenv('DETECTION_DB_INTERVAL', '10'))
+        # Days of detection history kept; older rows are deleted hourly (0 keeps everything)
+        self.detection_retention_days = float(os.getenv('DETECTION_RETENTION_DAYS', '30'))
+
+        # Event clip recording; disabled unless RECORDING_DIR is set
+        self.recording_dir = os.getenv('RECORDING_DIR', '')
+        # Comma-separated triggers: 'motion' and/or object class names
+        self.recording_triggers = [name.strip() for name in os.getenv('RECORDING_TRIGGERS', 'person').split(',') if name.strip()]
+        self.recording_pre_roll = float(os.getenv('RECORDING_PRE_ROLL', '5'))
+        self.recording_post_roll = float(os.getenv('RECORDING_POST_ROLL', '5'))
+        self.recording_segment_seconds = float(os.getenv('RECORDING_SEGMENT_SECONDS', '60'))
+        self.recording_quota_mb = float(os.getenv('RECORDING_QUOTA_MB', '1024'))
+
+        # Seconds between structured metrics log lines per camera (0 disables them)
+        self.metrics_log_interval = float(os.getenv('METRICS_LOG_INTERVAL', '10'))
+
+        # Directory to keep the metrics history in (memory-mapped files that survive restarts);
+        # empty keeps it in memory only
+        self.metrics_history_dir = os.getenv('METRICS_HISTORY_DIR', '')
+
+        # Optional fixed set of cameras, e.g. CAMERAS="front=0,garage=http://10.45.7.150:4747/video,test=clips/yard.mp4"
+        # Without it a single 'default' camera is auto-selected and switched dynamically
+        self.camera_sources = self.parse_camera_sources(os.getenv('CAMERAS', ''))
+        self.auto_switch = not self.camera_sources
+        if self.auto_switch:
+            self.CAMERA_SOURCE = self.select_camera()
+            self.camera_sources = {'default': self.CAMERA_SOURCE}
+        else:
+            self.CAMERA_SOURCE = next(iter(self.camera_sources.values()))
+
+    def parse_camera_sources(self, spec):
+        """Parse a 'name=source,name=source' camera list into an ordered dict"""
+        sources = {}
+        for entry in spec.split(','):
+            entry = entry.strip()
+            if not entry:
+                continue
+            name, sep, source = entry.partition('=')
+            if not sep or '/' in name:
+                # Unnamed entries are numbered in order
+                name, source = f"camera{len(sources)}", entry
+            sources[name.strip()] = source.strip()
+        return sources
 
     def is_phonecam_available(self):
-        """Check if the phone camera stream is accessible"""
+        """
+        Check if the phone camera server is reachable without opening the stream:
+        a TCP connect, followed by an HTTP HEAD request for http(s) URLs that must
+        answer with a 2xx status
+        """
+        url = urlparse(self.phonecam_url)
+        default_ports = {'http': 80, 'https': 443, 'rtsp': 554}
+        host, port = url.hostname, url.port or default_ports.get(url.scheme)
+        if not host or not port:
+            print(f"Error checking phone camera availability: cannot probe {self.phonecam_url}")
+            return False
+
         try:
-            cap = cv2.VideoCapture(self.phonecam_url)
-            if cap.isOpened():
-                ret, frame = cap.read()
-                cap.release()
-                if ret and frame is not None:
-                    return True
+            with socket.create_connection((host, port), timeout=self.phonecam_probe_timeout):
+                pass
+        except OSError:
             return False
-        except Exception as e:
-            print(f"Error checking phone camera availability: {str(e)}")
+
+        if url.scheme not in ('http', 'https'):
+            return True
+
+        connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        connection = connection_class(host, port, timeout=self.phonecam_probe_timeout)
+        try:
+            connection.request('HEAD', url.path or '/')
+            # A 404 or 401 means something is listening, but not the stream we were given
+            return 200 <= connection.getresponse().status < 300
+        except (http.client.HTTPException, OSError):
             return False
+        finally:
+            connection.close()
 
-    def select_camera(self):
+    def select_camera(self, verbose=True):
         """Automatically select the best available camera"""
         if self.is_phonecam_available():
-            print(f"Phone camera detected at {self.phonecam_url}! Using phone camera.")
+            if verbose:
+                print(f"Phone camera detected at {self.phonecam_url}! Using phone camera.")
             return self.phonecam_url
         else:
-            print(f"Phone camera unavailable at {self.phonecam_url}. Falling back to webcam.")
+            if verbose:
+                print(f"Phone camera unavailable at {self.phonecam_url}. Falling back to webcam.")
             return "webcam"
 
     def update_camera_source(self):
-        """Re-check and update the camera source dynamically"""
-        new_source = self.select_camera()
+        """
+        Re-check and update the camera source dynamically
+        Returns: True if the source changed
+        """
+        new_source = self.select_camera(verbose=False)
         if new_source != self.CAMERA_SOURCE:
             print(f"Camera source changed to: {new_source}")
             self.CAMERA_SOURCE = new_source
+            return True
+        return False
@@ -0,0 +1,78 @@
+import numpy as np
+
+DETECTION_DTYPE = np.dtype([
+    ('x1', np.int32), ('y1', np.int32), ('x2', np.int32), ('y2', np.int32),
+    ('confidence', np.float32), ('class_id', np.int32),
+    # Set by the Tracker; -1 for untracked detections
+    ('track_id', np.int32),
+])
+
+class Detections:
+    """
+    Object detections for one frame, stored as a structured NumPy array.
+    Iterating yields the familiar {'class', 'confidence', 'bbox'} dicts; they
+    are only built (once) when something actually asks for them, e.g. JSON.
+    """
+    def __init__(self, array=None, names=None):
+        self.array = np.zeros(0, dtype=DETECTION_DTYPE) if array is None else array
+        self.names = names or {}
+        self._list = None
+
+    @classmethod
+    def from_rows(cls, rows, names):
+        """Build from an (N, 6) array of [x1, y1, x2, y2, score, class_id] rows"""
+        array = np.empty(len(rows), dtype=DETECTION_DTYPE)
+        if len(rows):
+            boxes = rows[:, :4].astype(np.int32)
+            array['x1'], array['y1'], array['x2'], array['y2'] = boxes.T
+            array['confidence'] = rows[:, 4]
+            array['class_id'] = rows[:, 5].astype(np.int32)
+            array['track_id'] = -1
+        return cls(array, names)
+
+    def filter(self, mask):
+        """Return the detections selected by a boolean mask over the array"""
+        return Detections(self.array[mask], self.names)
+
+    def same_as(self, other):
+        """True if other holds exactly the same detections"""
+        return other is self or (other is not None and np.array_equal(self.array, other.array))
+
+    def boxes(self):
+        """Return the boxes as an (N, 4) float array of [x1, y1, x2, y2]"""
+        array = self.array
+        return np.stack([array['x1'], array['y1'], array['x2'], array['y2']], axis=1).astype(float)
+
+    def class_names(self):
+        """Return the set of class names present, without building the dicts"""
+        return {self.class_name(class_id) for class_id in np.unique(self.array['class_id']).tolist()}
+
+    def rows(self):
+        """Return plain (x1, y1, x2, y2, confidence, class_id, track_id) tuples"""
+        return self.array.tolist()
+
+    def class_name(self, class_id):
+        return self.names.get(class_id, str(class_id))
+
+    def to_list(self):
+        """Return detections as a list of dicts, built lazily and cached"""
+        if self._list is None:
+            self._list = [
+                {
+                    'class': self.class_name(class_id),
+                    'confidence': confidence,
+                    'bbox': (x1, y1, x2, y2),
+                    'track_id': track_id if track_id >= 0 else None,
+                }
+                for x1, y1, x2, y2, confidence, class_id, track_id in self.rows()
+            ]
+        return self._list
+
+    def __len__(self):
+        return len(self.array)
+
+    def __bool__(self):
+        return len(self.array) > 0
+
+    def __iter__(self):
+        return iter(self.to_list())
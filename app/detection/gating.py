@@ -0,0 +1,53 @@
+import time
+
+class DetectionGate:
+    """
+    Decides whether object detection should run on the current frame.
+
+    Modes:
+      'always' - run on every frame (default)
+      'motion' - run only while motion is seen, plus hold_seconds after it stops,
+                 and every keyframe_interval seconds (0 disables keyframes)
+
+    With stride N, detection runs on at most every Nth frame; the frames in
+    between reuse (or, with tracking, propagate) the last detections.
+    """
+    MODES = ("always", "motion")
+
+    def __init__(self, mode="always", hold_seconds=2.0, keyframe_interval=0, stride=1):
+        if mode not in self.MODES:
+            print(f"Unknown detection mode '{mode}', falling back to 'always'")
+            mode = "always"
+        self.mode = mode
+        self.hold_seconds = hold_seconds
+        self.keyframe_interval = keyframe_interval
+        self.stride = max(1, stride)
+
+        self.last_motion_time = None
+        self.last_detection_time = None
+        self.frames_since_detection = 0
+
+    def update_motion(self, motion_detected):
+        """Record the motion result for a frame (called for every frame)"""
+        if motion_detected:
+            self.last_motion_time = time.time()
+
+    def should_detect(self):
+        """Return True if object detection should run now, and record it if so"""
+        now = time.time()
+        self.frames_since_detection += 1
+        if self.last_detection_time is not None and self.frames_since_detection < self.stride:
+            return False
+
+        run = self.mode == "always" or self.last_detection_time is None
+
+        if not run and self.last_motion_time is not None:
+            run = now - self.last_motion_time <= self.hold_seconds
+
+        if not run and self.keyframe_interval > 0:
+            run = now - self.last_detection_time >= self.keyframe_interval
+
+        if run:
+            self.last_detection_time = now
+            self.frames_since_detection = 0
+        return run
@@ -1,45 +1,168 @@
 import cv2
 import numpy as np
 
+def merge_boxes(boxes, gap=0):
+    """Merge (x1, y1, x2, y2) boxes that overlap or lie within gap pixels of each other"""
+    boxes = [tuple(box) for box in boxes]
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        while boxes:
+            x1, y1, x2, y2 = boxes.pop()
+            i = 0
+            while i < len(boxes):
+                ox1, oy1, ox2, oy2 = boxes[i]
+                if x1 - gap <= ox2 and ox1 - gap <= x2 and y1 - gap <= oy2 and oy1 - gap <= y2:
+                    x1, y1, x2, y2 = min(x1, ox1), min(y1, oy1), max(x2, ox2), max(y2, oy2)
+                    boxes.pop(i)
+                    merged = True
+                else:
+                    i += 1
+            result.append((x1, y1, x2, y2))
+        boxes = result
+    return boxes
+
 class MotionDetector:
-    def __init__(self, varThreshold=50, history=2000, detectShadows=True, noise_thresh=1100):
+    def __init__(self, varThreshold=50, history=2000, detectShadows=True, noise_thresh=1100, roi_merge_gap=20,
+                 analysis_scale=1.0, grayscale=False):
         self.bg_subtractor = cv2.createBackgroundSubtractorMOG2(
             detectShadows=detectShadows, varThreshold=varThreshold, history=history
         )
-        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
         self.noise_thresh = noise_thresh  
+        self.roi_merge_gap = roi_merge_gap
+
+        # Background subtraction and morphology run on a frame downscaled by analysis_scale,
+        # so the kernel and the contour area threshold are scaled to match
+        self.grayscale = grayscale
+        self._apply_scale(analysis_scale)
+        # Scale to switch to from the next find_motion() (see set_analysis_scale)
+        self.requested_scale = analysis_scale
+
+        # Scratch buffers reused across frames; OpenCV reallocates them if the frame size changes
+        self._small = None
+        self._gray = None
+        self._fg_mask = None
+        self._full_mask = None
+        # Size of the last frame analysed, and how much of it was foreground (in pixels)
+        self.frame_size = None
+        self.foreground_area = 0
+
+    def _apply_scale(self, analysis_scale):
+        self.analysis_scale = analysis_scale
+        kernel_size = max(3, int(round(5 * analysis_scale)) | 1)
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+        self.scaled_noise_thresh = self.noise_thresh * analysis_scale * analysis_scale
 
-    def detect_motion(self, frame):
+    def set_analysis_scale(self, analysis_scale):
+        """
+        Change the analysis scale from the next find_motion() call on
+        Safe to call from another thread. The background model restarts at the new size.
+        """
+        self.requested_scale = analysis_scale
+
+    def detect_motion(self, frame, dst=None, mask_dst=None):
+        """
+        Detect moving regions with background subtraction
+        The overlay is drawn on frame in place, or on dst if given (frame is then
+        left untouched); the colored mask is written to mask_dst if given.
+        Returns: (motion_detected, colored foreground mask, annotated frame,
+                  merged motion regions of interest as (x1, y1, x2, y2) boxes)
+        """
         if frame is None:
             print("Error: Received None frame in detect_motion()")
-            return False, None, None  
+            return False, None, None, []
 
         if not isinstance(frame, np.ndarray):
             print("Error: Frame is not a valid NumPy array")
-            return False, None, None
+            return False, None, None, []
+
+        motion_detected, boxes, rois = self.find_motion(frame, frame.shape)
+
+        if dst is not None:
+            np.copyto(dst, frame)
+            frame = dst
+        self.draw_motion(frame, boxes)
+
+        return motion_detected, self.colored_mask(mask_dst), frame, rois
 
-        fg_mask = self.bg_subtractor.apply(frame)
+    def find_motion(self, source, shape):
+        """
+        Update the background model with a frame and find the moving regions, drawing nothing
+        source is the frame itself or a smaller copy of it, at least analysis_scale
+        times its size (e.g. decoded at reduced scale from a JPEG); shape is the
+        full frame's. Boxes are in full-frame coordinates.
+        Returns: (motion_detected, motion boxes, merged regions of interest)
+        """
+        height, width = shape[:2]
+        self.frame_size = (width, height)
+
+        # The background model re-learns from scratch at a new size, seeing only foreground at first
+        rescaled = self.requested_scale != self.analysis_scale
+        if rescaled:
+            self._apply_scale(self.requested_scale)
+
+        analysis_frame = source
+        if self.analysis_scale != 1.0:
+            size = (max(1, int(width * self.analysis_scale)), max(1, int(height * self.analysis_scale)))
+            if source.shape[1::-1] != size:
+                self._small = cv2.resize(source, size, dst=self._small, interpolation=cv2.INTER_AREA)
+                analysis_frame = self._small
+        if self.grayscale:
+            self._gray = cv2.cvtColor(analysis_frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+            analysis_frame = self._gray
+
+        self._fg_mask = self.bg_subtractor.apply(analysis_frame, self._fg_mask)
+        fg_mask = self._fg_mask
 
         if fg_mask is None:
             print("Error: Foreground mask is None")
-            return False, None, None
+            return False, [], []
 
-        _, fg_mask = cv2.threshold(fg_mask, 250, 255, cv2.THRESH_BINARY)
+        if rescaled:
+            fg_mask[:] = 0
 
-        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_OPEN, self.kernel, iterations=2)
-        fg_mask = cv2.dilate(fg_mask, self.kernel, iterations=4)
+        # Threshold and morphology work in place on the scratch mask
+        cv2.threshold(fg_mask, 250, 255, cv2.THRESH_BINARY, dst=fg_mask)
 
-        contours, _ = cv2.findContours(fg_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        cv2.morphologyEx(fg_mask, cv2.MORPH_OPEN, self.kernel, dst=fg_mask, iterations=2)
+        cv2.dilate(fg_mask, self.kernel, dst=fg_mask, iterations=4)
 
-        motion_detected = False
+        # Foreground pixels, counted at full-frame scale
+        self.foreground_area = cv2.countNonZero(fg_mask) / (self.analysis_scale * self.analysis_scale)
 
+        contours, _ = cv2.findContours(fg_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        boxes = []
         for cnt in contours:
-            if cv2.contourArea(cnt) > self.noise_thresh:
-                motion_detected = True
-                x, y, w, h = cv2.boundingRect(cnt)
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 0, 255), 2)
-                cv2.putText(frame, 'Motion Detected', (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+            if cv2.contourArea(cnt) > self.scaled_noise_thresh:
+                x, y, w, h = self._to_frame_coords(cv2.boundingRect(cnt))
+                boxes.append((x, y, x + w, y + h))
+
+        return bool(boxes), boxes, merge_boxes(boxes, self.roi_merge_gap)
+
+    def draw_motion(self, frame, boxes):
+        """Draw motion boxes onto frame in place; returns frame"""
+        for x1, y1, x2, y2 in boxes:
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
+            cv2.putText(frame, 'Motion Detected', (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        return frame
 
-        fg_mask_colored = cv2.cvtColor(fg_mask, cv2.COLOR_GRAY2BGR)
+    def colored_mask(self, dst=None):
+        """The foreground mask from the last find_motion() at full frame size, as BGR (into dst if given)"""
+        if self._fg_mask is None:
+            return None
+        fg_mask = self._fg_mask
+        if self.analysis_scale != 1.0:
+            self._full_mask = cv2.resize(fg_mask, self.frame_size, dst=self._full_mask,
+                                         interpolation=cv2.INTER_NEAREST)
+            fg_mask = self._full_mask
+        return cv2.cvtColor(fg_mask, cv2.COLOR_GRAY2BGR, dst=dst)
 
-        return motion_detected, fg_mask_colored, frame
+    def _to_frame_coords(self, rect):
+        """Scale an (x, y, w, h) rect from the analysis frame back to the original frame"""
+        if self.analysis_scale == 1.0:
+            return rect
+        inv = 1.0 / self.analysis_scale
+        x, y, w, h = rect
+        return int(x * inv), int(y * inv), int(round(w * inv)), int(round(h * inv))
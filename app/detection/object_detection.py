@@ -1,67 +1,470 @@
-from ultralytics import YOLO
+import ast
+import os
+import shutil
 import cv2
 import numpy as np
-import torch
+from app.detection.motion import merge_boxes
+from app.detection.detections import Detections
+
+def letterbox(image, size):
+    """
+    Resize image to fit a size x size square, padding the rest with grey
+    Returns: (padded image, scale, (pad_x, pad_y))
+    """
+    height, width = image.shape[:2]
+    scale = min(size / height, size / width)
+    new_width, new_height = int(round(width * scale)), int(round(height * scale))
+    pad_x, pad_y = (size - new_width) // 2, (size - new_height) // 2
+
+    padded = np.full((size, size, 3), 114, dtype=np.uint8)
+    padded[pad_y:pad_y + new_height, pad_x:pad_x + new_width] = cv2.resize(
+        image, (new_width, new_height), interpolation=cv2.INTER_LINEAR
+    )
+    return padded, scale, (pad_x, pad_y)
+
+def shelf_pack(sizes, max_side, gap=16):
+    """
+    Pack (width, height) rectangles row by row into the smallest square whose
+    side is a multiple of 32 (the model's stride) and below max_side
+    Returns: (side, [(x, y) per rectangle]), or None if they only fit at max_side or more
+    """
+    if not sizes:
+        return None
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i][1])
+    area = sum((width + gap) * (height + gap) for width, height in sizes)
+    start = max(max(width for width, _ in sizes), max(height for _, height in sizes), int(np.sqrt(area)))
+    for side in range(-(-start // 32) * 32, max_side, 32):
+        positions = [None] * len(sizes)
+        x = y = shelf_height = 0
+        for i in order:
+            width, height = sizes[i]
+            if x + width > side:
+                x, y, shelf_height = 0, y + shelf_height + gap, 0
+            if x + width > side or y + height > side:
+                break
+            positions[i] = (x, y)
+            x += width + gap
+            shelf_height = max(shelf_height, height)
+        else:
+            return side, positions
+    return None
+
+class UltralyticsBackend:
+    """Runs the PyTorch model through ultralytics (the default)"""
+    def __init__(self, weights='yolov8n.pt', imgsz=640, threads=0):
+        from ultralytics import YOLO
+
+        if threads > 0:
+            import torch
+            torch.set_num_threads(threads)
 
-class ObjectDetector:
-    def __init__(self):
         # Load YOLOv8 model
         try:
-            self.model = YOLO('yolov8n.pt')
+            self.model = YOLO(weights)
         except Exception as e:
             print(f"Error loading YOLO model: {str(e)}")
             print("Trying alternative loading method...")
             # Alternative loading method
-            self.model = YOLO('yolov8n.pt', task='detect')
+            self.model = YOLO(weights, task='detect')
+
+        self.imgsz = imgsz
+        self.names = self.model.names
+
+    def predict(self, images, conf, imgsz=None):
+        """
+        Run inference on a list of BGR images, at imgsz if given instead of self.imgsz
+        Returns: one (N, 6) array of [x1, y1, x2, y2, score, class_id] per image
+        """
+        results = self.model(images, conf=conf, imgsz=imgsz or self.imgsz)
+        return [result.boxes.data.cpu().numpy() for result in results]
+
+class ExportedModelBackend:
+    """
+    Shared pre/post-processing for YOLOv8 models exported from ultralytics.
+    The model is exported once (with a dynamic batch axis) and cached in cache_dir;
+    subclasses only load it and run a preprocessed NCHW batch.
+    """
+    export_format = None
+
+    def __init__(self, weights='yolov8n.pt', imgsz=640, threads=0, int8=False, cache_dir='models', iou_threshold=0.7):
+        self.imgsz = imgsz
+        self.threads = threads
+        self.int8 = int8
+        self.iou_threshold = iou_threshold
+        self.max_detections = 300
+
+        stem = os.path.splitext(os.path.basename(weights))[0]
+        suffix = "_int8" if int8 else ""
+        self.model_path = self.load_or_export(weights, os.path.join(cache_dir, f"{stem}_{imgsz}{suffix}"))
+        self.load(self.model_path)
+
+    def load_or_export(self, weights, cache_stem):
+        """Return the cached exported model for weights, exporting it on first run"""
+        raise NotImplementedError
+
+    def load(self, model_path):
+        """Load the exported model and set self.names"""
+        raise NotImplementedError
+
+    def run(self, blob):
+        """Run a preprocessed (N, 3, imgsz, imgsz) float32 batch; returns (N, 4 + classes, anchors)"""
+        raise NotImplementedError
+
+    def export(self, weights, **kwargs):
+        """Export weights with ultralytics; returns the path it wrote"""
+        from ultralytics import YOLO
+
+        print(f"Exporting {weights} to {self.export_format} (imgsz={self.imgsz}), this only happens once...")
+        return YOLO(weights).export(format=self.export_format, imgsz=self.imgsz, dynamic=True, **kwargs)
+
+    def predict(self, images, conf, imgsz=None):
+        """
+        Run inference on a list of BGR images, at imgsz if given instead of self.imgsz
+        Returns: one (N, 6) array of [x1, y1, x2, y2, score, class_id] per image
+        """
+        letterboxed = [letterbox(image, imgsz or self.imgsz) for image in images]
+        blob = cv2.dnn.blobFromImages([padded for padded, _, _ in letterboxed], 1 / 255.0, swapRB=True)
+        outputs = self.run(blob)
+        return [
+            self.postprocess(output, conf, scale, pad, image.shape)
+            for output, (_, scale, pad), image in zip(outputs, letterboxed, images)
+        ]
+
+    def postprocess(self, output, conf, scale, pad, shape):
+        """Decode one image's raw output, apply per-class NMS and undo the letterbox"""
+        predictions = output.T  # (anchors, 4 + classes)
+        class_scores = predictions[:, 4:]
+        class_ids = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(class_ids)), class_ids]
+
+        keep = scores > conf
+        if not keep.any():
+            return np.zeros((0, 6), dtype=np.float32)
+        boxes, scores, class_ids = predictions[keep, :4], scores[keep], class_ids[keep]
+
+        # Centre/size -> top-left/size for NMS
+        xywh = boxes.copy()
+        xywh[:, :2] -= xywh[:, 2:] / 2
+        indices = cv2.dnn.NMSBoxesBatched(xywh.tolist(), scores.tolist(), class_ids.tolist(), conf, self.iou_threshold)
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)[:self.max_detections]
+
+        xyxy = np.concatenate([xywh[indices, :2], xywh[indices, :2] + xywh[indices, 2:]], axis=1)
+        xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - pad[0]) / scale).clip(0, shape[1])
+        xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - pad[1]) / scale).clip(0, shape[0])
+
+        detections = np.concatenate([
+            xyxy, scores[indices, None], class_ids[indices, None].astype(np.float32)
+        ], axis=1).astype(np.float32)
+        # Highest confidence first, like ultralytics
+        return detections[np.argsort(-detections[:, 4])]
+
+class OnnxBackend(ExportedModelBackend):
+    """Runs an exported ONNX model with ONNX Runtime on CPU, optionally INT8-quantized"""
+    export_format = 'onnx'
+
+    def load_or_export(self, weights, cache_stem):
+        model_path = cache_stem + ".onnx"
+        if os.path.exists(model_path):
+            return model_path
+
+        os.makedirs(os.path.dirname(model_path) or '.', exist_ok=True)
+        exported = self.export(weights, simplify=True)
+        if self.int8:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(exported, model_path, weight_type=QuantType.QUInt8)
+            os.remove(exported)
+        else:
+            shutil.move(exported, model_path)
+        return model_path
+
+    def load(self, model_path):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if self.threads > 0:
+            options.intra_op_num_threads = self.threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+        # ultralytics stores the class names in the model metadata
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata['names'])
+
+    def run(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+class OpenVinoBackend(ExportedModelBackend):
+    """Runs an exported OpenVINO IR model on CPU, optionally INT8-quantized"""
+    export_format = 'openvino'
+
+    def load_or_export(self, weights, cache_stem):
+        model_dir = cache_stem + "_openvino"
+        if os.path.isdir(model_dir):
+            return model_dir
+
+        os.makedirs(os.path.dirname(model_dir) or '.', exist_ok=True)
+        # INT8 export calibrates with NNCF on ultralytics' small sample dataset
+        exported = self.export(weights, int8=True, data='coco8.yaml') if self.int8 else self.export(weights)
+        shutil.move(exported, model_dir)
+        return model_dir
+
+    def load(self, model_path):
+        import openvino as ov
+        import yaml
+
+        core = ov.Core()
+        xml_path = next(os.path.join(model_path, name) for name in os.listdir(model_path) if name.endswith('.xml'))
+        config = {'INFERENCE_NUM_THREADS': self.threads} if self.threads > 0 else {}
+        self.model = core.compile_model(core.read_model(xml_path), 'CPU', config)
+        self.output = self.model.output(0)
+
+        # ultralytics writes the class names next to the IR files
+        with open(os.path.join(model_path, 'metadata.yaml')) as f:
+            self.names = yaml.safe_load(f)['names']
+
+    def run(self, blob):
+        return self.model(blob)[self.output]
+
+BACKENDS = {
+    'torch': UltralyticsBackend,
+    'onnx': OnnxBackend,
+    'openvino': OpenVinoBackend,
+}
+
+def create_backend(name='torch', **kwargs):
+    """Create an inference backend by name: 'torch', 'onnx' or 'openvino'"""
+    if name not in BACKENDS:
+        print(f"Unknown detection backend '{name}', falling back to 'torch'")
+        name = 'torch'
+    if name == 'torch':
+        # The PyTorch path has no export step
+        kwargs.pop('int8', None)
+        kwargs.pop('cache_dir', None)
+    return BACKENDS[name](**kwargs)
+
+class ObjectDetector:
+    def __init__(self, roi_mode=False, roi_padding=32, roi_min_size=160, roi_max_coverage=0.6,
+                 backend='torch', imgsz=640, threads=0, int8=False, cache_dir='models', class_filter=None):
+        # Load YOLOv8 model through the configured backend
+        self.backend = create_backend(backend, imgsz=imgsz, threads=threads, int8=int8, cache_dir=cache_dir)
         
         self.conf_threshold = 0.5  # Confidence threshold
-        self.classes = self.model.names  # Get class names
+        self.classes = self.backend.names  # Get class names
+
+        # Optional list of class names to keep; everything else is dropped
+        self.class_filter_ids = None
+        if class_filter:
+            self.class_filter_ids = np.array([i for i, name in self.classes.items() if name in class_filter])
+
+        # Label text sizes per class name, measured once with a fixed-width confidence
+        self.label_sizes = {}
+
+        # ROI mode: run on padded crops around motion instead of the whole frame
+        self.roi_mode = roi_mode
+        self.roi_padding = roi_padding
+        self.roi_min_size = roi_min_size
+        self.roi_max_coverage = roi_max_coverage
+
+    @property
+    def imgsz(self):
+        """Model input size the backend letterboxes images to"""
+        return self.backend.imgsz
+
+    def set_imgsz(self, imgsz):
+        """
+        Change the model input size from the next batch on (a multiple of 32)
+        Exported models have dynamic input shapes, so every backend can switch without reloading.
+        """
+        self.backend.imgsz = imgsz
+
+    def _roi_regions(self, frame, rois):
+        """
+        Turn motion ROIs into padded, merged crop regions within the frame
+        Returns: list of (x1, y1, x2, y2), or None to run on the full frame
+        """
+        if not self.roi_mode or not rois:
+            return None
+
+        height, width = frame.shape[:2]
+        regions = []
+        for x1, y1, x2, y2 in rois:
+            x1, y1 = x1 - self.roi_padding, y1 - self.roi_padding
+            x2, y2 = x2 + self.roi_padding, y2 + self.roi_padding
+
+            # Grow tiny regions so the model still has some context
+            grow_x = max(0, self.roi_min_size - (x2 - x1))
+            grow_y = max(0, self.roi_min_size - (y2 - y1))
+            x1, x2 = x1 - grow_x // 2, x2 + grow_x - grow_x // 2
+            y1, y2 = y1 - grow_y // 2, y2 + grow_y - grow_y // 2
+
+            # Shift regions that hang off an edge back inside the frame
+            shift_x = max(0, -x1) - max(0, x2 - width)
+            shift_y = max(0, -y1) - max(0, y2 - height)
+            x1, x2, y1, y2 = x1 + shift_x, x2 + shift_x, y1 + shift_y, y2 + shift_y
+
+            regions.append((max(0, x1), max(0, y1), min(width, x2), min(height, y2)))
+
+        # Padding can make neighbouring regions overlap; merge so no object is seen twice
+        regions = merge_boxes(regions)
+
+        # Crops covering most of the frame would pack into a canvas nearly as large as the frame's input
+        covered = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+        if covered > self.roi_max_coverage * width * height:
+            return None
+
+        return regions
+
+    def _pack_regions(self, frame, regions):
+        """
+        Paste the crop regions into one square canvas, each resized by the scale the
+        whole frame would be letterboxed with, so objects keep the size the model
+        would see them at. The canvas side is a multiple of 32 below imgsz, and the
+        model runs at that side: cost follows the input area, not the crop count.
+        Returns: (canvas, [(x, y, scale_x, scale_y, region) per crop]), or None if
+        the crops only fit in a canvas as large as the frame's own input
+        """
+        height, width = frame.shape[:2]
+        scale = min(self.imgsz / height, self.imgsz / width)
+        sizes = [(max(1, round((x2 - x1) * scale)), max(1, round((y2 - y1) * scale))) for x1, y1, x2, y2 in regions]
+        packed = shelf_pack(sizes, self.imgsz)
+        if packed is None:
+            return None
+        side, positions = packed
+
+        canvas = np.full((side, side, 3), 114, dtype=np.uint8)
+        placements = []
+        for (x, y), (crop_width, crop_height), region in zip(positions, sizes, regions):
+            x1, y1, x2, y2 = region
+            canvas[y:y + crop_height, x:x + crop_width] = cv2.resize(
+                frame[y1:y2, x1:x2], (crop_width, crop_height), interpolation=cv2.INTER_LINEAR
+            )
+            placements.append((x, y, crop_width / (x2 - x1), crop_height / (y2 - y1), region))
+        return canvas, placements
+
+    @staticmethod
+    def _unpack_rows(rows, placements):
+        """Map canvas boxes back into frame space by the crop their centre falls in"""
+        centre_x = (rows[:, 0] + rows[:, 2]) / 2
+        centre_y = (rows[:, 1] + rows[:, 3]) / 2
+        unpacked = []
+        for x, y, scale_x, scale_y, (x1, y1, x2, y2) in placements:
+            inside = ((centre_x >= x) & (centre_x < x + (x2 - x1) * scale_x)
+                      & (centre_y >= y) & (centre_y < y + (y2 - y1) * scale_y))
+            crop_rows = rows[inside].copy()
+            crop_rows[:, [0, 2]] = ((crop_rows[:, [0, 2]] - x) / scale_x + x1).clip(x1, x2)
+            crop_rows[:, [1, 3]] = ((crop_rows[:, [1, 3]] - y) / scale_y + y1).clip(y1, y2)
+            unpacked.append(crop_rows)
+        return np.concatenate(unpacked) if unpacked else rows[:0]
 
-    def detect(self, frame):
+    def detect(self, frame, rois=None, dst=None):
         """
         Detect objects in the frame using YOLOv8
+        In ROI mode, only the padded motion regions in rois are searched, packed
+        into one smaller model input, and boxes are mapped back to the frame.
+        The annotated frame is written to dst if given, otherwise to a new copy.
         Returns: frame with bounding boxes and labels
         """
         if frame is None:
             return None, []
 
+        return self.detect_batch([frame], [rois], None if dst is None else [dst])[0]
+
+    def detect_batch(self, frames, rois_list=None, dsts=None, draw=True):
+        """
+        Detect objects in several frames (e.g. one per camera) with a single model call
+        With draw=False no annotated frames are made, for callers that draw
+        their own overlays (e.g. after tracking).
+        Returns: list of (annotated frame or None, detections), one per input frame
+        """
+        if rois_list is None:
+            rois_list = [None] * len(frames)
+        if dsts is None:
+            dsts = [None] * len(frames)
+
         try:
-            # Run YOLOv8 inference
-            results = self.model(frame, conf=self.conf_threshold)[0]
-            
-            # Create a copy of the frame for drawing
-            annotated_frame = frame.copy()
-            
-            # List to store detected objects
-            detected_objects = []
-
-            # Process detections
-            for result in results.boxes.data.tolist():
-                x1, y1, x2, y2, score, class_id = result
-                
-                # Convert coordinates to integers
-                x1, y1, x2, y2 = map(int, [x1, y1, x2, y2])
-                
-                # Get class name
-                class_name = self.classes[int(class_id)]
-                
-                # Add to detected objects list
-                detected_objects.append({
-                    'class': class_name,
-                    'confidence': score,
-                    'bbox': (x1, y1, x2, y2)
-                })
-                
-                # Draw bounding box
-                cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                
-                # Add label
-                label = f'{class_name} {score:.2f}'
-                (label_width, label_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
-                cv2.rectangle(annotated_frame, (x1, y1 - label_height - 10), (x1 + label_width, y1), (0, 255, 0), -1)
-                cv2.putText(annotated_frame, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
-
-            return annotated_frame, detected_objects
+            # Gather every image to run by model input size, remembering which frame
+            # it came from and, for packed ROI canvases, where each crop went
+            groups = {}
+            for index, (frame, rois) in enumerate(zip(frames, rois_list)):
+                regions = self._roi_regions(frame, rois)
+                packed = self._pack_regions(frame, regions) if regions is not None else None
+                if packed is None:
+                    groups.setdefault(self.imgsz, []).append((frame, index, None))
+                else:
+                    canvas, placements = packed
+                    groups.setdefault(len(canvas), []).append((canvas, index, placements))
+
+            # Rows of [x1, y1, x2, y2, score, class_id] per frame
+            frame_rows = [[] for _ in frames]
+
+            # Run YOLOv8 inference, one model call per input size
+            for imgsz, entries in groups.items():
+                results = self.backend.predict([image for image, _, _ in entries], self.conf_threshold, imgsz)
+
+                # Process detections as whole arrays: threshold, filter classes and
+                # map canvas boxes into full-frame space
+                for (_, index, placements), rows in zip(entries, results):
+                    keep = rows[:, 4] >= self.conf_threshold
+                    if self.class_filter_ids is not None:
+                        keep &= np.isin(rows[:, 5], self.class_filter_ids)
+                    rows = rows[keep]
+                    if placements is not None:
+                        rows = self._unpack_rows(rows, placements)
+                    frame_rows[index].append(rows)
+
+            detected_objects = [
+                Detections.from_rows(np.concatenate(rows) if rows else np.zeros((0, 6), np.float32), self.classes)
+                for rows in frame_rows
+            ]
+
+            if not draw:
+                return [(None, detections) for detections in detected_objects]
+
+            # Draw on copies of the frames
+            return [
+                (self.draw_detections(self._copy_frame(frame, dst), detections), detections)
+                for frame, dst, detections in zip(frames, dsts, detected_objects)
+            ]
         except Exception as e:
             print(f"Error during object detection: {str(e)}")
-            return frame, []  # Return original frame and empty detections on error 
\ No newline at end of file
+            # Return unannotated frames and empty detections on error
+            return [
+                (self._copy_frame(frame, dst) if draw else None, Detections(names=self.classes))
+                for frame, dst in zip(frames, dsts)
+            ]
+
+    def _copy_frame(self, frame, dst=None):
+        """Copy frame into dst if given, otherwise into a new array"""
+        if dst is None:
+            return frame.copy()
+        np.copyto(dst, frame)
+        return dst
+
+    def label_size(self, class_name, track_id=-1):
+        """Size of a '<class> [#<track>] 0.00' label, cached per class name and track id length"""
+        key = (class_name, len(str(track_id)) if track_id >= 0 else 0)
+        size = self.label_sizes.get(key)
+        if size is None:
+            track = f' #{"0" * key[1]}' if track_id >= 0 else ''
+            (width, height), _ = cv2.getTextSize(f'{class_name}{track} 0.00', cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+            size = self.label_sizes[key] = (width, height)
+        return size
+
+    def draw_detections(self, frame, detections):
+        """
+        Draw bounding boxes and labels for detections onto frame in place
+        Returns: the annotated frame
+        """
+        for x1, y1, x2, y2, confidence, class_id, track_id in detections.rows():
+            class_name = detections.class_name(class_id)
+
+            # Draw bounding box
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+
+            # Add label
+            label = f'{class_name} #{track_id} {confidence:.2f}' if track_id >= 0 else f'{class_name} {confidence:.2f}'
+            label_width, label_height = self.label_size(class_name, track_id)
+            cv2.rectangle(frame, (x1, y1 - label_height - 10), (x1 + label_width, y1), (0, 255, 0), -1)
+            cv2.putText(frame, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+
+        return frame
@@ -0,0 +1,373 @@
+import atexit
+import multiprocessing as mp
+import multiprocessing.connection
+import os
+import queue
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+import numpy as np
+from app.detection.detections import Detections, DETECTION_DTYPE
+from app.detection.object_detection import ObjectDetector
+
+def run_worker(index, requests, results, detector_kwargs):
+    """
+    Worker process: load an ObjectDetector and run the batches sent to it
+    Frames are read straight out of the shared memory named in each request;
+    only the small detection arrays travel back through the results pipe.
+    """
+    try:
+        detector = ObjectDetector(**detector_kwargs)
+    except Exception as e:
+        results.send(('error', index, str(e)))
+        return
+    results.send(('ready', index, detector.classes))
+
+    # Shared memory blocks by slot, attached on first use
+    attached = {}
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        ticket, slot, shm_name, layout, rois_list, imgsz = request
+        if imgsz != detector.imgsz:
+            detector.set_imgsz(imgsz)
+
+        shm = attached.get(slot)
+        if shm is None or shm.name != shm_name:
+            # The parent grew this slot for a bigger batch
+            if shm is not None:
+                shm.close()
+            shm = attached[slot] = shared_memory.SharedMemory(name=shm_name)
+        frames = [
+            np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+            for offset, shape in layout
+        ]
+
+        start = time.time()
+        batch = detector.detect_batch(frames, rois_list, draw=False)
+        seconds = time.time() - start
+        # Drop the views before the buffer can be closed
+        del frames
+        results.send(('done', index, (ticket, seconds, [detections.array for _, detections in batch])))
+
+    for shm in attached.values():
+        shm.close()
+
+class ProcessPoolDetector(ObjectDetector):
+    """
+    Runs object detection in a pool of worker processes, each with its own
+    model, so Python-side detection work doesn't contend with the capture,
+    motion and streaming threads for the GIL, and throughput scales with cores.
+
+    submit() copies a batch of frames into shared memory (slots_per_worker
+    buffers per worker, reused; no pickling of arrays) and hands it to the
+    workers round-robin, blocking while that worker's buffers are all busy.
+    results() yields the detections in submission order, whichever worker
+    finishes first. Drawing is inherited from ObjectDetector and happens in
+    this process.
+
+    Each worker loads its own copy of the model. Without an explicit thread
+    count, the cores are split evenly between the workers.
+
+    A worker that dies is restarted after a backoff that doubles with every
+    consecutive failure (a worker that gets its model loaded starts over).
+    After max_restarts failures in a row the pool gives up: it is marked
+    failed, on_failure is called with the reason, and every batch from then
+    on gets empty detections.
+    """
+    def __init__(self, workers=2, slots_per_worker=2, roi_mode=False, roi_padding=32, threads=0,
+                 class_filter=None, max_restarts=5, max_backoff=60.0, **detector_kwargs):
+        self.workers = workers
+        self.closed = False
+        self.failed = False
+        # Called with the reason when the pool gives up on a worker
+        self.on_failure = None
+        self.max_restarts = max_restarts
+        self.max_backoff = max_backoff
+        # Consecutive failures per worker, and when a dead worker is due to be restarted
+        self.worker_failures = [0] * workers
+        self.restart_at = [None] * workers
+        if threads <= 0:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+        detector_kwargs.update(roi_mode=roi_mode, roi_padding=roi_padding, threads=threads,
+                               class_filter=class_filter)
+
+        # Workers are spawned rather than forked: this process already runs threads
+        self.mp_context = mp.get_context('spawn')
+        self.detector_kwargs = detector_kwargs
+        self.request_queues = [self.mp_context.Queue() for _ in range(workers)]
+        # One results pipe per worker, replaced on restart: a worker killed mid-send
+        # can only break its own pipe, not wedge a queue lock shared with the others
+        self.result_readers = [None] * workers
+        self.processes = []
+
+        # The first worker starts alone, so an exported model is written to the
+        # cache once before the others load it
+        names = None
+        for group in (range(1), range(1, workers)):
+            for i in group:
+                self.processes.append(self._start_worker(i))
+            for i in group:
+                try:
+                    kind, index, payload = self.result_readers[i].recv()
+                except EOFError:
+                    kind, index, payload = 'error', i, f"exited with code {self.processes[i].exitcode}"
+                if kind == 'error':
+                    self.close()
+                    raise RuntimeError(f"Detection worker {index} failed to start: {payload}")
+                names = payload
+
+        # Parent-side state ObjectDetector's drawing (and callers) rely on
+        self.backend = None
+        self._imgsz = detector_kwargs.get('imgsz', 640)
+        self.classes = names
+        self.conf_threshold = 0.5
+        self.class_filter_ids = None
+        self.label_sizes = {}
+        self.roi_mode = roi_mode
+        self.roi_padding = roi_padding
+
+        # Shared memory per (worker, slot), grown when a batch doesn't fit
+        self.slots = [[None] * slots_per_worker for _ in range(workers)]
+        self.free_slots = []
+        for _ in range(workers):
+            free = queue.Queue()
+            for slot in range(slots_per_worker):
+                free.put(slot)
+            self.free_slots.append(free)
+        # (ticket, slot) per worker, in the order the worker will answer them
+        self.in_flight = [deque() for _ in range(workers)]
+
+        # Completed tickets waiting to be delivered in order
+        self.condition = threading.Condition()
+        self.next_ticket = 0
+        # Workers take turns by batch actually sent, so empty batches don't skip one
+        self.next_worker = 0
+        self.next_delivery = 0
+        self.contexts = {}
+        self.completed = {}
+
+        threading.Thread(target=self._collect_results, daemon=True).start()
+        atexit.register(self.close)
+
+    @property
+    def imgsz(self):
+        return self._imgsz
+
+    def set_imgsz(self, imgsz):
+        """Change the model input size; sent along with every batch, so it applies from the next submit()"""
+        self._imgsz = imgsz
+
+    def _start_worker(self, index):
+        """Start worker index with a new results pipe"""
+        reader, writer = self.mp_context.Pipe(duplex=False)
+        process = self.mp_context.Process(
+            target=run_worker, args=(index, self.request_queues[index], writer, self.detector_kwargs),
+            name=f"detector-{index}", daemon=True,
+        )
+        process.start()
+        # Only the worker writes, so its exit shows up here as EOF
+        writer.close()
+        self.result_readers[index] = reader
+        return process
+
+    def submit(self, frames, rois_list=None, context=None):
+        """
+        Queue a batch of frames for detection; context is handed back with its results
+        The frames are copied before this returns. An empty batch is delivered in
+        order like any other, without going to a worker; so is every batch once
+        the pool has failed, with empty detections.
+        """
+        with self.condition:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            self.contexts[ticket] = (context, len(frames))
+            if not frames or self.failed:
+                self.completed[ticket] = (0.0, [] if not frames else None)
+                self.condition.notify_all()
+                return ticket
+            worker = self.next_worker
+            self.next_worker = (worker + 1) % self.workers
+
+        slot = self.free_slots[worker].get()
+        shm, layout = self._copy_to_slot(worker, slot, frames)
+        with self.condition:
+            if self.failed:
+                # Gave up while this batch was being copied
+                self.completed[ticket] = (0.0, None)
+                self.condition.notify_all()
+                self.free_slots[worker].put(slot)
+                return ticket
+            # Under the lock, so a worker restart can't slip in between the two
+            self.in_flight[worker].append((ticket, slot))
+            self.request_queues[worker].put((
+                ticket, slot, shm.name, layout,
+                [None] * len(frames) if rois_list is None else list(rois_list),
+                self._imgsz,
+            ))
+        return ticket
+
+    def _copy_to_slot(self, worker, slot, frames):
+        """Copy frames back to back into a worker's shared memory slot"""
+        layout, offset = [], 0
+        for frame in frames:
+            layout.append((offset, frame.shape))
+            offset += frame.nbytes
+
+        shm = self.slots[worker][slot]
+        if shm is None or shm.size < offset:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = self.slots[worker][slot] = shared_memory.SharedMemory(create=True, size=offset)
+
+        for frame, (start, shape) in zip(frames, layout):
+            np.copyto(np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=start), frame)
+        return shm, layout
+
+    def _collect_results(self):
+        """Take worker results off their pipes, free their slots and restart workers that died"""
+        last_check = time.time()
+        while not self.closed:
+            if time.time() - last_check > 1.0:
+                self._check_workers()
+                last_check = time.time()
+            readers = [reader for reader in self.result_readers if reader is not None]
+            for reader in mp.connection.wait(readers, timeout=1.0):
+                try:
+                    message = reader.recv()
+                except (EOFError, OSError):
+                    # Its worker exited; _check_workers() restarts it with a new pipe
+                    index = self.result_readers.index(reader)
+                    self.result_readers[index] = None
+                    reader.close()
+                    continue
+                self._handle_result(*message)
+
+    def _handle_result(self, kind, worker, payload):
+        """Act on one message from a worker"""
+        if kind == 'ready':
+            self.worker_failures[worker] = 0
+            return
+        if kind == 'error':
+            print(f"Detection worker {worker} failed to start: {payload}")
+            return
+
+        ticket, seconds, arrays = payload
+        with self.condition:
+            slot = next((slot for pending, slot in self.in_flight[worker] if pending == ticket), None)
+            if slot is None:
+                # Already given up on when its worker was restarted
+                return
+            self.in_flight[worker].remove((ticket, slot))
+            self.completed[ticket] = (seconds, [Detections(array, self.classes) for array in arrays])
+            self.condition.notify_all()
+        self.free_slots[worker].put(slot)
+
+    def _check_workers(self):
+        """
+        Fail the batches of a crashed worker with empty detections and schedule a
+        new one after a backoff; give up on the pool after max_restarts in a row
+        """
+        now = time.time()
+        for worker, process in enumerate(self.processes):
+            if process is None:
+                # Dead, waiting out its backoff (or given up on)
+                if self.restart_at[worker] is not None and now >= self.restart_at[worker]:
+                    self.restart_at[worker] = None
+                    self.processes[worker] = self._start_worker(worker)
+                continue
+            if process.is_alive() or process.exitcode is None:
+                continue
+
+            self.worker_failures[worker] += 1
+            failures = self.worker_failures[worker]
+            give_up = failures > self.max_restarts
+            self.processes[worker] = None
+            with self.condition:
+                self.failed = self.failed or give_up
+                lost = list(self.in_flight[worker])
+                self.in_flight[worker].clear()
+                for ticket, _ in lost:
+                    self.completed[ticket] = (0.0, None)
+                self.condition.notify_all()
+                # A fresh queue, so the new worker doesn't pick up the lost requests
+                self.request_queues[worker] = self.mp_context.Queue()
+            for _, slot in lost:
+                self.free_slots[worker].put(slot)
+
+            if give_up:
+                reason = f"detection worker {worker} died {failures} times in a row (exit code {process.exitcode})"
+                print(f"Giving up on the detection pool: {reason}")
+                if self.on_failure is not None:
+                    self.on_failure(reason)
+                continue
+            delay = min(self.max_backoff, 2 ** (failures - 1))
+            print(f"Detection worker {worker} exited with code {process.exitcode}, restarting it in {delay:g}s")
+            self.restart_at[worker] = now + delay
+
+    def results(self):
+        """
+        Yield (context, list of Detections, inference seconds) for every submitted batch,
+        in submission order. A batch lost to a crashed worker yields empty Detections.
+        """
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.next_delivery in self.completed)
+                ticket = self.next_delivery
+                self.next_delivery += 1
+                seconds, detections = self.completed.pop(ticket)
+                context, frame_count = self.contexts.pop(ticket)
+            if detections is None:
+                detections = [Detections(np.zeros(0, dtype=DETECTION_DTYPE), self.classes)
+                              for _ in range(frame_count)]
+            yield context, detections, seconds
+
+    def in_flight_count(self):
+        """Batches submitted but not yet delivered"""
+        with self.condition:
+            return self.next_ticket - self.next_delivery
+
+    def detect_batch(self, frames, rois_list=None, dsts=None, draw=True):
+        """
+        Synchronous ObjectDetector.detect_batch() through the pool
+        Only for callers that don't also use submit()/results().
+        """
+        self.submit(frames, rois_list)
+        _, detected_objects, _ = next(self.results())
+        if not draw:
+            return [(None, detections) for detections in detected_objects]
+        if dsts is None:
+            dsts = [None] * len(frames)
+        return [
+            (self.draw_detections(self._copy_frame(frame, dst), detections), detections)
+            for frame, dst, detections in zip(frames, dsts, detected_objects)
+        ]
+
+    def close(self):
+        """Stop the workers and free the shared memory"""
+        if self.closed:
+            return
+        self.closed = True
+        for requests in self.request_queues:
+            try:
+                requests.put(None)
+            except (ValueError, OSError):
+                pass
+        for process in self.processes:
+            if process is None:
+                continue
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        for reader in self.result_readers:
+            if reader is not None:
+                reader.close()
+        for slots in getattr(self, 'slots', []):
+            for shm in slots:
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+            slots[:] = [None] * len(slots)
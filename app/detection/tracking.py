@@ -0,0 +1,184 @@
+import numpy as np
+from app.detection.detections import Detections, DETECTION_DTYPE
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU of every box in boxes_a (N, 4) against every box in boxes_b (M, 4)"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)))
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    width = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    height = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    intersection = width * height
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0)
+
+class KalmanBoxTrack:
+    """
+    One tracked object: a constant-velocity Kalman filter over the box centre,
+    area and aspect ratio, as in SORT. predict() advances it by one frame.
+    """
+    # State: [cx, cy, area, aspect, vx, vy, v_area]; aspect is assumed constant
+    F = np.eye(7)
+    F[0, 4] = F[1, 5] = F[2, 6] = 1
+    H = np.eye(4, 7)
+    Q = np.diag([1, 1, 1, 1, 0.01, 0.01, 0.0001])
+    R = np.diag([1, 1, 10, 10])
+
+    def __init__(self, track_id, box, confidence, class_id):
+        self.track_id = track_id
+        self.x = np.zeros(7)
+        self.x[:4] = self.to_measurement(box)
+        # Velocities start out unknown
+        self.P = np.diag([10, 10, 10, 10, 10000, 10000, 10000]).astype(float)
+        self.confidence = confidence
+        self.class_id = class_id
+        self.hits = 1
+        self.misses = 0
+        # Frames predicted since the last matched detection
+        self.frames_since_update = 0
+        # Set once the track has been confirmed and reported as an event
+        self.reported = False
+
+    @staticmethod
+    def to_measurement(box):
+        x1, y1, x2, y2 = box
+        width, height = x2 - x1, y2 - y1
+        return np.array([x1 + width / 2, y1 + height / 2, width * height, width / max(height, 1e-6)])
+
+    def box(self):
+        """Current box estimate as (x1, y1, x2, y2)"""
+        cx, cy, area, aspect = self.x[:4]
+        width = np.sqrt(max(area * aspect, 0))
+        height = area / width if width > 0 else 0
+        return cx - width / 2, cy - height / 2, cx + width / 2, cy + height / 2
+
+    def predict(self):
+        if self.x[2] + self.x[6] <= 0:
+            # Don't let the area shrink below zero
+            self.x[6] = 0
+        self.x = self.F @ self.x
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        self.frames_since_update += 1
+
+    def update(self, box, confidence, class_id):
+        """Correct the prediction with a matched detection"""
+        y = self.to_measurement(box) - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(7) - K @ self.H) @ self.P
+        self.confidence = confidence
+        self.class_id = class_id
+        self.hits += 1
+        self.misses = 0
+        self.frames_since_update = 0
+
+class Tracker:
+    """
+    SORT-style multi-object tracker for one camera.
+
+    update() takes the Detections from a model run, matches them to the
+    predicted tracks by IoU (greedily, same class only) and returns the
+    tracked Detections with stable track_ids, plus the tracks confirmed by
+    this run, which are reported once each as new events.
+
+    On frames where detection is skipped, predict() moves every track along
+    its estimated velocity, so overlays stay smooth when the model only runs
+    on every Nth frame. Each frame should see exactly one predict() or update().
+    A track coasting without a match is hidden max_coast_frames frames past the
+    detection stride and dropped max_age frames past it, so an object that has
+    left doesn't leave a box drifting on while the gate keeps the model from running.
+    """
+    def __init__(self, iou_threshold=0.3, min_hits=2, max_misses=3, max_coast_frames=10, max_age=30, stride=1):
+        self.iou_threshold = iou_threshold
+        # Model runs a track must be matched in before it counts as an event
+        self.min_hits = min_hits
+        # Model runs a track may go unmatched before it is dropped
+        self.max_misses = max_misses
+        # Frames a track is still shown, and kept, without a matched detection beyond
+        # the stride (the frames between model runs, kept in step with the gate's)
+        self.max_coast_frames = max_coast_frames
+        self.max_age = max_age
+        self.stride = stride
+        self.tracks = []
+        self.next_id = 1
+        self.names = {}
+
+    def predict(self):
+        """Advance every track by one frame; returns the predicted Detections"""
+        for track in self.tracks:
+            track.predict()
+        self._prune()
+        return self._detections(self._visible())
+
+    def update(self, detections):
+        """
+        Match a model run's detections to the tracks
+        Returns: (tracked Detections, Detections of newly confirmed tracks)
+        """
+        self.names = detections.names or self.names
+        for track in self.tracks:
+            track.predict()
+
+        array = detections.array
+        boxes = detections.boxes()
+        track_boxes = np.array([track.box() for track in self.tracks]).reshape(-1, 4)
+        ious = iou_matrix(track_boxes, boxes)
+        if ious.size:
+            # Only match boxes of the same class
+            same_class = np.array([track.class_id for track in self.tracks])[:, None] == array['class_id'][None, :]
+            ious = np.where(same_class, ious, 0)
+
+        matched_tracks, matched_detections = set(), set()
+        while ious.size:
+            t, d = np.unravel_index(np.argmax(ious), ious.shape)
+            if ious[t, d] < self.iou_threshold:
+                break
+            self.tracks[t].update(boxes[d], float(array['confidence'][d]), int(array['class_id'][d]))
+            matched_tracks.add(t)
+            matched_detections.add(d)
+            ious[t, :] = 0
+            ious[:, d] = 0
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+        self._prune()
+
+        for d in range(len(array)):
+            if d not in matched_detections:
+                self.tracks.append(KalmanBoxTrack(
+                    self.next_id, boxes[d], float(array['confidence'][d]), int(array['class_id'][d])
+                ))
+                self.next_id += 1
+
+        confirmed = []
+        for track in self.tracks:
+            if not track.reported and track.hits >= self.min_hits:
+                track.reported = True
+                confirmed.append(track)
+
+        # Tracks that missed this run are still shown at their predicted position for a while
+        return self._detections(self._visible()), self._detections(confirmed)
+
+    def _prune(self):
+        """Drop tracks unmatched for too many model runs or frames"""
+        self.tracks = [
+            track for track in self.tracks
+            if track.misses <= self.max_misses and track.frames_since_update <= self.stride + self.max_age
+        ]
+
+    def _visible(self):
+        """Tracks recent enough to show"""
+        return [track for track in self.tracks if track.frames_since_update <= self.stride + self.max_coast_frames]
+
+    def _detections(self, tracks):
+        """Build Detections from tracks"""
+        array = np.empty(len(tracks), dtype=DETECTION_DTYPE)
+        for i, track in enumerate(tracks):
+            x1, y1, x2, y2 = track.box()
+            array[i] = (x1, y1, x2, y2, track.confidence, track.class_id, track.track_id)
+        return Detections(array, self.names)
@@ -0,0 +1,126 @@
+import math
+import time
+from collections import deque
+import numpy as np
+
+class RollingMean:
+    """
+    Mean of the last `size` samples. add() is a bare bounded-deque append and
+    the averaging happens in mean(), which is read about once a second rather
+    than per frame. Meant for a single writer thread; copying the deque is
+    atomic, so readers need no lock.
+    """
+    def __init__(self, size=100):
+        self.size = size
+        self.values = deque(maxlen=size)
+        # Bound here, so add() costs one call
+        self.add = self.values.append
+
+    def mean(self, default=0.0):
+        values = list(self.values)
+        return sum(values) / len(values) if values else default
+
+    def __len__(self):
+        return len(self.values)
+
+class QuantileSketch:
+    """
+    Log-bucketed quantile sketch (DDSketch style): every value lands in a bucket
+    whose bounds are within `relative_accuracy` of it, so p50/p95/p99 are
+    accurate to ~1% without keeping samples around.
+
+    add() only appends the sample to a pending list; pending samples are
+    bucketed together with NumPy once fold_size of them have built up, when
+    the window rotates, or (without changing anything) by a reader. Samples
+    are kept in two generations that rotate every `window_seconds`, checked
+    on every add(), so quantiles cover the last one to two windows rather
+    than all time, however rarely samples come in. count and sum are
+    cumulative, for exporters, and also totalled when samples are folded.
+    """
+    def __init__(self, relative_accuracy=0.01, min_value=1e-6, window_seconds=60.0, fold_size=512):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.inv_log_gamma = 1 / math.log(self.gamma)
+        self.min_index = math.ceil(math.log(min_value) * self.inv_log_gamma)
+        self.window_seconds = window_seconds
+        self.fold_size = fold_size
+        # Samples not bucketed yet, then sparse {bucket index: count}; only a few
+        # dozen buckets are ever occupied
+        self.pending = []
+        self.current = {}
+        self.previous = {}
+        self.rotate_at = time.monotonic() + window_seconds
+        self.folded_count = 0
+        self.folded_sum = 0.0
+
+    @property
+    def count(self):
+        return self.folded_count + len(self.pending)
+
+    @property
+    def sum(self):
+        return self.folded_sum + sum(list(self.pending))
+
+    def add(self, value):
+        if time.monotonic() > self.rotate_at:
+            self._rotate()
+        pending = self.pending
+        pending.append(value)
+        if len(pending) >= self.fold_size:
+            self._fold()
+
+    def _fold(self):
+        """Bucket the pending samples into the current window (writer only)"""
+        pending, self.pending = self.pending, []
+        self.folded_count += len(pending)
+        self.folded_sum += sum(pending)
+        self.current = self._merge(dict(self.current), self.bucket_counts(pending))
+
+    def _rotate(self):
+        """Start a new window (writer only)"""
+        self._fold()
+        now = time.monotonic()
+        # After a whole window without samples, the current ones are too old to keep
+        self.previous = self.current if now <= self.rotate_at + self.window_seconds else {}
+        self.current = {}
+        self.rotate_at = now + self.window_seconds
+
+    def bucket_counts(self, values):
+        """{bucket index: count} for a list of values"""
+        if not values:
+            return {}
+        values = np.asarray(values, dtype=np.float64)
+        indices = np.full(len(values), self.min_index, dtype=np.int64)
+        positive = values > 0
+        indices[positive] = np.ceil(np.log(values[positive]) * self.inv_log_gamma)
+        indices, counts = np.unique(np.maximum(indices, self.min_index), return_counts=True)
+        return dict(zip(indices.tolist(), counts.tolist()))
+
+    @staticmethod
+    def _merge(counts, more):
+        for index, bucket_count in more.items():
+            counts[index] = counts.get(index, 0) + bucket_count
+        return counts
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)):
+        """Return {q: value} for the requested quantiles (0 when empty)"""
+        counts = self._merge(dict(self.previous), self.current)
+        self._merge(counts, self.bucket_counts(list(self.pending)))
+        total = sum(counts.values())
+        if total == 0:
+            return {q: 0.0 for q in qs}
+
+        # Walk the buckets in order until each quantile's rank is reached
+        pending = [(q * (total - 1), q) for q in sorted(qs)]
+        results = {}
+        seen = 0
+        for index in sorted(counts):
+            seen += counts[index]
+            while pending and seen > pending[0][0]:
+                results[pending.pop(0)[1]] = self.bucket_value(index)
+            if not pending:
+                break
+        return results
+
+    def bucket_value(self, index):
+        """Representative value of a bucket, within relative_accuracy of every value in it"""
+        return 2 * self.gamma ** index / (self.gamma + 1)
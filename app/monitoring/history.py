@@ -0,0 +1,167 @@
+import os
+import re
+import threading
+import numpy as np
+
+# Columns of the history, in storage order: the /get_metrics values worth charting
+HISTORY_METRICS = (
+    'fps',
+    'motion_latency', 'motion_latency_p95',
+    'object_latency', 'object_latency_p95',
+    'motion_accuracy', 'object_map', 'false_positive_reduction',
+    'uptime', 'skipped_inferences', 'reconnects',
+    'degradation_level', 'detection_imgsz', 'motion_analysis_scale',
+)
+# Cumulative counters, stored as increments per sample and summed when downsampling
+COUNTER_METRICS = {'skipped_inferences', 'reconnects'}
+
+# (name, seconds per point, points kept): an hour at 1s, a day at 1m, a month at 1h
+RESOLUTIONS = (
+    ('1s', 1, 3600),
+    ('1m', 60, 1440),
+    ('1h', 3600, 720),
+)
+
+class TimeSeriesRing:
+    """
+    Fixed-size ring of (time, values) rows, one float32 value per metric.
+    With a path, the ring lives in a memory-mapped .npy file, so the history
+    survives restarts; a file of the wrong shape is started over.
+    """
+    def __init__(self, capacity, columns, path=None):
+        self.capacity = capacity
+        dtype = np.dtype([('time', 'f8'), ('values', 'f4', (columns,))])
+        self.rows = None
+        if path is not None:
+            if os.path.exists(path):
+                try:
+                    rows = np.lib.format.open_memmap(path, mode='r+')
+                    if rows.dtype == dtype and rows.shape == (capacity,):
+                        self.rows = rows
+                    else:
+                        print(f"Metrics history {path} has a different layout, starting it over")
+                except (OSError, ValueError) as e:
+                    print(f"Cannot read metrics history {path} ({e}), starting it over")
+            if self.rows is None:
+                self.rows = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(capacity,))
+        else:
+            self.rows = np.zeros(capacity, dtype=dtype)
+
+        # Pick up where a persisted ring left off: unused rows have time 0
+        self.count = int(np.count_nonzero(self.rows['time']))
+        self.head = int(np.argmax(self.rows['time']) + 1) % capacity if self.count else 0
+
+    def append(self, timestamp, values):
+        self.rows['time'][self.head] = timestamp
+        self.rows['values'][self.head] = values
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def range(self, start=None, end=None):
+        """Rows with start <= time <= end, oldest first"""
+        indices = np.arange(self.head - self.count, self.head) % self.capacity
+        rows = self.rows[indices]
+        keep = np.ones(len(rows), dtype=bool)
+        if start is not None:
+            keep &= rows['time'] >= start
+        if end is not None:
+            keep &= rows['time'] <= end
+        return rows[keep]
+
+    def flush(self):
+        if isinstance(self.rows, np.memmap):
+            self.rows.flush()
+
+class MetricsHistory:
+    """
+    One camera's metrics over time at 1 second, 1 minute and 1 hour
+    resolution, each in a fixed-size ring (under 400 KB per camera in all).
+
+    record() is called once a second by the registry's sampler with a metrics
+    snapshot; the pipeline's per-frame updates are untouched. Coarser rings get
+    the mean of the samples in each of their periods (the sum, for counters).
+    With a directory, the rings are memory-mapped files in it.
+    """
+    def __init__(self, name, directory=None):
+        self.columns = HISTORY_METRICS
+        self.counters = np.array([column in COUNTER_METRICS for column in self.columns])
+        self.lock = threading.Lock()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        safe_name = re.sub(r'[^\w.-]', '_', name)
+        self.rings = {}
+        for resolution, seconds, capacity in RESOLUTIONS:
+            path = os.path.join(directory, f"{safe_name}-{resolution}.npy") if directory else None
+            self.rings[resolution] = TimeSeriesRing(capacity, len(self.columns), path)
+        self.steps = {resolution: seconds for resolution, seconds, _ in RESOLUTIONS}
+
+        # Running (period, sum, sample count) of the unfinished period per coarser resolution
+        self.pending = {}
+        # Last counter readings, to turn them into increments
+        self.last_counters = None
+
+    def record(self, timestamp, metrics):
+        """Add a snapshot of metrics (a dict with the HISTORY_METRICS keys; missing ones count as 0)"""
+        values = np.array([metrics.get(column, 0) or 0 for column in self.columns], dtype=np.float64)
+        counters = values[self.counters]
+        if self.last_counters is None:
+            values[self.counters] = 0
+        else:
+            # A counter going backwards was reset (e.g. a new camera object)
+            values[self.counters] = np.maximum(counters - self.last_counters, 0)
+        self.last_counters = counters
+
+        with self.lock:
+            for resolution, ring in self.rings.items():
+                step = self.steps[resolution]
+                if step == 1:
+                    ring.append(timestamp, values)
+                    continue
+                period = int(timestamp // step)
+                pending = self.pending.get(resolution)
+                if pending is not None and pending[0] != period:
+                    self._close_period(resolution, *pending)
+                    pending = None
+                if pending is None:
+                    pending = self.pending[resolution] = [period, np.zeros_like(values), 0]
+                pending[1] += values
+                pending[2] += 1
+
+    def _close_period(self, resolution, period, total, count):
+        """Write a finished period's point to its ring"""
+        values = np.where(self.counters, total, total / count)
+        self.rings[resolution].append(period * self.steps[resolution], values)
+        # Persisted rings are synced once a minute
+        for ring in self.rings.values():
+            ring.flush()
+
+    def query(self, resolution='1s', start=None, end=None, metrics=None):
+        """
+        Points between start and end (epoch seconds) at a resolution, oldest first
+        Returns: {'resolution', 'step', 'times', 'series': {metric: values}}
+        Raises: ValueError for an unknown resolution or metric
+        """
+        if resolution not in self.rings:
+            raise ValueError(f"resolution must be one of {', '.join(self.rings)}")
+        metrics = list(metrics) if metrics else list(self.columns)
+        unknown = [metric for metric in metrics if metric not in self.columns]
+        if unknown:
+            raise ValueError(f"unknown metrics: {', '.join(unknown)}")
+
+        with self.lock:
+            rows = self.rings[resolution].range(start, end)
+        return {
+            'resolution': resolution,
+            'step': self.steps[resolution],
+            'times': rows['time'].tolist(),
+            'series': {
+                metric: np.round(rows['values'][:, self.columns.index(metric)].astype(np.float64), 3).tolist()
+                for metric in metrics
+            },
+        }
+
+    def flush(self):
+        with self.lock:
+            for ring in self.rings.values():
+                ring.flush()
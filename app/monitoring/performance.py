@@ -1,64 +1,101 @@
 import time
 import threading
-from collections import deque
 import numpy as np
-from datetime import datetime, timedelta
+from app.detection.tracking import iou_matrix
+from app.monitoring.aggregators import RollingMean, QuantileSketch
+from app.monitoring.structured_log import RateLimitedLogger
 
 class PerformanceMonitor:
-    def __init__(self, window_size=100):
+    """
+    Per-camera metrics. Recording a sample is a constant-time append; the
+    averaging and quantile bucketing happen in bulk or when metrics are read.
+    Each update method is only called from one pipeline thread (capture, motion
+    or object), so recording takes no lock.
+    """
+    def __init__(self, window_size=100, name=None, log_interval=10.0):
+        self.name = name
+        
         # FPS tracking
-        self.frame_times = deque(maxlen=window_size)
+        self.frame_times = RollingMean(window_size)
         self.last_frame_time = time.time()
         
-        # Latency tracking
-        self.motion_latencies = deque(maxlen=window_size)
-        self.object_latencies = deque(maxlen=window_size)
+        # Latency tracking: rolling means plus p50/p95/p99 sketches
+        self.motion_latencies = RollingMean(window_size)
+        self.object_latencies = RollingMean(window_size)
+        self.motion_latency_sketch = QuantileSketch()
+        self.object_latency_sketch = QuantileSketch()
+        
+        # Object detection gating
+        self.inferences_run = 0
+        self.inferences_skipped = 0
         
-        # Camera switching tracking
-        self.camera_switches = deque(maxlen=window_size)
+        # Camera switching tracking (called from request threads, so it keeps a lock)
+        self.camera_switches = RollingMean(window_size)
         self.switch_start_time = None
+        self.lock = threading.Lock()
         
-        # Detection accuracy tracking
-        self.motion_detections = deque(maxlen=window_size)
-        self.object_detections = deque(maxlen=window_size)
-        self.false_positives = deque(maxlen=window_size)
-        self.total_detections = 0
-        self.total_false_positives = 0
+        # Detection accuracy tracking; motion and object counts are kept apart
+        # because they are written by different threads
+        self.motion_detections = RollingMean(window_size)
+        self.object_detections = RollingMean(window_size)
+        self.motion_false_positives = RollingMean(window_size)
+        self.object_false_positives = RollingMean(window_size)
+        self.motion_detection_count = 0
+        self.motion_false_positive_count = 0
+        self.object_detection_count = 0
+        self.object_false_positive_count = 0
         
         # System uptime tracking
         self.start_time = time.time()
         self.downtime = 0
         self.last_error_time = None
-        self.error_duration = 0
         
         # Connection tracking
         self.connection_failures = 0
+        self.outages = 0
         self.connection_recoveries = 0
         self.last_recovery_time = None
         
-        # Thread safety
-        self.lock = threading.Lock()
-        
-        # Start monitoring thread
-        self.monitoring_thread = threading.Thread(target=self._monitor_metrics, daemon=True)
-        self.monitoring_thread.start()
+        # Metrics go to the 'intruder.metrics' logger as JSON lines every log_interval seconds (0 disables)
+        self.log_interval = log_interval
+        self.logger = RateLimitedLogger("intruder.metrics", interval=log_interval)
+        if log_interval > 0:
+            self.monitoring_thread = threading.Thread(target=self._monitor_metrics, daemon=True)
+            self.monitoring_thread.start()
+
+    @property
+    def total_detections(self):
+        return self.motion_detection_count + self.object_detection_count
+
+    @property
+    def total_false_positives(self):
+        return self.motion_false_positive_count + self.object_false_positive_count
 
     def update_frame_time(self):
-        """Update frame timing metrics"""
+        """Update frame timing metrics (capture thread)"""
         current_time = time.time()
-        with self.lock:
-            self.frame_times.append(current_time - self.last_frame_time)
-            self.last_frame_time = current_time
+        self.frame_times.add(current_time - self.last_frame_time)
+        self.last_frame_time = current_time
 
     def update_motion_latency(self, latency):
-        """Update motion detection latency"""
-        with self.lock:
-            self.motion_latencies.append(latency)
+        """Update motion detection latency (motion thread)"""
+        self.motion_latencies.add(latency)
+        self.motion_latency_sketch.add(latency)
 
     def update_object_latency(self, latency):
-        """Update object detection latency"""
-        with self.lock:
-            self.object_latencies.append(latency)
+        """Update object detection latency (object thread)"""
+        self.object_latencies.add(latency)
+        self.object_latency_sketch.add(latency)
+        self.inferences_run += 1
+
+    def record_skipped_inference(self):
+        """Record a frame where object detection was skipped by the gate (object thread)"""
+        self.inferences_skipped += 1
+
+    def _inference_skip_rate(self):
+        """Percentage of frames where object detection was skipped"""
+        total = self.inferences_run + self.inferences_skipped
+        return (self.inferences_skipped / total * 100) if total > 0 else 0
 
     def start_camera_switch(self):
         """Start tracking camera switch time"""
@@ -68,158 +105,115 @@ class PerformanceMonitor:
         """End tracking camera switch time"""
         if self.switch_start_time:
             with self.lock:
-                self.camera_switches.append(time.time() - self.switch_start_time)
+                self.camera_switches.add(time.time() - self.switch_start_time)
             self.switch_start_time = None
 
+    def cancel_camera_switch(self):
+        """Stop tracking a camera switch that never delivered a frame, without recording a time"""
+        self.switch_start_time = None
+
     def update_motion_detection(self, detected, is_true_positive):
-        """Update motion detection accuracy metrics"""
-        with self.lock:
-            self.motion_detections.append(1 if detected else 0)
-            if detected:
-                self.total_detections += 1
-                if not is_true_positive:
-                    self.total_false_positives += 1
-                    self.false_positives.append(1)
-                else:
-                    self.false_positives.append(0)
+        """Update motion detection accuracy metrics (motion thread)"""
+        self.motion_detections.add(1 if detected else 0)
+        if detected:
+            self.motion_detection_count += 1
+            if not is_true_positive:
+                self.motion_false_positive_count += 1
+                self.motion_false_positives.add(1)
+            else:
+                self.motion_false_positives.add(0)
 
     def update_object_detection(self, detections, ground_truth):
-        """Update object detection accuracy metrics"""
-        with self.lock:
-            if detections and ground_truth:
-                # Calculate IoU for each detection
-                ious = []
-                for det in detections:
-                    max_iou = 0
-                    for gt in ground_truth:
-                        iou = self._calculate_iou(det['bbox'], gt['bbox'])
-                        max_iou = max(max_iou, iou)
-                    ious.append(max_iou)
-                
-                # Consider detection correct if IoU > 0.5
-                correct_detections = sum(1 for iou in ious if iou > 0.5)
-                self.object_detections.append(correct_detections / len(detections))
-                
-                # Update false positive tracking
-                self.total_detections += len(detections)
-                false_positives = len(detections) - correct_detections
-                self.total_false_positives += false_positives
-                self.false_positives.append(false_positives / len(detections) if len(detections) > 0 else 0)
-            elif detections:
-                self.object_detections.append(0.5)  # Assume 50% accuracy as a baseline
-                # Consider all detections as potential false positives when no ground truth
-                self.total_detections += len(detections)
-                self.total_false_positives += len(detections)
-                self.false_positives.append(1.0)  
+        """Update object detection accuracy metrics (object thread)"""
+        if detections and ground_truth:
+            # Best IoU of each detection against the ground truth, over the box arrays
+            ious = iou_matrix(detections.boxes(), ground_truth.boxes()).max(axis=1)
+            
+            # Consider detection correct if IoU > 0.5
+            correct_detections = int(np.count_nonzero(ious > 0.5))
+            self.object_detections.add(correct_detections / len(detections))
+            
+            # Update false positive tracking
+            self.object_detection_count += len(detections)
+            false_positives = len(detections) - correct_detections
+            self.object_false_positive_count += false_positives
+            self.object_false_positives.add(false_positives / len(detections))
+        elif detections:
+            self.object_detections.add(0.5)  # Assume 50% accuracy as a baseline
+            # Consider all detections as potential false positives when no ground truth
+            self.object_detection_count += len(detections)
+            self.object_false_positive_count += len(detections)
+            self.object_false_positives.add(1.0)
 
     def record_connection_failure(self):
-        """Record a connection failure"""
-        with self.lock:
-            self.connection_failures += 1
+        """Record a connection failure (capture thread)"""
+        self.connection_failures += 1
+        # Start tracking downtime
+        if self.last_error_time is None:
+            self.outages += 1
             self.last_error_time = time.time()
-            # Start tracking downtime
-            if self.last_error_time:
-                self.error_duration = time.time() - self.last_error_time
-                self.downtime += self.error_duration
 
     def record_connection_recovery(self):
-        """Record a successful connection recovery"""
-        with self.lock:
-            self.connection_recoveries += 1
-            self.last_recovery_time = time.time()
-            # End tracking downtime
-            if self.last_error_time:
-                self.error_duration = 0
-                self.last_error_time = None
-
-    def _calculate_iou(self, box1, box2):
-        """Calculate Intersection over Union between two bounding boxes"""
-        x1 = max(box1[0], box2[0])
-        y1 = max(box1[1], box2[1])
-        x2 = min(box1[2], box2[2])
-        y2 = min(box1[3], box2[3])
-        
-        intersection = max(0, x2 - x1) * max(0, y2 - y1)
-        box1_area = (box1[2] - box1[0]) * (box1[3] - box1[1])
-        box2_area = (box2[2] - box2[0]) * (box2[3] - box2[1])
-        
-        return intersection / (box1_area + box2_area - intersection)
+        """Record a successful read; counts as a recovery only after a failure (capture thread)"""
+        if self.last_error_time is None:
+            return
+        now = time.time()
+        self.connection_recoveries += 1
+        self.last_recovery_time = now
+        # End tracking downtime
+        self.downtime += now - self.last_error_time
+        self.last_error_time = None
 
     def _monitor_metrics(self):
-        """Continuously monitor and log metrics"""
+        """Periodically log metrics"""
         while True:
-            time.sleep(1)  # Update every second
+            time.sleep(self.log_interval)
             self._log_metrics()
 
     def _log_metrics(self):
-        """Calculate and log current metrics"""
-        with self.lock:
-            # Calculate FPS
-            fps = 1.0 / np.mean(self.frame_times) if self.frame_times else 0
-            
-            # Calculate latencies
-            motion_latency = np.mean(self.motion_latencies) * 1000 if self.motion_latencies else 0
-            object_latency = np.mean(self.object_latencies) * 1000 if self.object_latencies else 0
-            
-            # Calculate camera switch time
-            switch_time = np.mean(self.camera_switches) * 1000 if self.camera_switches else 0
-            
-            # Calculate detection accuracy
-            motion_accuracy = np.mean(self.motion_detections) * 100 if self.motion_detections else 0
-            object_map = np.mean(self.object_detections) * 100 if self.object_detections else 0
-            
-            # Calculate false positive reduction
-            if self.total_detections > 0:
-                false_positive_rate = (self.total_false_positives / self.total_detections) * 100
-            else:
-                false_positive_rate = 0
-            false_positive_reduction = max(0, 100 - false_positive_rate)
-            
-            # Calculate uptime
-            total_time = time.time() - self.start_time
-            current_downtime = self.downtime
-            if self.last_error_time:
-                current_downtime += time.time() - self.last_error_time
-            uptime = ((total_time - current_downtime) / total_time) * 100
-            
-            # Calculate connection recovery rate
-            recovery_rate = (self.connection_recoveries / self.connection_failures * 100) if self.connection_failures > 0 else 0
-            
-            # Log metrics
-            print(f"\nPerformance Metrics:")
-            print(f"FPS: {fps:.1f}")
-            print(f"Motion Detection Latency: {motion_latency:.1f}ms")
-            print(f"Object Detection Latency: {object_latency:.1f}ms")
-            print(f"Camera Switch Time: {switch_time:.1f}ms")
-            print(f"Motion Detection Accuracy: {motion_accuracy:.1f}%")
-            print(f"Object Detection mAP: {object_map:.1f}%")
-            print(f"False Positive Reduction: {false_positive_reduction:.1f}%")
-            print(f"System Uptime: {uptime:.1f}%")
-            print(f"Connection Recovery Rate: {recovery_rate:.1f}%")
+        """Log current metrics as one structured line"""
+        self.logger.log("metrics", camera=self.name, **self.get_metrics())
+
+    def _uptime(self):
+        """Percentage of time since start that the camera was delivering frames"""
+        now = time.time()
+        total_time = now - self.start_time
+        current_downtime = self.downtime
+        last_error_time = self.last_error_time
+        if last_error_time is not None:
+            current_downtime += now - last_error_time
+        return ((total_time - current_downtime) / total_time) * 100 if total_time > 0 else 100
 
     def get_metrics(self):
         """Get current metrics as a dictionary"""
-        with self.lock:
-            # Calculate current downtime including ongoing errors
-            current_downtime = self.downtime
-            if self.last_error_time:
-                current_downtime += time.time() - self.last_error_time
+        # Calculate false positive reduction
+        total_detections = self.total_detections
+        if total_detections > 0:
+            false_positive_rate = (self.total_false_positives / total_detections) * 100
+        else:
+            false_positive_rate = 0
+        false_positive_reduction = max(0, 100 - false_positive_rate)
+
+        frame_time = self.frame_times.mean()
+        motion_quantiles = self.motion_latency_sketch.quantiles()
+        object_quantiles = self.object_latency_sketch.quantiles()
             
-            # Calculate false positive reduction
-            if self.total_detections > 0:
-                false_positive_rate = (self.total_false_positives / self.total_detections) * 100
-            else:
-                false_positive_rate = 0
-            false_positive_reduction = max(0, 100 - false_positive_rate)
-                
-            return {
-                'fps': 1.0 / np.mean(self.frame_times) if self.frame_times else 0,
-                'motion_latency': np.mean(self.motion_latencies) * 1000 if self.motion_latencies else 0,
-                'object_latency': np.mean(self.object_latencies) * 1000 if self.object_latencies else 0,
-                'switch_time': np.mean(self.camera_switches) * 1000 if self.camera_switches else 0,
-                'motion_accuracy': np.mean(self.motion_detections) * 100 if self.motion_detections else 0,
-                'object_map': np.mean(self.object_detections) * 100 if self.object_detections else 0,
-                'false_positive_reduction': false_positive_reduction,
-                'uptime': ((time.time() - self.start_time - current_downtime) / (time.time() - self.start_time)) * 100,
-                'recovery_rate': (self.connection_recoveries / self.connection_failures * 100) if self.connection_failures > 0 else 0
-            } 
\ No newline at end of file
+        return {
+            'fps': 1.0 / frame_time if frame_time > 0 else 0,
+            'motion_latency': self.motion_latencies.mean() * 1000,
+            'motion_latency_p50': motion_quantiles[0.5] * 1000,
+            'motion_latency_p95': motion_quantiles[0.95] * 1000,
+            'motion_latency_p99': motion_quantiles[0.99] * 1000,
+            'object_latency': self.object_latencies.mean() * 1000,
+            'object_latency_p50': object_quantiles[0.5] * 1000,
+            'object_latency_p95': object_quantiles[0.95] * 1000,
+            'object_latency_p99': object_quantiles[0.99] * 1000,
+            'switch_time': self.camera_switches.mean() * 1000,
+            'motion_accuracy': self.motion_detections.mean() * 100,
+            'object_map': self.object_detections.mean() * 100,
+            'false_positive_reduction': false_positive_reduction,
+            'uptime': self._uptime(),
+            'recovery_rate': (self.connection_recoveries / self.outages * 100) if self.outages > 0 else 0,
+            'skipped_inferences': self.inferences_skipped,
+            'inference_skip_rate': self._inference_skip_rate()
+        }
@@ -0,0 +1,160 @@
+import bisect
+import math
+import threading
+
+# Latency buckets in seconds, from sub-millisecond stages up to slow inference
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(labels):
+    """Render {'camera': 'front'} as {camera="front"}"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels.items()) + "}"
+
+class _Metric:
+    """A metric family: one child per combination of label values"""
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values):
+        """
+        Get the child for these label values, creating it on first use
+        Look children up once and keep them; observing on a child is O(1).
+        """
+        values = tuple(str(value) for value in values)
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self):
+        """Yield (suffix, labels, value) for every child"""
+        for values, child in list(self.children.items()):
+            yield from child.samples(dict(zip(self.labelnames, values)))
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0
+        # Several request threads may count into the same child
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self, labels):
+        yield "", labels, self.value
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+class _HistogramChild:
+    """Bucket counts for one label set; meant for a single observing thread"""
+    def __init__(self, buckets):
+        self.upper_bounds = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+    def samples(self, labels):
+        cumulative = 0
+        for upper_bound, count in zip(self.upper_bounds + (math.inf,), list(self.counts)):
+            cumulative += count
+            yield "_bucket", {**labels, "le": format_value(float(upper_bound))}, cumulative
+        yield "_sum", labels, self.sum
+        yield "_count", labels, cumulative
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+class MetricsRegistry:
+    """
+    Metrics rendered in the Prometheus text exposition format.
+    Besides the metrics it owns, collectors registered with add_collector()
+    are called at scrape time, so values that are already counted elsewhere
+    (queue depths, dropped frames) cost nothing until someone asks.
+    """
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """
+        Register a callable returning (name, type, help, samples) tuples,
+        where samples is a list of (labels dict, value)
+        """
+        self.collectors.append(collector)
+
+    def render(self):
+        """Render every metric as Prometheus text"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{format_labels(labels)} {format_value(value)}")
+
+        for collector in list(self.collectors):
+            for name, type, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+CAPTURE_SECONDS = REGISTRY.histogram(
+    "intruder_capture_seconds", "Time to read one frame from the camera", ["camera"])
+MOTION_SECONDS = REGISTRY.histogram(
+    "intruder_motion_seconds", "Motion detection time per frame", ["camera"])
+INFERENCE_SECONDS = REGISTRY.histogram(
+    "intruder_inference_seconds", "Object detection time per batch containing the camera's frame", ["camera"])
+ENCODE_SECONDS = REGISTRY.histogram(
+    "intruder_encode_seconds", "JPEG encode time per published frame", ["stream"])
+END_TO_END_SECONDS = REGISTRY.histogram(
+    "intruder_end_to_end_seconds", "Time from frame capture to its object detection overlay being published", ["camera"])
+STREAMED_BYTES = REGISTRY.counter(
+    "intruder_streamed_bytes_total", "MJPEG bytes sent per feed, across its viewers", ["stream"])
+SKIPPED_FRAMES = REGISTRY.counter(
+    "intruder_stream_skipped_frames_total", "Frames async viewers skipped because they were slower than the feed", ["stream"])
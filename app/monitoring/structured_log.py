@@ -0,0 +1,43 @@
+import json
+import logging
+import threading
+import time
+
+# Interval for operational warnings (e.g. failed camera reads), independent of METRICS_LOG_INTERVAL
+WARNING_INTERVAL = 10.0
+
+class RateLimitedLogger:
+    """
+    Logs events as one JSON object per line, at most once per `interval`
+    seconds for each event name. Calls in between are dropped and counted,
+    and the count goes out with the next line as 'suppressed'.
+    """
+    def __init__(self, name, interval=10.0):
+        self.logger = logging.getLogger(name)
+        self.interval = interval
+        self.last_emitted = {}
+        self.suppressed = {}
+        self.lock = threading.Lock()
+
+    def log(self, event, level=logging.INFO, **fields):
+        """Log an event unless one with the same name went out recently; returns True if logged"""
+        if not self.logger.isEnabledFor(level):
+            return False
+
+        now = time.monotonic()
+        with self.lock:
+            last = self.last_emitted.get(event)
+            if last is not None and now - last < self.interval:
+                self.suppressed[event] = self.suppressed.get(event, 0) + 1
+                return False
+            self.last_emitted[event] = now
+            suppressed = self.suppressed.pop(event, 0)
+
+        record = {'event': event, 'time': round(time.time(), 3), **fields}
+        if suppressed:
+            record['suppressed'] = suppressed
+        self.logger.log(level, json.dumps(record, default=float))
+        return True
+
+    def warning(self, event, **fields):
+        return self.log(event, logging.WARNING, **fields)
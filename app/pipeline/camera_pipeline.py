@@ -0,0 +1,296 @@
+from app.detection.motion import MotionDetector
+from app.detection.gating import DetectionGate
+from app.detection.detections import Detections
+from app.detection.tracking import Tracker
+from app.monitoring.history import MetricsHistory
+from app.monitoring.performance import PerformanceMonitor
+from app.monitoring.structured_log import RateLimitedLogger, WARNING_INTERVAL
+from app.monitoring.prometheus import CAPTURE_SECONDS, MOTION_SECONDS, INFERENCE_SECONDS, END_TO_END_SECONDS
+from app.pipeline.frame_slot import FrameSlot
+from app.recording.clip_recorder import ClipRecorder
+from app.pipeline.frame_pool import FramePool, JpegFrame, as_pooled, dct_factor
+from app.streaming.broadcaster import DEFAULT_PROFILE, FrameBroadcaster
+from app.streaming.events import EventChannel
+import threading
+import time
+import numpy as np
+
+class CameraPipeline:
+    """
+    Capture and motion stages for one camera, plus its latest results and feeds.
+    Object detection is done by the CameraRegistry, which batches the frames
+    left in each pipeline's object_slot.
+    """
+    def __init__(self, name, camera, config, frames_ready=None, detection_store=None):
+        self.name = name
+        self.camera = camera
+        # Optional DetectionStore that keeps the history of this camera's detections
+        self.detection_store = detection_store
+        # What was last stored without tracking, and when: (class counts, time)
+        self.store_interval = config.detection_db_interval
+        self.last_stored = (None, 0.0)
+        self.motion_detector = MotionDetector(
+            analysis_scale=config.motion_analysis_scale,
+            grayscale=config.motion_grayscale,
+        )
+        self.performance_monitor = PerformanceMonitor(name=name, log_interval=config.metrics_log_interval)
+        # Operational warnings, throttled on their own interval rather than the metrics log's
+        self.warnings = RateLimitedLogger("intruder.pipeline", interval=WARNING_INTERVAL)
+        # Downsampled metrics over the last hours to weeks, sampled once a second by the registry
+        self.history = MetricsHistory(name, config.metrics_history_dir or None)
+        # Detections and metrics pushed to dashboards as server-sent events
+        self.events = EventChannel(name)
+        # Per-stage histograms for /metrics
+        self.capture_seconds = CAPTURE_SECONDS.labels(name)
+        self.motion_seconds = MOTION_SECONDS.labels(name)
+        self.inference_seconds = INFERENCE_SECONDS.labels(name)
+        self.end_to_end_seconds = END_TO_END_SECONDS.labels(name)
+        self.detection_gate = DetectionGate(
+            mode=config.detection_mode,
+            hold_seconds=config.detection_hold_seconds,
+            keyframe_interval=config.detection_keyframe_interval,
+            stride=config.detection_stride,
+        )
+        # Optional tracker giving detections stable IDs and moving boxes on skipped frames
+        self.tracker = Tracker(stride=config.detection_stride) if config.tracking else None
+
+        # Optional event clip recorder, fed from the capture thread
+        self.recorder = None
+        self.record_on_motion = False
+        self.record_classes = set()
+        if config.recording_dir:
+            self.recorder = ClipRecorder(
+                name, config.recording_dir,
+                pre_roll_seconds=config.recording_pre_roll,
+                post_roll_seconds=config.recording_post_roll,
+                segment_seconds=config.recording_segment_seconds,
+                quota_bytes=int(config.recording_quota_mb * 1024 * 1024),
+            )
+            self.record_on_motion = 'motion' in config.recording_triggers
+            self.record_classes = set(config.recording_triggers) - {'motion'}
+
+        self.latest_detections = Detections()
+        # Only guards swapping in finished results; no detection work runs under it
+        self.lock = threading.Lock()
+
+        # Frames travel through the pipeline as PooledFrames: every holder keeps one
+        # reference, and output overlays are drawn into recycled buffers
+        self.motion_pool = FramePool(f"{name}-motion")
+        self.diff_pool = FramePool(f"{name}-diff")
+        self.object_pool = FramePool(f"{name}-object")
+        # Wraps frames from cameras that only offer get_frame()
+        self._wrapped_frame = None
+
+        # Single-slot hand-offs between the capture -> motion -> object stages
+        self.motion_slot = FrameSlot(f"{name}-motion", on_drop=lambda frame: frame.release())
+        self.object_slot = FrameSlot(f"{name}-object", ready_event=frames_ready,
+                                     on_drop=lambda item: item[0].release())
+
+        # One broadcaster per feed type, so each frame is encoded once regardless of viewer count.
+        # Each broadcaster also holds the latest frame of its feed
+        self.broadcasters = {
+            "raw": FrameBroadcaster(f"{name}-raw"),
+            "motion": FrameBroadcaster(f"{name}-motion"),
+            "diff": FrameBroadcaster(f"{name}-diff"),
+            "object": FrameBroadcaster(f"{name}-object"),
+        }
+
+    def start(self):
+        """Start the capture and motion threads"""
+        threading.Thread(target=self.capture_frames, daemon=True).start()
+        threading.Thread(target=self.process_motion, daemon=True).start()
+
+    def read_camera(self):
+        """
+        Get the newest camera frame as a PooledFrame with a reference held for the caller
+        Returns: (success, frame)
+        """
+        camera = self.camera
+        if hasattr(camera, "get_frame_ref"):
+            return camera.get_frame_ref()
+
+        success, array = camera.get_frame()
+        if not success or array is None:
+            return False, None
+        # Reuse the wrapper while the camera keeps returning the same array
+        if self._wrapped_frame is None or self._wrapped_frame.array is not array:
+            self._wrapped_frame = as_pooled(array)
+            self._wrapped_frame.captured_at = time.time()
+        return True, self._wrapped_frame.retain()
+
+    def capture_frames(self):
+        """Continuously capture frames from the camera and hand them to the motion stage."""
+        last_frame = None
+        while True:
+            success, frame = self.read_camera()
+            if not success or frame is None:
+                self.warnings.warning("camera_read_failed", camera=self.name)
+                self.performance_monitor.record_connection_failure()
+                time.sleep(0.1)
+                continue
+
+            # Cameras return the same frame until their reader thread grabs a new one
+            if frame is last_frame:
+                frame.release()
+                time.sleep(0.005)
+                continue
+            last_frame = frame
+
+            self.performance_monitor.update_frame_time()
+            if frame.read_seconds is not None:
+                self.capture_seconds.observe(frame.read_seconds)
+
+            # Record connection recovery if we successfully got a frame
+            self.performance_monitor.record_connection_recovery()
+
+            self.broadcasters["raw"].publish(frame)
+            if self.recorder is not None:
+                self.recorder.offer(frame)
+
+            # Our reference passes to the motion stage
+            self.motion_slot.put(frame)
+
+    def process_motion(self):
+        """Run motion detection on the freshest captured frame and feed the object stage."""
+        motion_broadcaster, diff_broadcaster = self.broadcasters["motion"], self.broadcasters["diff"]
+        while True:
+            frame = self.motion_slot.get()
+
+            motion_start = time.time()
+            motion_detected, boxes, rois = self.motion_detector.find_motion(self.analysis_pixels(frame), frame.shape)
+            motion_latency = time.time() - motion_start
+            self.performance_monitor.update_motion_latency(motion_latency)
+            self.motion_seconds.observe(motion_latency)
+
+            # For motion detection accuracy, we'll use a simple heuristic:
+            # If there's significant motion (large contours), consider it a true positive
+            # This is a simplified approach - in a real system, you'd use ground truth data
+            # (foreground_area * 3 * 255 is the sum of the colored mask)
+            is_true_positive = motion_detected and self.motion_detector.foreground_area * 3 * 255 > 1000000
+            self.performance_monitor.update_motion_detection(motion_detected, is_true_positive)
+            self.detection_gate.update_motion(motion_detected)
+            if motion_detected and self.record_on_motion:
+                self.recorder.trigger("motion")
+
+            # Overlays are only drawn while someone watches them. Frames are shared
+            # read-only, so they go into pooled buffers
+            if diff_broadcaster.viewers:
+                diff_frame = self.diff_pool.acquire(frame.shape)
+                self.motion_detector.colored_mask(diff_frame.array)
+                diff_broadcaster.publish(diff_frame.freeze())
+                diff_frame.release()
+            if motion_broadcaster.viewers:
+                if boxes:
+                    motion_frame = self.motion_pool.acquire(frame.shape)
+                    np.copyto(motion_frame.array, frame.array)
+                    self.motion_detector.draw_motion(motion_frame.array, boxes)
+                    motion_broadcaster.publish(motion_frame.freeze())
+                    motion_frame.release()
+                else:
+                    # Nothing to draw: the camera frame is the overlay (and a JPEG passes through)
+                    motion_broadcaster.publish(frame)
+
+            # Our reference to the camera frame passes to the object stage
+            self.object_slot.put((frame, rois))
+
+    def analysis_pixels(self, frame):
+        """
+        Pixels for motion analysis: JPEG frames are decoded straight at the
+        smallest DCT scale the motion analysis scale allows
+        """
+        if isinstance(frame, JpegFrame):
+            return frame.decoded(dct_factor(self.motion_detector.requested_scale))
+        return frame.array
+
+    def update_detections(self, frame, detections, latency, object_detector):
+        """
+        Swap in the result of an object detection run on this camera's frame and publish its overlay
+        frame is the PooledFrame detection ran on; the caller keeps its reference
+        """
+        self.performance_monitor.update_object_latency(latency)
+        self.inference_seconds.observe(latency)
+
+        # With tracking, each object is stored once, when its track is confirmed
+        new_detections = detections
+        if self.tracker is not None:
+            detections, new_detections = self.tracker.update(detections)
+
+        # For object detection mAP, we'll use a simplified approach:
+        # If we detect objects with high confidence, consider them true positives
+        # In a real system, you'd use ground truth data
+        if detections:
+            # Create synthetic ground truth based on detection confidence
+            ground_truth = detections.filter(detections.array['confidence'] > 0.7)  # High confidence detections as ground truth
+
+            self.performance_monitor.update_object_detection(detections, ground_truth)
+
+        if self.detection_store is not None:
+            timestamp = frame.captured_at or time.time()
+            if self.tracker is not None or self._changed_since_stored(new_detections, timestamp):
+                self.detection_store.record(self.name, timestamp, new_detections)
+
+        if self.record_classes and detections:
+            triggered = self.record_classes.intersection(detections.class_names())
+            if triggered:
+                self.recorder.trigger(", ".join(sorted(triggered)))
+
+        self._set_detections(detections)
+        self._publish_objects(frame, detections, object_detector)
+
+    def _changed_since_stored(self, detections, timestamp):
+        """
+        Whether untracked detections are worth storing: the classes seen or their
+        counts changed since the last stored frame, or store_interval has passed
+        """
+        class_ids, counts = np.unique(detections.array['class_id'], return_counts=True)
+        seen = (tuple(class_ids.tolist()), tuple(counts.tolist()))
+        last_seen, last_time = self.last_stored
+        if seen == last_seen and timestamp - last_time < self.store_interval:
+            return False
+        self.last_stored = (seen, timestamp)
+        return True
+
+    def reuse_detections(self, frame, object_detector):
+        """
+        Draw detections over frame when object detection was skipped for it
+        With tracking, the tracks are moved to their predicted positions first.
+        """
+        self.performance_monitor.record_skipped_inference()
+        if self.tracker is not None:
+            detections = self.tracker.predict()
+            self._set_detections(detections)
+        else:
+            detections = self.latest_detections
+        self._publish_objects(frame, detections, object_detector)
+
+    def _set_detections(self, detections):
+        """Swap in the latest detections, pushing them to dashboards only if they changed"""
+        with self.lock:
+            previous, self.latest_detections = self.latest_detections, detections
+        if not detections.same_as(previous):
+            self.events.publish("detections", {'detections': detections})
+
+    def _publish_objects(self, frame, detections, object_detector):
+        """Draw detections over a pooled copy of frame and publish it on the object feed, if anyone watches it"""
+        broadcaster = self.broadcasters["object"]
+        if broadcaster.viewers:
+            object_frame = self.object_pool.acquire(frame.shape)
+            np.copyto(object_frame.array, frame.array)
+            object_detector.draw_detections(object_frame.array, detections)
+            broadcaster.publish(object_frame.freeze())
+            object_frame.release()
+        if frame.captured_at is not None:
+            self.end_to_end_seconds.observe(time.time() - frame.captured_at)
+
+    def get_detections(self):
+        """Return the latest object detections"""
+        with self.lock:
+            return self.latest_detections
+
+    def broadcaster(self, frame_type="motion"):
+        """The broadcaster for a feed type: 'raw', 'motion', 'diff', or 'object' (raw frames otherwise)"""
+        return self.broadcasters.get(frame_type, self.broadcasters["raw"])
+
+    def stream(self, frame_type="motion", profile=DEFAULT_PROFILE):
+        """Yield frames for streaming based on type: 'raw', 'motion', 'diff', or 'object'."""
+        return self.broadcaster(frame_type).stream(profile)
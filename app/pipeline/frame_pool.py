@@ -0,0 +1,208 @@
+import threading
+import time
+import cv2
+import numpy as np
+
+class PooledFrame:
+    """
+    Reference-counted frame buffer.
+    Whoever stores a frame (a stage, a FrameSlot, a FrameBroadcaster) holds one
+    reference and calls release() when done; the buffer goes back to its pool
+    when the last reference is released. Frames are frozen read-only once
+    published, so holders can share them without copying.
+    """
+    def __init__(self, array, pool=None):
+        self.array = array
+        self.pool = pool
+        self.refcount = 1
+        self.lock = threading.Lock()
+        # Set by read_frame(): when the frame was read and how long the read took
+        self.captured_at = None
+        self.read_seconds = None
+
+    def retain(self):
+        """Take another reference to the frame"""
+        with self.lock:
+            self.refcount += 1
+        return self
+
+    def release(self):
+        """Drop a reference, returning the buffer to its pool when none are left"""
+        with self.lock:
+            self.refcount -= 1
+            recycle = self.refcount == 0
+        if recycle and self.pool is not None:
+            self.pool.recycle(self)
+
+    def freeze(self):
+        """Make the frame read-only; call once it has been filled in"""
+        self.array.flags.writeable = False
+        return self
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+class FramePool:
+    """
+    Pool of preallocated frame buffers, so steady-state capture and processing
+    reuse the same few arrays instead of allocating new ones every frame.
+    Buffers of a different shape (e.g. after a camera switch) are discarded.
+    """
+    def __init__(self, name, max_free=8, dtype=np.uint8):
+        self.name = name
+        self.max_free = max_free
+        self.dtype = dtype
+        self.free = []
+        self.lock = threading.Lock()
+        # Number of buffers ever allocated; flat in steady state
+        self.allocations = 0
+        # Shape of the last frame read by read_frame()
+        self.last_shape = None
+
+    def preallocate(self, shape, count):
+        """Allocate count buffers of shape up front"""
+        with self.lock:
+            for _ in range(count - len(self.free)):
+                self.free.append(np.empty(shape, dtype=self.dtype))
+                self.allocations += 1
+
+    def acquire(self, shape):
+        """
+        Get a writable buffer of the given shape with one reference held by the caller
+        Returns: PooledFrame
+        """
+        shape = tuple(shape)
+        with self.lock:
+            while self.free:
+                array = self.free.pop()
+                if array.shape == shape:
+                    array.flags.writeable = True
+                    return PooledFrame(array, self)
+            self.allocations += 1
+        return PooledFrame(np.empty(shape, dtype=self.dtype), self)
+
+    def recycle(self, frame):
+        """Return a frame's buffer to the pool (called by PooledFrame.release)"""
+        with self.lock:
+            if len(self.free) < self.max_free:
+                self.free.append(frame.array)
+
+    def read_frame(self, cap):
+        """
+        Read the next frame from a cv2.VideoCapture straight into a pooled buffer
+        Returns: (success, frozen PooledFrame or None)
+        """
+        frame = self.acquire(self.last_shape) if self.last_shape else None
+        read_start = time.time()
+        ret, array = cap.read(frame.array) if frame else cap.read()
+        read_end = time.time()
+        if not ret or array is None:
+            if frame:
+                frame.release()
+            return False, None
+
+        if frame is None or array is not frame.array:
+            # First frame, or the stream changed size: adopt OpenCV's array
+            if frame:
+                frame.release()
+            frame = PooledFrame(array, self)
+            self.last_shape = array.shape
+
+        frame.captured_at, frame.read_seconds = read_end, read_end - read_start
+        return True, frame.freeze()
+
+def as_pooled(frame):
+    """Wrap a plain ndarray so it can travel through the pipeline like a pooled frame"""
+    if isinstance(frame, PooledFrame):
+        return frame
+    return PooledFrame(frame)
+
+# imdecode flags for decoding at 1/1, 1/2, 1/4 and 1/8 scale (JPEG DCT scaling)
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Start-of-frame markers, which carry the image size
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def dct_factor(scale):
+    """Largest JPEG decode reduction (1, 2, 4 or 8) that still gives at least scale times the full size"""
+    for factor in (8, 4, 2):
+        if 1.0 / factor >= scale:
+            return factor
+    return 1
+
+def jpeg_shape(jpeg):
+    """Read a JPEG's decoded (height, width, 3) from its frame header; None if there isn't one"""
+    i = 2
+    while i + 9 <= len(jpeg):
+        if jpeg[i] != 0xFF:
+            return None
+        marker = jpeg[i + 1]
+        if marker == 0xFF:
+            # Fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Markers without a length
+            i += 2
+            continue
+        if marker in SOF_MARKERS:
+            height = int.from_bytes(jpeg[i + 5:i + 7], 'big')
+            width = int.from_bytes(jpeg[i + 7:i + 9], 'big')
+            return height, width, 3
+        i += 2 + int.from_bytes(jpeg[i + 2:i + 4], 'big')
+    return None
+
+class JpegFrame(PooledFrame):
+    """
+    A frame that arrived as a JPEG (from an MJPEG stream).
+    The original bytes are kept, so feeds and recordings can pass them through
+    unchanged; pixels are only decoded the first time .array is read, or at
+    1/2, 1/4 or 1/8 scale by decoded(factor), which is cheaper still. Decoded
+    arrays are cached per scale and always read-only.
+    """
+    def __init__(self, jpeg, shape=None):
+        super().__init__(None)
+        self.jpeg = jpeg
+        self._shape = shape or jpeg_shape(jpeg)
+        self.decodes = {}
+        self.decode_lock = threading.Lock()
+
+    @property
+    def array(self):
+        return self.decoded(1)
+
+    @array.setter
+    def array(self, value):
+        # PooledFrame.__init__ sets it; pixels only ever come from the JPEG
+        pass
+
+    def decoded(self, factor=1):
+        """Pixels decoded at 1/factor scale (1, 2, 4 or 8), decoding on first use"""
+        array = self.decodes.get(factor)
+        if array is None:
+            with self.decode_lock:
+                array = self.decodes.get(factor)
+                if array is None:
+                    array = cv2.imdecode(np.frombuffer(self.jpeg, np.uint8), REDUCED_DECODE_FLAGS[factor])
+                    if array is None:
+                        print("Error: Could not decode JPEG frame!")
+                        height, width = (self._shape or (1, 1))[:2]
+                        array = np.zeros((-(-height // factor), -(-width // factor), 3), np.uint8)
+                    array.flags.writeable = False
+                    self.decodes[factor] = array
+        return array
+
+    def freeze(self):
+        return self
+
+    @property
+    def shape(self):
+        if self._shape is None:
+            self._shape = self.array.shape
+        return self._shape
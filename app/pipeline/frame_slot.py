@@ -0,0 +1,48 @@
+import threading
+
+class FrameSlot:
+    """
+    Bounded single-slot queue between pipeline stages.
+    put() never blocks: an item the consumer has not taken yet is replaced
+    (and counted as dropped), so a slow stage always sees the freshest frame.
+    """
+    def __init__(self, name, ready_event=None, on_drop=None):
+        self.name = name
+        # Optional event shared by several slots, set whenever any of them gets an item
+        self.ready_event = ready_event
+        # Optional callback for dropped items, e.g. to release pooled frames
+        self.on_drop = on_drop
+        self.condition = threading.Condition()
+        self.item = None
+        self.pending = False
+        self.dropped = 0
+
+    def put(self, item):
+        """Offer an item to the consumer, dropping any stale one"""
+        with self.condition:
+            stale = self.item if self.pending else None
+            if self.pending:
+                self.dropped += 1
+            self.item = item
+            self.pending = True
+            self.condition.notify()
+        if stale is not None and self.on_drop is not None:
+            self.on_drop(stale)
+        if self.ready_event is not None:
+            self.ready_event.set()
+
+    def get(self, timeout=None):
+        """
+        Wait for the next item
+        Returns: the item, or None on timeout
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.pending, timeout=timeout):
+                return None
+            item, self.item = self.item, None
+            self.pending = False
+            return item
+
+    def depth(self):
+        """Number of items waiting (0 or 1)"""
+        return 1 if self.pending else 0
@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import namedtuple
+
+# What each degradation level does to the configured settings: multiply the
+# detection stride, scale the YOLO input size, cap the motion analysis scale.
+# Cheapest losses first: skipping frames (tracking/reuse fills them in), then
+# coarser motion analysis, then a smaller model input.
+DEGRADATION_STEPS = (
+    (1, 1.0, 1.0),
+    (2, 1.0, 1.0),
+    (2, 1.0, 0.5),
+    (2, 0.75, 0.5),
+    (3, 0.5, 0.5),
+    (4, 0.5, 0.25),
+)
+
+Level = namedtuple('Level', ['stride', 'imgsz', 'analysis_scale'])
+
+def build_levels(stride, imgsz, analysis_scale, min_imgsz=160):
+    """
+    The settings at every degradation level, starting from the configured ones
+    imgsz stays a multiple of 32 (the model's stride); levels identical to the one
+    before are dropped.
+    """
+    levels = []
+    for stride_factor, imgsz_factor, scale_cap in DEGRADATION_STEPS:
+        level = Level(
+            stride=max(1, stride) * stride_factor,
+            imgsz=min(imgsz, max(min_imgsz, int(imgsz * imgsz_factor) // 32 * 32)),
+            analysis_scale=min(analysis_scale, scale_cap),
+        )
+        if not levels or level != levels[-1]:
+            levels.append(level)
+    return levels
+
+class LoadGovernor:
+    """
+    Sheds load when the pipeline can't keep up, instead of letting latency grow.
+
+    Fed the end-to-end latency of every frame that ran object detection
+    (capture, motion analysis, waiting and inference). Every `interval` seconds
+    the mean over that window is compared with target_latency: above it, the
+    governor steps one degradation level down (see DEGRADATION_STEPS); below
+    recover_ratio of it for recover_seconds, it steps back up one level.
+    Samples from before a change are discarded, so each decision only sees the
+    current settings. tick() counts a window with too few detected frames
+    (nothing moving) as a recovery sample, so the level also steps back up while idle.
+
+    A target of 0 disables it: the configured settings are always used.
+    Listeners are called with the new Level whenever it changes.
+    """
+    def __init__(self, target_latency=0, stride=1, imgsz=640, analysis_scale=1.0,
+                 interval=2.0, recover_ratio=0.5, recover_seconds=30.0, min_samples=5):
+        self.target_latency = target_latency
+        self.interval = interval
+        self.recover_ratio = recover_ratio
+        self.recover_seconds = recover_seconds
+        self.min_samples = min_samples
+
+        self.levels = build_levels(stride, imgsz, analysis_scale)
+        self.level = 0
+        self.listeners = []
+        self.changes = 0
+
+        # Latency over the current window, and since when it has been low enough to recover
+        self.lock = threading.Lock()
+        self.window_total = 0.0
+        self.window_count = 0
+        self.window_start = time.monotonic()
+        self.recovering_since = None
+        # Mean of the last full window, for status()
+        self.last_latency = None
+
+    @property
+    def enabled(self):
+        return self.target_latency > 0
+
+    @property
+    def current(self):
+        """The settings at the current level"""
+        return self.levels[self.level]
+
+    def add_listener(self, listener):
+        """Call listener(level) on every level change, and once now with the current level"""
+        self.listeners.append(listener)
+        listener(self.current)
+
+    def observe(self, latency):
+        """Record one detected frame's end-to-end latency in seconds, adjusting the level when a window closes"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self.lock:
+            self.window_total += latency
+            self.window_count += 1
+            if now - self.window_start < self.interval or self.window_count < self.min_samples:
+                return
+            mean = self.window_total / self.window_count
+            self.last_latency = mean
+            settings = self._close_window(now, mean)
+        if settings is not None:
+            self._announce(f"mean latency {mean * 1000:.0f} ms against a {self.target_latency * 1000:.0f} ms target", settings)
+
+    def tick(self):
+        """
+        Close a window that saw too few detected frames to judge, as a recovery sample
+        Called periodically: with motion-gated detection and nothing moving, observe()
+        isn't called at all, and the level would otherwise stay degraded while idle.
+        """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self.lock:
+            if now - self.window_start < self.interval or self.window_count >= self.min_samples:
+                return
+            settings = self._close_window(now, 0.0)
+        if settings is not None:
+            self._announce("idle", settings)
+
+    def _close_window(self, now, mean):
+        """Start a new window and step the level on its mean; returns the new Level if it changed (lock held)"""
+        self.window_total, self.window_count, self.window_start = 0.0, 0, now
+
+        level = self.level
+        if mean > self.target_latency:
+            self.recovering_since = None
+            level = min(level + 1, len(self.levels) - 1)
+        elif mean < self.target_latency * self.recover_ratio and level > 0:
+            if self.recovering_since is None:
+                self.recovering_since = now
+            elif now - self.recovering_since >= self.recover_seconds:
+                self.recovering_since = None
+                level -= 1
+        else:
+            self.recovering_since = None
+
+        if level == self.level:
+            return None
+        self.level = level
+        self.changes += 1
+        return self.current
+
+    def _announce(self, reason, settings):
+        """Log a level change and pass the new settings to the listeners"""
+        print(f"Load governor: {reason}, now at degradation level {self.levels.index(settings)} "
+              f"(stride {settings.stride}, imgsz {settings.imgsz}, motion scale {settings.analysis_scale:g})")
+        for listener in self.listeners:
+            listener(settings)
+
+    def status(self):
+        """Current level and settings, for /get_metrics"""
+        settings = self.current
+        return {
+            'degradation_level': self.level,
+            'max_degradation_level': len(self.levels) - 1,
+            'latency_target': self.target_latency * 1000,
+            'governed_latency': self.last_latency * 1000 if self.last_latency is not None else 0,
+            'detection_stride': settings.stride,
+            'detection_imgsz': settings.imgsz,
+            'motion_analysis_scale': settings.analysis_scale,
+        }
@@ -0,0 +1,238 @@
+from app.camera.webcam import Webcam
+from app.camera.phonecam import Phonecam
+from app.camera.filecam import FileCamera
+from app.camera.mjpeg import MjpegCamera
+from app.detection.process_pool import ProcessPoolDetector
+from app.pipeline.camera_pipeline import CameraPipeline
+import os
+import threading
+import time
+
+def create_camera(source, mjpeg=False):
+    """
+    Open a camera from a source spec: 'webcam', a webcam index, a video file or a stream URL
+    With mjpeg, http(s) streams are read as MJPEG without OpenCV.
+    """
+    if source == "webcam":
+        return Webcam()
+    if str(source).isdigit():
+        return Webcam(int(source))
+    if os.path.isfile(source):
+        # Recorded clips replay in a loop at their native frame rate
+        return FileCamera(source, realtime=True)
+    if mjpeg and source.startswith(('http://', 'https://')):
+        return MjpegCamera(source)
+    return Phonecam(source)
+
+class CameraRegistry:
+    """
+    Runs any number of camera pipelines concurrently, sharing one ObjectDetector.
+    The object stage takes the freshest frame waiting from every camera and
+    runs them through the model as a single batch.
+
+    With a ProcessPoolDetector, batches are submitted to the worker processes
+    without waiting, and a second thread finishes them as their results come
+    back in order.
+
+    A LoadGovernor, if given, sees the latency of every detected frame and sets
+    every camera's detection stride and motion analysis scale and the shared
+    model input size.
+    """
+    def __init__(self, object_detector, detection_store=None, governor=None):
+        self.object_detector = object_detector
+        self.detection_store = detection_store
+        self.governor = governor
+        self.pipelines = {}
+        # Set by any pipeline's object_slot when it receives a frame
+        self.frames_ready = threading.Event()
+
+    def add(self, name, camera, config):
+        """Register a camera under name and return its pipeline"""
+        pipeline = CameraPipeline(name, camera, config, frames_ready=self.frames_ready,
+                                  detection_store=self.detection_store)
+        self.pipelines[name] = pipeline
+        return pipeline
+
+    def get(self, name):
+        """Return the pipeline registered under name, or None"""
+        return self.pipelines.get(name)
+
+    def names(self):
+        """Return the registered camera names in registration order"""
+        return list(self.pipelines)
+
+    @property
+    def default(self):
+        """The first registered pipeline, served by the unprefixed routes"""
+        return next(iter(self.pipelines.values()))
+
+    def start(self):
+        """Start every pipeline and the shared object detection thread"""
+        for pipeline in self.pipelines.values():
+            pipeline.start()
+        if self.governor is not None:
+            self.governor.add_listener(self.apply_settings)
+        threading.Thread(target=self.process_objects, daemon=True).start()
+        threading.Thread(target=self.sample_metrics, daemon=True).start()
+        if self.pipelined:
+            threading.Thread(target=self.deliver_objects, daemon=True).start()
+
+    @property
+    def pipelined(self):
+        """True when detection runs in worker processes, with batches in flight while the next is gathered"""
+        return isinstance(self.object_detector, ProcessPoolDetector)
+
+    def process_objects(self):
+        """Run batched object detection over the latest frame of every camera."""
+        while True:
+            self.frames_ready.wait()
+            self.frames_ready.clear()
+
+            batch, reused = [], []
+            for pipeline in self.pipelines.values():
+                item = pipeline.object_slot.get(timeout=0)
+                if item is None:
+                    continue
+                frame, rois = item
+
+                # Nothing moving, or not this camera's turn: reuse (or track) the last detections instead of running YOLO
+                if not pipeline.detection_gate.should_detect():
+                    reused.append((pipeline, frame))
+                else:
+                    batch.append((pipeline, frame, rois))
+
+            if self.pipelined:
+                if not batch:
+                    # Nothing for the workers: finish now rather than take a turn and a slot in the pool
+                    self.finish_batch([], reused, [], 0)
+                else:
+                    # Reused frames ride along with a real batch, so each camera's frames are finished in order
+                    self.object_detector.submit(
+                        [frame.array for _, frame, _ in batch],
+                        [rois for _, _, rois in batch],
+                        context=(batch, reused),
+                    )
+                continue
+
+            self.finish_batch(batch, reused, [], 0)
+            if not batch:
+                continue
+
+            # Object detection with timing; each pipeline draws its own overlay
+            object_start = time.time()
+            results = self.object_detector.detect_batch(
+                [frame.array for _, frame, _ in batch],
+                [rois for _, _, rois in batch],
+                draw=False,
+            )
+            object_latency = time.time() - object_start
+            self.finish_batch(batch, [], [detections for _, detections in results], object_latency)
+
+    def deliver_objects(self):
+        """Hand the worker pool's results, in submission order, back to the pipelines"""
+        for (batch, reused), detected_objects, object_latency in self.object_detector.results():
+            self.finish_batch(batch, reused, detected_objects, object_latency)
+
+    def finish_batch(self, batch, reused, detected_objects, object_latency):
+        """Update, draw and publish each camera's detections, then release the frames"""
+        for pipeline, frame in reused:
+            pipeline.reuse_detections(frame, self.object_detector)
+            frame.release()
+        for (pipeline, frame, _), detections in zip(batch, detected_objects):
+            pipeline.update_detections(frame, detections, object_latency, self.object_detector)
+            if self.governor is not None and frame.captured_at is not None:
+                self.governor.observe(time.time() - frame.captured_at)
+            frame.release()
+
+    def apply_settings(self, settings):
+        """Apply a LoadGovernor level to the detector and every camera"""
+        self.object_detector.set_imgsz(settings.imgsz)
+        for pipeline in self.pipelines.values():
+            pipeline.detection_gate.stride = settings.stride
+            if pipeline.tracker is not None:
+                pipeline.tracker.stride = settings.stride
+            pipeline.motion_detector.set_analysis_scale(settings.analysis_scale)
+
+    def metrics(self, pipeline):
+        """A camera's /get_metrics snapshot: its monitor's metrics plus the load governor's state"""
+        metrics = pipeline.performance_monitor.get_metrics()
+        if self.governor is not None:
+            metrics.update(self.governor.status())
+        return metrics
+
+    def sample_metrics(self, interval=1.0):
+        """Record every camera's metrics into its history and push them to its dashboards once a second, and tick the governor"""
+        next_sample = time.time()
+        while True:
+            next_sample += interval
+            time.sleep(max(0.0, next_sample - time.time()))
+            now = time.time()
+            if self.governor is not None:
+                # Lets the governor recover while no frames are being detected
+                self.governor.tick()
+            for pipeline in self.pipelines.values():
+                metrics = self.metrics(pipeline)
+                pipeline.events.publish("metrics", metrics)
+                pipeline.history.record(now, dict(metrics, reconnects=getattr(pipeline.camera, 'reconnects', 0)))
+
+    def collect_metrics(self):
+        """
+        Counters and gauges for /metrics that the pipelines already keep
+        Returns: (name, type, help, samples) tuples for MetricsRegistry
+        """
+        dropped, depths, skipped, inferences, reconnects = [], [], [], [], []
+        recorder_dropped, clips = [], []
+        for name, pipeline in self.pipelines.items():
+            monitor = pipeline.performance_monitor
+            for stage, slot in (("motion", pipeline.motion_slot), ("object", pipeline.object_slot)):
+                dropped.append(({'camera': name, 'stage': stage}, slot.dropped))
+                depths.append(({'camera': name, 'stage': stage}, slot.depth()))
+            skipped.append(({'camera': name}, monitor.inferences_skipped))
+            inferences.append(({'camera': name}, monitor.inferences_run))
+            reconnects.append(({'camera': name}, getattr(pipeline.camera, 'reconnects', 0)))
+            recorder = pipeline.recorder
+            if recorder is not None:
+                recorder_dropped.append(({'camera': name, 'stage': 'encode'}, recorder.dropped_frames))
+                recorder_dropped.append(({'camera': name, 'stage': 'write'}, recorder.dropped_writes))
+                clips.append(({'camera': name}, recorder.clips_written))
+        return [
+            ("intruder_dropped_frames_total", "counter", "Frames replaced in a stage's queue before being processed", dropped),
+            ("intruder_queue_depth", "gauge", "Frames waiting in a stage's queue", depths),
+            ("intruder_skipped_inferences_total", "counter", "Frames where the detection gate skipped object detection", skipped),
+            ("intruder_inferences_total", "counter", "Frames run through object detection", inferences),
+            ("intruder_camera_reconnects_total", "counter", "Camera stream reconnects", reconnects),
+            ("intruder_recorder_dropped_frames_total", "counter", "Frames the clip recorder dropped because it fell behind", recorder_dropped),
+            ("intruder_clips_recorded_total", "counter", "Event clips written to disk", clips),
+        ] + self._collect_store_metrics() + self._collect_pool_metrics() + self._collect_governor_metrics()
+
+    def _collect_governor_metrics(self):
+        """The load governor's degradation level, when it is enabled"""
+        if self.governor is None or not self.governor.enabled:
+            return []
+        return [
+            ("intruder_degradation_level", "gauge", "Load governor degradation level (0 = configured settings)",
+             [({}, self.governor.level)]),
+        ]
+
+    def _collect_pool_metrics(self):
+        """Batches waiting on the detection worker processes, when they are used"""
+        if not self.pipelined:
+            return []
+        return [
+            ("intruder_inference_batches_in_flight", "gauge", "Batches submitted to the detection workers but not yet delivered",
+             [({}, self.object_detector.in_flight_count())]),
+        ]
+
+    def _collect_store_metrics(self):
+        """Detection history counters, when the store is enabled"""
+        store = self.detection_store
+        if store is None:
+            return []
+        return [
+            ("intruder_detections_stored_total", "counter", "Detections written to the history database",
+             [({}, store.rows_written)]),
+            ("intruder_detections_store_dropped_total", "counter", "Frames of detections dropped because the writer fell behind",
+             [({}, store.dropped)]),
+            ("intruder_detections_store_queue_depth", "gauge", "Frames of detections waiting to be written",
+             [({}, store.pending.qsize())]),
+        ]
@@ -0,0 +1,179 @@
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import threading
+import time
+
+class VideoService:
+    """
+    Owns the config, cameras, object detector and camera pipelines.
+    Nothing is opened or loaded until start(), which initialises everything on a
+    background thread (YOLO load and camera opens in parallel), so the HTTP
+    server is up immediately and reports 'warming_up' until the pipelines run.
+    """
+    def __init__(self):
+        self.state = "stopped"  # stopped -> warming_up -> running, or failed
+        self.error = None
+        self.config = None
+        self.object_detector = None
+        self.registry = None
+        self.detection_store = None
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.started_at = None
+        self.warmup_time = None
+
+    def start(self):
+        """Start initialising in the background; safe to call more than once"""
+        with self.lock:
+            if self.state != "stopped":
+                return
+            self.state = "warming_up"
+            self.started_at = time.time()
+        threading.Thread(target=self._initialise, daemon=True).start()
+
+    def _initialise(self):
+        """Load the model and open the cameras in parallel, then start the pipelines"""
+        # Heavy imports (ultralytics pulls in torch) are deferred to here
+        from app.config import Config
+        from app.camera.manager import CameraManager
+        from app.detection.object_detection import ObjectDetector
+        from app.detection.process_pool import ProcessPoolDetector
+        from app.pipeline.governor import LoadGovernor
+        from app.pipeline.registry import CameraRegistry, create_camera
+        from app.monitoring.prometheus import REGISTRY
+        from app.storage.detection_store import DetectionStore
+
+        try:
+            config = Config()
+
+            with ThreadPoolExecutor(max_workers=1 + len(config.camera_sources)) as executor:
+                if config.detection_workers > 0:
+                    detector_class = functools.partial(ProcessPoolDetector, workers=config.detection_workers)
+                else:
+                    detector_class = ObjectDetector
+                detector_future = executor.submit(
+                    detector_class,
+                    roi_mode=config.detection_roi,
+                    roi_padding=config.detection_roi_padding,
+                    backend=config.detection_backend,
+                    imgsz=config.detection_imgsz,
+                    threads=config.detection_threads,
+                    int8=config.detection_int8,
+                    cache_dir=config.model_cache_dir,
+                    class_filter=config.detection_classes,
+                )
+                if config.auto_switch:
+                    # The default camera hot-swaps between the webcam and the phone camera
+                    initial = "webcam" if config.CAMERA_SOURCE == "webcam" else "phonecam"
+                    camera_futures = {"default": executor.submit(
+                        CameraManager, config.phonecam_url, initial=initial, keep_warm=config.camera_keep_warm,
+                        mjpeg=config.phonecam_mjpeg,
+                    )}
+                else:
+                    camera_futures = {
+                        name: executor.submit(create_camera, source, mjpeg=config.phonecam_mjpeg)
+                        for name, source in config.camera_sources.items()
+                    }
+
+                object_detector = detector_future.result()
+                cameras = {name: future.result() for name, future in camera_futures.items()}
+
+            detection_store = None
+            if config.detection_db:
+                detection_store = DetectionStore(config.detection_db, retention_days=config.detection_retention_days)
+            governor = LoadGovernor(
+                config.latency_target,
+                stride=config.detection_stride,
+                imgsz=config.detection_imgsz,
+                analysis_scale=config.motion_analysis_scale,
+                interval=config.governor_interval,
+                recover_seconds=config.governor_recover_seconds,
+            )
+            registry = CameraRegistry(object_detector, detection_store, governor)
+            for name, camera in cameras.items():
+                registry.add(name, camera, config)
+            registry.start()
+            REGISTRY.add_collector(registry.collect_metrics)
+
+            self.config, self.object_detector, self.registry = config, object_detector, registry
+            self.detection_store = detection_store
+            if config.auto_switch:
+                threading.Thread(target=self.auto_switch_camera, daemon=True).start()
+
+            self.warmup_time = time.time() - self.started_at
+            self.state = "running"
+            print(f"Video service ready after {self.warmup_time:.1f}s")
+            if isinstance(object_detector, ProcessPoolDetector):
+                # A pool that has given up on its workers takes the service down with it
+                object_detector.on_failure = self.fail
+                if object_detector.failed:
+                    self.fail("the detection worker pool failed during startup")
+        except Exception as e:
+            print(f"Error starting video service: {str(e)}")
+            self.error = str(e)
+            self.state = "failed"
+        finally:
+            self.ready.set()
+
+    def fail(self, error):
+        """Mark a running service failed, e.g. when the detection pool gives up"""
+        print(f"Video service failed: {error}")
+        self.error = error
+        self.state = "failed"
+
+    def wait_until_running(self, timeout=None):
+        """Block until initialisation has finished; returns True if the service is running"""
+        self.start()
+        self.ready.wait(timeout)
+        return self.state == "running"
+
+    def status(self):
+        """Current state, for the status route and the dashboard"""
+        status = {'state': self.state}
+        if self.state == "running":
+            status['cameras'] = self.registry.names()
+            status['warmup_time'] = self.warmup_time
+        elif self.state == "failed":
+            status['error'] = self.error
+        return status
+
+    def switch_camera(self, pipeline, source):
+        """Switch a pipeline between 'webcam' and 'phonecam', timing until the new source delivers a frame"""
+        from app.camera.manager import CameraManager
+        from app.pipeline.registry import create_camera
+
+        camera = pipeline.camera
+        if isinstance(camera, CameraManager) and camera.active_name == source:
+            return False
+
+        pipeline.performance_monitor.start_camera_switch()
+        try:
+            if isinstance(camera, CameraManager):
+                camera.switch_to(source)
+                if not camera.wait_until_ready():
+                    # The new source is active but silent; a timeout isn't a switch time
+                    print(f"Switched to {source}, but it hasn't delivered a frame yet")
+                    pipeline.performance_monitor.cancel_camera_switch()
+                    return True
+            else:
+                # Fixed cameras from CAMERAS: replace the source and release the old device
+                pipeline.camera = create_camera(self.config.phonecam_url if source == "phonecam" else "webcam",
+                                                mjpeg=self.config.phonecam_mjpeg)
+                threading.Thread(target=camera.stop, daemon=True).start()
+        except RuntimeError as e:
+            # The new source couldn't be opened; the current one stays active
+            print(f"Cannot switch to {source}: {e}")
+            return False
+        pipeline.performance_monitor.end_camera_switch()
+        return True
+
+    def auto_switch_camera(self):
+        """Automatically switch camera if availability changes"""
+        pipeline = self.registry.default
+        while True:
+            # Only follow availability changes, so a manual choice via /set_camera sticks
+            if self.config.update_camera_source():
+                source = "webcam" if self.config.CAMERA_SOURCE == "webcam" else "phonecam"
+                if self.switch_camera(pipeline, source):
+                    print(f"Switched to {source} dynamically!")
+            time.sleep(self.config.phonecam_probe_interval)
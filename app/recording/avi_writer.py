@@ -0,0 +1,67 @@
+import struct
+
+# avih flag: the file ends with an idx1 index
+AVIF_HASINDEX = 0x10
+# idx1 flag: the chunk is a keyframe (every MJPEG frame is)
+AVIIF_KEYFRAME = 0x10
+
+def chunk(fourcc, data):
+    """A RIFF chunk, padded to an even length"""
+    return fourcc + struct.pack('<I', len(data)) + data + b'\0' * (len(data) & 1)
+
+class MjpegAviWriter:
+    """
+    Writes JPEG frames into an MJPEG AVI file byte for byte, without decoding
+    or re-encoding them: an AVI's MJPG video stream is just one JPEG per chunk.
+    Every frame must have the width and height the file was opened with.
+    Frame counts and sizes in the headers are filled in by release().
+    """
+    def __init__(self, path, frame_rate, width, height):
+        self.file = open(path, 'wb')
+        self.frame_count = 0
+        self.max_frame_bytes = 0
+        self.index = []
+
+        frame_rate = max(frame_rate, 0.001)
+        avih = struct.pack('<14I', round(1e6 / frame_rate), 0, 0, AVIF_HASINDEX, 0, 0, 1, 0, width, height, 0, 0, 0, 0)
+        strh = struct.pack('<4s4sIHH8I4h', b'vids', b'MJPG', 0, 0, 0, 0, 1000, round(frame_rate * 1000),
+                           0, 0, 0, 0xFFFFFFFF, 0, 0, 0, width, height)
+        strf = struct.pack('<IiiHH4sIiiII', 40, width, height, 1, 24, b'MJPG', width * height * 3, 0, 0, 0, 0)
+        strl = b'strl' + chunk(b'strh', strh) + chunk(b'strf', strf)
+        hdrl = b'hdrl' + chunk(b'avih', avih) + chunk(b'LIST', strl)
+        header = b'RIFF\0\0\0\0AVI ' + chunk(b'LIST', hdrl) + b'LIST\0\0\0\0movi'
+
+        # Header fields only known at the end
+        self.avih_frames_at = header.index(b'avih') + 8 + 16
+        self.avih_buffer_at = header.index(b'avih') + 8 + 28
+        self.strh_length_at = header.index(b'strh') + 8 + 32
+        self.strh_buffer_at = header.index(b'strh') + 8 + 36
+        self.movi_size_at = len(header) - 8
+        # idx1 offsets count from the 'movi' fourcc
+        self.movi_start = len(header) - 4
+        self.file.write(header)
+
+    def write(self, jpeg):
+        """Append one JPEG frame"""
+        offset = self.file.tell() - self.movi_start
+        self.file.write(chunk(b'00dc', jpeg))
+        self.index.append(struct.pack('<4sIII', b'00dc', AVIIF_KEYFRAME, offset, len(jpeg)))
+        self.frame_count += 1
+        self.max_frame_bytes = max(self.max_frame_bytes, len(jpeg))
+
+    def release(self):
+        """Write the index, fill in the header and close the file"""
+        index_at = self.file.tell()
+        self.file.write(chunk(b'idx1', b''.join(self.index)))
+        end = self.file.tell()
+        for position, value in (
+            (4, end - 8),
+            (self.movi_size_at, index_at - self.movi_size_at - 4),
+            (self.avih_frames_at, self.frame_count),
+            (self.avih_buffer_at, self.max_frame_bytes),
+            (self.strh_length_at, self.frame_count),
+            (self.strh_buffer_at, self.max_frame_bytes),
+        ):
+            self.file.seek(position)
+            self.file.write(struct.pack('<I', value))
+        self.file.close()
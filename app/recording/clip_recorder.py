@@ -0,0 +1,213 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+import cv2
+from app.pipeline.frame_pool import JpegFrame, jpeg_shape
+from app.recording.avi_writer import MjpegAviWriter
+
+class ClipRecorder:
+    """
+    Records clips around events (motion, a person appearing) for one camera.
+
+    Captured frames are JPEG-compressed on the recorder's own thread into a
+    pre-roll ring buffer bounded by seconds and bytes. trigger() starts (or
+    extends) a clip: the pre-roll, the frames during the event and post_roll
+    seconds after it go to a background writer, which splits clips into
+    segments of at most segment_seconds and deletes the oldest recordings to
+    stay under quota_bytes. The writer stores the JPEGs in MJPEG AVI files as
+    they are: frames from an MJPEG camera are never decoded or re-encoded, and
+    raw frames are only encoded once, for the pre-roll.
+
+    offer() never blocks the caller: when the encoder or writer falls behind,
+    frames are dropped and counted instead.
+    """
+    def __init__(self, name, output_dir, pre_roll_seconds=5.0, post_roll_seconds=5.0,
+                 segment_seconds=60.0, quota_bytes=1024 ** 3, max_pre_roll_bytes=64 * 1024 ** 2,
+                 jpeg_quality=80, queue_size=8):
+        self.name = name
+        self.output_dir = output_dir
+        self.pre_roll_seconds = pre_roll_seconds
+        self.post_roll_seconds = post_roll_seconds
+        self.segment_seconds = segment_seconds
+        self.quota_bytes = quota_bytes
+        self.max_pre_roll_bytes = max_pre_roll_bytes
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Pre-roll of (timestamp, jpeg bytes), owned by the encoder thread
+        self.pre_roll = deque()
+        self.pre_roll_bytes = 0
+
+        # Frame rate estimated from capture timestamps, used for the clip files
+        self.frame_rate = 15.0
+        self.last_timestamp = None
+
+        # Time until which the current event keeps recording (0 = no event)
+        self.event_until = 0.0
+        self.event_reason = None
+        self.recording = False
+
+        # Raw frames waiting to be encoded, and encoded frames waiting to be written.
+        # The writer queue carries (timestamp, jpeg) items plus None to close the clip
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.writes = queue.Queue(maxsize=queue_size * 32)
+
+        # Counters, each written by one thread
+        self.dropped_frames = 0
+        self.dropped_writes = 0
+        self.clips_written = 0
+        self.segments_written = 0
+        self.bytes_written = 0
+        self.segments_deleted = 0
+
+        threading.Thread(target=self._encode_frames, daemon=True).start()
+        threading.Thread(target=self._write_clips, daemon=True).start()
+
+    def offer(self, frame):
+        """
+        Hand a captured PooledFrame to the recorder without blocking
+        The recorder takes its own reference; the caller keeps and releases its own.
+        """
+        try:
+            self.frames.put_nowait(frame.retain())
+        except queue.Full:
+            frame.release()
+            self.dropped_frames += 1
+
+    def trigger(self, reason):
+        """Start a clip, or extend the current one, for an event seen now"""
+        self.event_until = time.time() + self.post_roll_seconds
+        self.event_reason = reason
+
+    def _encode_frames(self):
+        """Compress frames into the pre-roll, and pass them on while an event is recording"""
+        while True:
+            try:
+                frame = self.frames.get(timeout=1.0)
+            except queue.Empty:
+                # No frames coming in (camera down): don't leave a finished clip open
+                if self.recording and time.time() > self.event_until:
+                    self.recording = False
+                    self._queue_write(None)
+                continue
+            try:
+                timestamp = frame.captured_at or time.time()
+                if isinstance(frame, JpegFrame):
+                    # Already compressed by the camera
+                    ret, jpeg = True, frame.jpeg
+                else:
+                    ret, buffer = cv2.imencode('.jpg', frame.array, self.encode_params)
+                    jpeg = buffer.tobytes() if ret else None
+            finally:
+                frame.release()
+            if not ret:
+                continue
+
+            if self.last_timestamp is not None and timestamp > self.last_timestamp:
+                # Smoothed so a hiccup doesn't set a clip's playback speed
+                self.frame_rate = 0.9 * self.frame_rate + 0.1 / (timestamp - self.last_timestamp)
+            self.last_timestamp = timestamp
+
+            if timestamp <= self.event_until:
+                if not self.recording:
+                    # New event: the clip starts with the pre-roll
+                    self.recording = True
+                    print(f"Recording clip for '{self.name}' ({self.event_reason})")
+                    while self.pre_roll:
+                        self._queue_write(self.pre_roll.popleft())
+                    self.pre_roll_bytes = 0
+                self._queue_write((timestamp, jpeg))
+                continue
+
+            if self.recording:
+                self.recording = False
+                self._queue_write(None)
+
+            self.pre_roll.append((timestamp, jpeg))
+            self.pre_roll_bytes += len(jpeg)
+            while self.pre_roll and (timestamp - self.pre_roll[0][0] > self.pre_roll_seconds
+                                     or self.pre_roll_bytes > self.max_pre_roll_bytes):
+                self.pre_roll_bytes -= len(self.pre_roll.popleft()[1])
+
+    def _queue_write(self, item):
+        """Queue an encoded frame (or the end-of-clip marker) for the writer; drop frames if it is behind"""
+        if item is None:
+            # The end marker must get through, or the next clip would be appended to this one
+            self.writes.put(item)
+            return
+        try:
+            self.writes.put_nowait(item)
+        except queue.Full:
+            self.dropped_writes += 1
+
+    def _write_clips(self):
+        """Write queued frames to segment files, rotating segments and enforcing the quota"""
+        writer = path = None
+        clip_start = segment_start = segment_shape = None
+        segment_index = 0
+        while True:
+            item = self.writes.get()
+            if item is None:
+                # End of the clip
+                if writer is not None:
+                    self._close_segment(writer, path)
+                if clip_start is not None:
+                    self.clips_written += 1
+                writer = clip_start = None
+                continue
+
+            timestamp, jpeg = item
+            shape = jpeg_shape(jpeg)
+            if shape is None:
+                continue
+            if writer is not None and (timestamp - segment_start >= self.segment_seconds or shape != segment_shape):
+                # Rotate: the clip carries on in a new segment file (frames in a file must share a size)
+                self._close_segment(writer, path)
+                writer = None
+                segment_index += 1
+
+            if writer is None:
+                if clip_start is None:
+                    clip_start, segment_index = timestamp, 0
+                writer, path = self._open_segment(clip_start, segment_index, shape)
+                segment_start, segment_shape = timestamp, shape
+            writer.write(jpeg)
+
+    def _open_segment(self, clip_start, segment_index, shape):
+        """Open the video file for one segment of a clip"""
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(clip_start))
+        path = os.path.join(self.output_dir, f"{self.name}_{stamp}_{segment_index:03d}.avi")
+        height, width = shape[:2]
+        return MjpegAviWriter(path, self.frame_rate, width, height), path
+
+    def _close_segment(self, writer, path):
+        """Finish a segment file and make room for the next one"""
+        writer.release()
+        self.segments_written += 1
+        try:
+            self.bytes_written += os.path.getsize(path)
+        except OSError:
+            pass
+        self._enforce_quota(keep=path)
+
+    def _enforce_quota(self, keep=None):
+        """Delete the oldest recordings (but not keep) until the directory fits in quota_bytes"""
+        recordings = []
+        for entry in os.scandir(self.output_dir):
+            if entry.is_file() and entry.name.endswith('.avi'):
+                stat = entry.stat()
+                recordings.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in recordings)
+        for _, size, path in sorted(recordings):
+            if path == keep:
+                continue
+            if total <= self.quota_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.segments_deleted += 1
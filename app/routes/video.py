@@ -1,173 +1,222 @@
-from flask import Blueprint, Response, render_template, request, jsonify
-from app.camera.webcam import Webcam
-from app.camera.phonecam import Phonecam
-from app.config import Config
-from app.detection.motion import MotionDetector
-from app.detection.object_detection import ObjectDetector
-from app.monitoring.performance import PerformanceMonitor
-import cv2
-import threading
-import time
-import numpy as np
+from flask import Blueprint, Response, render_template, request, jsonify, abort, make_response
+from app.monitoring.prometheus import REGISTRY, STREAMED_BYTES
+from app.pipeline.service import VideoService
+from app.streaming.broadcaster import StreamProfile
+from app.streaming.events import sse_message
 
 video_bp = Blueprint("video", __name__)
 
-config = Config()
-camera = Webcam() if config.CAMERA_SOURCE == "webcam" else Phonecam(config.CAMERA_SOURCE)
-motion_detector = MotionDetector()
-object_detector = ObjectDetector()
-performance_monitor = PerformanceMonitor()
-
-latest_frame = None
-latest_motion_frame = None
-latest_diff_frame = None
-latest_object_frame = None
-latest_detections = []
-lock = threading.Lock()
-
-def capture_frames():
-    """Continuously capture frames from the camera and process them."""
-    global latest_frame, latest_motion_frame, latest_diff_frame, latest_object_frame, latest_detections
-
-    while True:
-        start_time = time.time()
-        success, frame = camera.get_frame()
-        if not success or frame is None:
-            print("Error: Could not read frame!")
-            performance_monitor.record_connection_failure()
-            time.sleep(0.1)
-            continue
-
-        performance_monitor.update_frame_time()
-
-        with lock:
-            latest_frame = frame.copy()
-            
-            # Motion detection with timing
-            motion_start = time.time()
-            motion_detected, latest_diff_frame, latest_motion_frame = motion_detector.detect_motion(frame)
-            motion_latency = time.time() - motion_start
-            performance_monitor.update_motion_latency(motion_latency)
-            
-            # For motion detection accuracy, we'll use a simple heuristic:
-            # If there's significant motion (large contours), consider it a true positive
-            # This is a simplified approach - in a real system, you'd use ground truth data
-            is_true_positive = motion_detected and np.sum(latest_diff_frame) > 1000000
-            performance_monitor.update_motion_detection(motion_detected, is_true_positive)
-            
-            # Object detection with timing
-            object_start = time.time()
-            latest_object_frame, latest_detections = object_detector.detect(frame)
-            object_latency = time.time() - object_start
-            performance_monitor.update_object_latency(object_latency)
-            
-            # For object detection mAP, we'll use a simplified approach:
-            # If we detect objects with high confidence, consider them true positives
-            # In a real system, you'd use ground truth data
-            if latest_detections:
-                # Create synthetic ground truth based on detection confidence
-                ground_truth = []
-                for det in latest_detections:
-                    if det['confidence'] > 0.7:  # High confidence detections as ground truth
-                        ground_truth.append(det)
-                
-                performance_monitor.update_object_detection(latest_detections, ground_truth)
-            
-            # Record connection recovery if we successfully got a frame
-            if success:
-                performance_monitor.record_connection_recovery()
-
-def auto_switch_camera():
-    """Automatically switch camera if availability changes"""
-    global camera
-    while True:
-        config.update_camera_source()
-        new_source = config.CAMERA_SOURCE
-        if isinstance(camera, Phonecam) and new_source == "webcam":
-            performance_monitor.start_camera_switch()
-            camera = Webcam()
-            performance_monitor.end_camera_switch()
-            print("Switched to webcam dynamically!")
-        elif isinstance(camera, Webcam) and new_source.startswith("http"):
-            performance_monitor.start_camera_switch()
-            camera = Phonecam(new_source)
-            performance_monitor.end_camera_switch()
-            print(f"Switched to phone camera dynamically: {new_source}")
-        time.sleep(10)
-
-threading.Thread(target=auto_switch_camera, daemon=True).start()
-
-def generate_stream(frame_type="motion"):
-    """Yield frames for streaming based on type: 'motion', 'diff', or 'object'."""
-    while True:
-        with lock:
-            if frame_type == "motion":
-                frame = latest_motion_frame
-            elif frame_type == "diff":
-                frame = latest_diff_frame
-            elif frame_type == "object":
-                frame = latest_object_frame
-            else:
-                frame = latest_frame
-
-            if frame is None:
-                continue
-
-        # Encode the selected frame
-        ret, buffer = cv2.imencode('.jpg', frame)
-        if not ret:
-            print("Error: Could not encode frame!")
-            continue
-
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+# Cameras and the model are opened lazily, on the first request or via service.start()
+service = VideoService()
+
+@video_bp.before_app_request
+def start_service():
+    service.start()
+
+def get_pipeline(name=None):
+    """Look up a camera pipeline by name (the default camera if None); 404 if unknown, 503 while warming up"""
+    if service.state != "running":
+        abort(make_response(jsonify(service.status()), 503))
+    if name is None:
+        return service.registry.default
+    pipeline = service.registry.get(name)
+    if pipeline is None:
+        abort(404, description=f"Unknown camera '{name}'")
+    return pipeline
+
+def stream_profile():
+    """Read a viewer's width, quality and max_fps query parameters; 400 if malformed"""
+    try:
+        return StreamProfile.parse(
+            width=request.args.get('width'),
+            quality=request.args.get('quality'),
+            max_fps=request.args.get('max_fps'),
+        )
+    except ValueError:
+        abort(400, description="width and quality must be integers, max_fps a number")
+
+def generate_stream(frame_type="motion", camera_name=None):
+    """
+    Yield frames for streaming based on type: 'raw', 'motion', 'diff', or 'object'.
+    Query parameters width, quality and max_fps scale down the frames, set the
+    JPEG quality and cap the frame rate for this viewer.
+    """
+    profile = stream_profile()
+    if service.state == "running":
+        pipeline = get_pipeline(camera_name)
+        return count_streamed_bytes(pipeline.stream(frame_type, profile), f"{pipeline.name}-{frame_type}")
+    return stream_after_warmup(frame_type, camera_name, profile)
+
+def stream_after_warmup(frame_type, camera_name, profile):
+    """Hold a feed connection open while the service warms up, then start streaming"""
+    pipeline = pipeline_after_warmup(camera_name)
+    if pipeline is not None:
+        yield from count_streamed_bytes(pipeline.stream(frame_type, profile), f"{pipeline.name}-{frame_type}")
+
+def pipeline_after_warmup(camera_name):
+    """
+    Wait for the service to warm up, then look up a camera pipeline like get_pipeline()
+    The response has already started, so an unknown camera or a failed start can't
+    be a 404 or 503 any more: it is logged and None returned, to end the stream.
+    """
+    if not service.wait_until_running():
+        print(f"Ending a stream for camera '{camera_name or 'default'}': the video service failed to start")
+        return None
+    pipeline = service.registry.default if camera_name is None else service.registry.get(camera_name)
+    if pipeline is None:
+        print(f"Ending a stream requested during warm-up: unknown camera '{camera_name}'")
+    return pipeline
+
+def count_streamed_bytes(chunks, stream):
+    """Pass MJPEG chunks through, counting the bytes sent on this feed"""
+    counter = STREAMED_BYTES.labels(stream)
+    for chunk in chunks:
+        counter.inc(len(chunk))
+        yield chunk
 
 @video_bp.route("/")
 def index():
     return render_template("index.html")
 
+@video_bp.route("/status")
+def status():
+    """Return the service state: 'warming_up', 'running' or 'failed'."""
+    return jsonify(service.status())
+
+@video_bp.route("/cameras")
+def cameras():
+    """Return the names of the registered cameras."""
+    get_pipeline()
+    return jsonify({'cameras': service.registry.names()})
+
 @video_bp.route("/set_camera", methods=["POST"])
 def set_camera():
     """Switch between webcam and phone camera dynamically."""
-    global camera
     source = request.form.get("source")
+    pipeline = get_pipeline(request.form.get("camera"))
 
-    performance_monitor.start_camera_switch()
-    if source == "webcam":
-        camera = Webcam(0)
-        print("Switched to webcam")
-    elif source == "phonecam":
-        phone_url = config.phonecam_url
-        camera = Phonecam(phone_url)
-        print(f"Switched to phone camera: {phone_url}")
-    performance_monitor.end_camera_switch()
+    if source in ("webcam", "phonecam") and service.switch_camera(pipeline, source):
+        print(f"Switched to {source}")
 
     return "Camera source updated!"
 
 @video_bp.route('/video_feed')
-def video_feed():
+@video_bp.route('/camera/<camera_name>/video_feed')
+def video_feed(camera_name=None):
     """Stream the processed video with motion detection overlay."""
-    return Response(generate_stream(frame_type="motion"), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(generate_stream(frame_type="motion", camera_name=camera_name), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@video_bp.route('/raw_feed')
+@video_bp.route('/camera/<camera_name>/raw_feed')
+def raw_feed(camera_name=None):
+    """Stream the camera frames without overlays (MJPEG cameras' JPEGs pass straight through)."""
+    return Response(generate_stream(frame_type="raw", camera_name=camera_name), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @video_bp.route('/diff_feed')
-def diff_feed():
+@video_bp.route('/camera/<camera_name>/diff_feed')
+def diff_feed(camera_name=None):
     """Stream the difference mask video."""
-    return Response(generate_stream(frame_type="diff"), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(generate_stream(frame_type="diff", camera_name=camera_name), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @video_bp.route('/object_feed')
-def object_feed():
+@video_bp.route('/camera/<camera_name>/object_feed')
+def object_feed(camera_name=None):
     """Stream the video with object detection overlay."""
-    return Response(generate_stream(frame_type="object"), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(generate_stream(frame_type="object", camera_name=camera_name), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @video_bp.route('/get_detections')
-def get_detections():
+@video_bp.route('/camera/<camera_name>/get_detections')
+def get_detections(camera_name=None):
     """Return the latest object detections as JSON."""
-    with lock:
-        return {'detections': latest_detections}
+    return {'detections': get_pipeline(camera_name).get_detections().to_list()}
+
+@video_bp.route('/detections/history')
+@video_bp.route('/camera/<camera_name>/detections/history')
+def detection_history(camera_name=None):
+    """
+    Return stored detections, newest first, optionally filtered by time range and class.
+    Query parameters: start, end (epoch seconds), class (repeatable), limit, cursor.
+    Without a camera in the path, detections from every camera are returned.
+    """
+    get_pipeline(camera_name)
+    if service.detection_store is None:
+        abort(404, description="Detection history is disabled (set DETECTION_DB)")
+
+    try:
+        start = request.args.get('start', type=float)
+        end = request.args.get('end', type=float)
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+        detections, next_cursor = service.detection_store.query(
+            start=start, end=end,
+            classes=request.args.getlist('class'),
+            camera=camera_name,
+            limit=limit,
+            cursor=request.args.get('cursor'),
+        )
+    except ValueError:
+        abort(400, description="Invalid cursor")
+    return jsonify({'detections': detections, 'next_cursor': next_cursor})
+
+@video_bp.route('/metrics')
+def metrics():
+    """Return stage latency histograms, counters and queue depths in Prometheus text format."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 @video_bp.route('/get_metrics')
-def get_metrics():
-    """Return current performance metrics."""
-    return jsonify(performance_monitor.get_metrics())
-
-threading.Thread(target=capture_frames, daemon=True).start()
+@video_bp.route('/camera/<camera_name>/get_metrics')
+def get_metrics(camera_name=None):
+    """Return current performance metrics, with the load governor's degradation level."""
+    pipeline = get_pipeline(camera_name)
+    return jsonify(service.registry.metrics(pipeline))
+
+@video_bp.route('/events')
+@video_bp.route('/camera/<camera_name>/events')
+def events(camera_name=None):
+    """
+    Push the camera's detections (as they change) and metrics (once a second) as server-sent events.
+    Query parameter max_rate caps how many times a second updates are sent (10 by default);
+    changes in between are coalesced into the next send.
+    """
+    max_rate = request.args.get('max_rate', 10.0, type=float)
+    if not max_rate > 0:
+        abort(400, description="max_rate must be a positive number")
+    return Response(generate_events(camera_name, max_rate), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def generate_events(camera_name, max_rate):
+    """Yield a camera's server-sent events, holding the connection open while the service warms up"""
+    if service.state != "running":
+        return events_after_warmup(camera_name, max_rate)
+    return get_pipeline(camera_name).events.listen(max_rate)
+
+def events_after_warmup(camera_name, max_rate):
+    """
+    Hold an event stream open while the service warms up, then start listening
+    If the camera turns out not to exist, an 'error' event says so before the stream
+    ends; the browser's reconnect then gets a 404.
+    """
+    pipeline = pipeline_after_warmup(camera_name)
+    if pipeline is None:
+        yield sse_message("error", 0, service.status() if service.state != "running"
+                          else {'error': f"Unknown camera '{camera_name}'"})
+        return
+    yield from pipeline.events.listen(max_rate)
+
+@video_bp.route('/metrics/history')
+@video_bp.route('/camera/<camera_name>/metrics/history')
+def metrics_history(camera_name=None):
+    """
+    Return a camera's metrics over time, oldest first, for charting.
+    Query parameters: resolution ('1s', '1m' or '1h'), start, end (epoch seconds),
+    metric (repeatable; all by default).
+    """
+    history = get_pipeline(camera_name).history
+    try:
+        return jsonify(history.query(
+            resolution=request.args.get('resolution', '1s'),
+            start=request.args.get('start', type=float),
+            end=request.args.get('end', type=float),
+            metrics=request.args.getlist('metric'),
+        ))
+    except ValueError as e:
+        abort(400, description=str(e))
@@ -0,0 +1,194 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    camera TEXT NOT NULL,
+    class TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    x1 INTEGER NOT NULL, y1 INTEGER NOT NULL, x2 INTEGER NOT NULL, y2 INTEGER NOT NULL,
+    track_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS detections_timestamp ON detections (timestamp);
+CREATE INDEX IF NOT EXISTS detections_class_timestamp ON detections (class, timestamp);
+CREATE INDEX IF NOT EXISTS detections_camera_timestamp ON detections (camera, timestamp);
+"""
+
+class DetectionStore:
+    """
+    Persistent log of object detections in SQLite (WAL mode).
+
+    record() only queues the detections; a background thread writes them in
+    batches of up to batch_size rows, or every flush_interval seconds, in one
+    transaction each. If the writer falls behind, the queue fills up and
+    further detections are dropped and counted rather than blocking the caller.
+    With retention_days, the writer also deletes rows older than that when it
+    starts and then at most once every prune_interval seconds.
+
+    Queries use their own connection per thread and, thanks to WAL, run
+    alongside the writer. Results are newest first and paginated with a
+    (timestamp, id) cursor, so every page is an index range scan however far
+    back the history goes.
+    """
+    def __init__(self, path, batch_size=500, flush_interval=1.0, queue_size=10000,
+                 retention_days=0, prune_interval=3600.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Days of history kept (0 keeps everything)
+        self.retention_days = retention_days
+        self.prune_interval = prune_interval
+        self.pending = queue.Queue(maxsize=queue_size)
+        self.local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(detections)")]
+        if 'track_id' not in columns:
+            # Databases created before tracking was added
+            connection.execute("ALTER TABLE detections ADD COLUMN track_id INTEGER")
+        connection.close()
+
+        # Counters, written by the recording thread and the writer thread respectively
+        self.dropped = 0
+        self.rows_written = 0
+        self.rows_pruned = 0
+
+        threading.Thread(target=self._write_batches, daemon=True).start()
+
+    def record(self, camera, timestamp, detections):
+        """Queue one frame's Detections for writing; never blocks"""
+        if not detections:
+            return
+        try:
+            self.pending.put_nowait((camera, timestamp, detections))
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_batches(self):
+        """Drain the queue into the database, one transaction per batch"""
+        connection = sqlite3.connect(self.path)
+        # WAL only needs the log synced at checkpoints; a crash loses at most the last batch
+        connection.execute("PRAGMA synchronous=NORMAL")
+        next_prune = 0
+        while True:
+            if self.retention_days > 0 and time.time() >= next_prune:
+                self._prune(connection)
+                next_prune = time.time() + self.prune_interval
+            rows = self._rows(*self.pending.get())
+            deadline = time.time() + self.flush_interval
+            while len(rows) < self.batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    rows.extend(self._rows(*self.pending.get(timeout=timeout)))
+                except queue.Empty:
+                    break
+
+            try:
+                with connection:
+                    connection.executemany(
+                        "INSERT INTO detections (timestamp, camera, class, confidence, x1, y1, x2, y2, track_id) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                self.rows_written += len(rows)
+            except sqlite3.Error as e:
+                print(f"Error writing detections: {str(e)}")
+
+    def _prune(self, connection):
+        """Delete detections older than the retention period (writer thread)"""
+        try:
+            with connection:
+                deleted = connection.execute(
+                    "DELETE FROM detections WHERE timestamp < ?",
+                    (time.time() - self.retention_days * 86400,),
+                ).rowcount
+            self.rows_pruned += deleted
+        except sqlite3.Error as e:
+            print(f"Error pruning detections: {str(e)}")
+
+    def _rows(self, camera, timestamp, detections):
+        """Flatten one frame's Detections into insert rows"""
+        return [
+            (timestamp, camera, detections.class_name(class_id), confidence, x1, y1, x2, y2,
+             track_id if track_id >= 0 else None)
+            for x1, y1, x2, y2, confidence, class_id, track_id in detections.rows()
+        ]
+
+    def _connection(self):
+        """Read connection for the calling thread"""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            connection.row_factory = sqlite3.Row
+            self.local.connection = connection
+        return connection
+
+    def query(self, start=None, end=None, classes=None, camera=None, limit=100, cursor=None):
+        """
+        Return detections between start and end (epoch seconds), newest first
+        classes and camera optionally narrow the search; cursor is the
+        next_cursor of the previous page.
+        Returns: (list of detection dicts, next_cursor or None)
+        """
+        conditions, params = [], []
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("timestamp < ?")
+            params.append(end)
+        if classes:
+            conditions.append(f"class IN ({', '.join('?' * len(classes))})")
+            params.extend(classes)
+        if camera is not None:
+            conditions.append("camera = ?")
+            params.append(camera)
+        if cursor is not None:
+            cursor_timestamp, cursor_id = self.parse_cursor(cursor)
+            conditions.append("(timestamp < ? OR (timestamp = ? AND id < ?))")
+            params.extend([cursor_timestamp, cursor_timestamp, cursor_id])
+
+        sql = "SELECT * FROM detections"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        # One extra row tells us whether there is another page
+        params.append(limit + 1)
+
+        rows = self._connection().execute(sql, params).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1]['timestamp']!r}:{rows[-1]['id']}"
+
+        detections = [
+            {
+                'id': row['id'],
+                'timestamp': row['timestamp'],
+                'camera': row['camera'],
+                'class': row['class'],
+                'confidence': row['confidence'],
+                'bbox': (row['x1'], row['y1'], row['x2'], row['y2']),
+                'track_id': row['track_id'],
+            }
+            for row in rows
+        ]
+        return detections, next_cursor
+
+    @staticmethod
+    def parse_cursor(cursor):
+        """Split a 'timestamp:id' cursor; raises ValueError if malformed"""
+        timestamp, _, row_id = cursor.partition(":")
+        return float(timestamp), int(row_id)
@@ -0,0 +1,81 @@
+import asyncio
+from urllib.parse import parse_qs
+from app.streaming.broadcaster import DEFAULT_PROFILE, StreamProfile
+
+MJPEG_HEADERS = [
+    (b'content-type', b'multipart/x-mixed-replace; boundary=frame'),
+    (b'cache-control', b'no-cache'),
+]
+
+async def wait_for_disconnect(receive):
+    """Return once the client has gone away"""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+async def send_text(send, status, text):
+    """Send a complete plain-text response"""
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+    await send({'type': 'http.response.body', 'body': text.encode()})
+
+def parse_max_rate(query_string, default=10.0):
+    """An events max_rate from an ASGI query string; raises ValueError unless it's a positive number"""
+    args = parse_qs(query_string.decode('latin-1'))
+    max_rate = float(args['max_rate'][0]) if 'max_rate' in args else default
+    if not max_rate > 0:
+        raise ValueError("max_rate must be a positive number")
+    return max_rate
+
+def parse_profile(query_string):
+    """StreamProfile from an ASGI query string; raises ValueError if malformed"""
+    args = parse_qs(query_string.decode('latin-1'))
+    return StreamProfile.parse(**{
+        name: args[name][0] for name in ('width', 'quality', 'max_fps') if name in args
+    })
+
+SSE_HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+async def serve_feed(broadcaster, receive, send, streamed_bytes=None, skipped=None, profile=DEFAULT_PROFILE):
+    """
+    Stream a FrameBroadcaster to one ASGI client as MJPEG
+    Each chunk is awaited through send(), so a slow client holds up only its
+    own coroutine and then picks up the newest frame; nothing is queued for it.
+    streamed_bytes and skipped are optional counters this client adds to.
+    """
+    await serve_stream(broadcaster.stream_async(skipped, profile), receive, send, MJPEG_HEADERS, streamed_bytes)
+
+async def serve_events(channel, receive, send, max_rate=10.0):
+    """Stream an EventChannel to one ASGI client as server-sent events"""
+    await serve_stream(channel.listen_async(max_rate), receive, send, SSE_HEADERS)
+
+async def serve_stream(chunks, receive, send, headers, streamed_bytes=None):
+    """Send an endless async generator's chunks as a streaming response until the client goes away"""
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    next_chunk = None
+    try:
+        while True:
+            next_chunk = asyncio.ensure_future(chunks.__anext__())
+            await asyncio.wait({next_chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_chunk.done():
+                break
+            chunk = next_chunk.result()
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if streamed_bytes is not None:
+                streamed_bytes.inc(len(chunk))
+            if disconnected.done():
+                break
+    finally:
+        disconnected.cancel()
+        if next_chunk is not None and not next_chunk.done():
+            # Let the generator unwind before closing it
+            next_chunk.cancel()
+            await asyncio.gather(next_chunk, return_exceptions=True)
+        await chunks.aclose()
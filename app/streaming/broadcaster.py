@@ -0,0 +1,274 @@
+import asyncio
+import cv2
+import numpy as np
+import threading
+import time
+from collections import OrderedDict
+from app.monitoring.prometheus import ENCODE_SECONDS
+from app.pipeline.frame_pool import JpegFrame, as_pooled, dct_factor
+
+class StreamProfile:
+    """
+    What one viewer asked for: output width (None = native), JPEG quality
+    (None = the feed's default) and a frame rate cap (None = every frame).
+
+    Width and quality are snapped to coarse steps so that viewers asking for
+    nearly the same thing share one encoded variant.
+    """
+    WIDTH_STEP = 16
+    QUALITY_STEP = 5
+
+    def __init__(self, width=None, quality=None, max_fps=None):
+        if width is not None:
+            width = max(self.WIDTH_STEP, round(width / self.WIDTH_STEP) * self.WIDTH_STEP)
+        if quality is not None:
+            quality = min(max(round(quality / self.QUALITY_STEP) * self.QUALITY_STEP, 10), 100)
+        if max_fps is not None and max_fps <= 0:
+            max_fps = None
+        self.width = width
+        self.quality = quality
+        self.max_fps = max_fps
+
+    @classmethod
+    def parse(cls, width=None, quality=None, max_fps=None):
+        """Build a profile from query string values; raises ValueError if one is malformed"""
+        return cls(
+            width=int(width) if width else None,
+            quality=int(quality) if quality else None,
+            max_fps=float(max_fps) if max_fps else None,
+        )
+
+    def variant_key(self, frame_width, default_quality):
+        """The (width, quality) variant this profile gets for frames frame_width pixels wide"""
+        width = self.width if self.width is not None and self.width < frame_width else None
+        return width, self.quality or default_quality
+
+DEFAULT_PROFILE = StreamProfile()
+
+class EncodedVariant:
+    """The latest encoding of a feed at one (width, quality)"""
+    def __init__(self, width, quality):
+        self.width = width
+        self.quality = quality
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        self.lock = threading.Lock()
+        # (seq, jpeg) as one tuple so it can be read without the lock
+        self.encoded = (0, None)
+        # Reused resize target, guarded by the lock
+        self.resized = None
+
+class FrameBroadcaster:
+    """
+    Shares one feed between any number of MJPEG viewers.
+    Each published frame is JPEG-encoded at most once per variant (output
+    width and quality), by the first viewer that asks for it, and every
+    viewer blocks until a newer frame arrives. Viewers with a frame rate cap
+    just wait longer between frames and always get the newest one. Frames
+    that arrived as JPEGs (JpegFrame) are served as they are at full size.
+
+    Viewers on an asyncio event loop (the ASGI server mode) use stream_async():
+    they share one future per loop, which publish() resolves, so hundreds of
+    them cost no threads. Every viewer always takes the newest frame, so a slow
+    one skips frames rather than having them buffered.
+    """
+    def __init__(self, name, jpeg_quality=95, max_variants=8):
+        self.name = name
+        self.jpeg_quality = jpeg_quality
+
+        self.condition = threading.Condition()
+        self.seq = 0
+        self.frame = None
+
+        # Encoded variants by (width, quality), least recently used first
+        self.variants = OrderedDict()
+        self.variants_lock = threading.Lock()
+        self.max_variants = max_variants
+        self.encode_seconds = ENCODE_SECONDS.labels(name)
+
+        # Event loops with async viewers waiting, mapped to the future they wait on
+        self.loop_waiters = {}
+        # Viewers currently streaming, so producers can skip drawing feeds nobody watches
+        self.viewers = 0
+
+    def publish(self, frame):
+        """
+        Publish a new frame; the caller must not modify it afterwards
+        The broadcaster takes its own reference to a PooledFrame, so the caller
+        still releases its reference as usual.
+        """
+        if frame is None:
+            return
+        frame = as_pooled(frame).retain()
+        with self.condition:
+            previous, self.frame = self.frame, frame
+            self.seq += 1
+            self.condition.notify_all()
+            waiting_loops = list(self.loop_waiters) if self.loop_waiters else ()
+        if previous is not None:
+            previous.release()
+        for loop in waiting_loops:
+            try:
+                loop.call_soon_threadsafe(self._wake_loop, loop)
+            except RuntimeError:
+                # The loop has been closed
+                with self.condition:
+                    self.loop_waiters.pop(loop, None)
+
+    def _wake_loop(self, loop):
+        """Wake every async viewer on loop (runs on that loop)"""
+        with self.condition:
+            future = self.loop_waiters.pop(loop, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def wait_for_frame(self, last_seq, timeout=1.0, profile=DEFAULT_PROFILE):
+        """
+        Block until a frame newer than last_seq is available
+        Returns: (seq, jpeg bytes), or (last_seq, None) on timeout
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.seq > last_seq, timeout=timeout):
+                return last_seq, None
+            # Hold a reference so the buffer isn't recycled while encoding
+            seq, frame = self.seq, self.frame.retain()
+
+        try:
+            return self._encode(seq, frame, self._variant(profile, frame))
+        finally:
+            frame.release()
+
+    async def wait_for_frame_async(self, last_seq, timeout=1.0, profile=DEFAULT_PROFILE):
+        """
+        Wait on the running event loop until a frame newer than last_seq is available
+        Encoding, when no other viewer has done it yet, runs on a worker thread.
+        Returns: (seq, jpeg bytes), or (last_seq, None) on timeout
+        """
+        loop = asyncio.get_running_loop()
+        with self.condition:
+            future = None
+            if self.seq <= last_seq:
+                future = self.loop_waiters.get(loop)
+                if future is None:
+                    future = self.loop_waiters[loop] = loop.create_future()
+        if future is not None:
+            try:
+                # Shielded: the future is shared by every viewer on this loop
+                await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                return last_seq, None
+
+        with self.condition:
+            if self.seq <= last_seq:
+                return last_seq, None
+            seq, frame = self.seq, self.frame.retain()
+
+        try:
+            variant = self._variant(profile, frame)
+            encoded = variant.encoded
+            if encoded[0] >= seq:
+                return encoded
+            return await loop.run_in_executor(None, self._encode, seq, frame, variant)
+        finally:
+            frame.release()
+
+    def _variant(self, profile, frame):
+        """Get (or create) the encoded variant a profile maps to, evicting the least recently used"""
+        key = profile.variant_key(frame.shape[1], self.jpeg_quality)
+        with self.variants_lock:
+            variant = self.variants.get(key)
+            if variant is None:
+                variant = self.variants[key] = EncodedVariant(*key)
+                if len(self.variants) > self.max_variants:
+                    self.variants.popitem(last=False)
+            else:
+                self.variants.move_to_end(key)
+        return variant
+
+    def _encode(self, seq, frame, variant):
+        """Encode the frame for seq unless a viewer already encoded this variant of it (or a newer one)"""
+        with variant.lock:
+            if variant.encoded[0] >= seq:
+                return variant.encoded
+
+            if isinstance(frame, JpegFrame) and variant.width is None and variant.quality == self.jpeg_quality:
+                # The camera's own JPEG goes out as it is
+                variant.encoded = (seq, frame.jpeg)
+                return variant.encoded
+
+            encode_start = time.time()
+            if isinstance(frame, JpegFrame) and variant.width is not None:
+                # Decode straight at a reduced scale instead of decoding in full and shrinking
+                image = frame.decoded(dct_factor(variant.width / frame.shape[1]))
+            else:
+                image = frame.array
+            if variant.width is not None:
+                height = max(1, round(image.shape[0] * variant.width / image.shape[1]))
+                if variant.resized is None or variant.resized.shape[:2] != (height, variant.width):
+                    variant.resized = np.empty((height, variant.width) + image.shape[2:], image.dtype)
+                cv2.resize(image, (variant.width, height), dst=variant.resized, interpolation=cv2.INTER_AREA)
+                image = variant.resized
+            ret, buffer = cv2.imencode('.jpg', image, variant.encode_params)
+            self.encode_seconds.observe(time.time() - encode_start)
+            if not ret:
+                print(f"Error: Could not encode {self.name} frame!")
+                return seq, None
+
+            variant.encoded = (seq, buffer.tobytes())
+            return variant.encoded
+
+    def _add_viewer(self, count):
+        with self.condition:
+            self.viewers += count
+
+    def stream(self, profile=DEFAULT_PROFILE):
+        """Yield multipart MJPEG chunks for one viewer"""
+        last_seq = 0
+        next_frame_at = 0.0
+        self._add_viewer(1)
+        try:
+            while True:
+                if profile.max_fps:
+                    delay = next_frame_at - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                last_seq, jpeg = self.wait_for_frame(last_seq, profile=profile)
+                if jpeg is None:
+                    continue
+                if profile.max_fps:
+                    next_frame_at = time.time() + 1.0 / profile.max_fps
+
+                yield multipart_chunk(jpeg)
+        finally:
+            self._add_viewer(-1)
+
+    async def stream_async(self, skipped=None, profile=DEFAULT_PROFILE):
+        """
+        Yield multipart MJPEG chunks for one viewer on an event loop
+        skipped is an optional counter for the frames this viewer missed by
+        being slow; frames left out by its frame rate cap don't count.
+        """
+        last_seq = 0
+        next_frame_at = 0.0
+        self._add_viewer(1)
+        try:
+            while True:
+                if profile.max_fps:
+                    delay = next_frame_at - time.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                seq, jpeg = await self.wait_for_frame_async(last_seq, profile=profile)
+                if jpeg is None:
+                    continue
+                if profile.max_fps:
+                    next_frame_at = time.time() + 1.0 / profile.max_fps
+                elif skipped is not None and last_seq and seq > last_seq + 1:
+                    skipped.inc(seq - last_seq - 1)
+                last_seq = seq
+                yield multipart_chunk(jpeg)
+        finally:
+            self._add_viewer(-1)
+
+def multipart_chunk(jpeg):
+    """Wrap one JPEG as a part of a multipart/x-mixed-replace stream"""
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import threading
+import time
+
+def to_json(value):
+    """json.dumps fallback for Detections and numpy scalars"""
+    if hasattr(value, 'to_list'):
+        return value.to_list()
+    return float(value)
+
+def sse_message(event, seq, data):
+    """One server-sent event"""
+    return f"event: {event}\nid: {seq}\ndata: {json.dumps(data, default=to_json)}\n\n".encode()
+
+# Sent when nothing has changed for a while, so proxies keep the connection open
+KEEPALIVE = b": keepalive\n\n"
+
+class EventChannel:
+    """
+    Pushes one camera's detections and metrics to dashboards as server-sent events.
+
+    publish() just swaps in the latest value of an event type (e.g. 'detections',
+    'metrics') and wakes the listeners; nothing is serialized on the pipeline
+    threads. Every listener sends the newest value of each type that changed
+    since its last send, so updates are coalesced per client: a slow client
+    skips the values it missed rather than queueing them. Each value is
+    serialized once, by the first listener that sends it.
+    """
+    def __init__(self, name, keepalive_seconds=15.0):
+        self.name = name
+        self.keepalive_seconds = keepalive_seconds
+        self.condition = threading.Condition()
+        self.seq = 0
+        # Event type -> [seq, data, message bytes or None until serialized]
+        self.latest = {}
+        # Event loop -> future shared by every async listener on it, like FrameBroadcaster
+        self.loop_waiters = {}
+        self.listeners = 0
+
+    def publish(self, event, data):
+        """Replace the latest value of an event type; data must not be modified afterwards"""
+        with self.condition:
+            self.seq += 1
+            self.latest[event] = [self.seq, data, None]
+            self.condition.notify_all()
+            waiting_loops = list(self.loop_waiters) if self.loop_waiters else ()
+        for loop in waiting_loops:
+            try:
+                loop.call_soon_threadsafe(self._wake_loop, loop)
+            except RuntimeError:
+                # The loop has been closed
+                with self.condition:
+                    self.loop_waiters.pop(loop, None)
+
+    def _wake_loop(self, loop):
+        """Wake every async listener on loop (runs on that loop)"""
+        with self.condition:
+            future = self.loop_waiters.pop(loop, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def _changes(self, last_seq):
+        """
+        Serialized events newer than last_seq, oldest first; call with the condition held
+        Returns: (newest seq, message bytes)
+        """
+        changed = sorted((entry for entry in self.latest.items() if entry[1][0] > last_seq),
+                         key=lambda entry: entry[1][0])
+        messages = []
+        for event, entry in changed:
+            if entry[2] is None:
+                entry[2] = sse_message(event, entry[0], entry[1])
+            messages.append(entry[2])
+        return self.seq, b''.join(messages)
+
+    def _add_listener(self, count):
+        with self.condition:
+            self.listeners += count
+
+    def listen(self, max_rate=10.0):
+        """Yield server-sent event chunks for one client, at most max_rate times a second"""
+        last_seq = 0
+        self._add_listener(1)
+        try:
+            while True:
+                with self.condition:
+                    if not self.condition.wait_for(lambda: self.seq > last_seq, timeout=self.keepalive_seconds):
+                        chunk = KEEPALIVE
+                    else:
+                        last_seq, chunk = self._changes(last_seq)
+                yield chunk
+                if max_rate:
+                    time.sleep(1.0 / max_rate)
+        finally:
+            self._add_listener(-1)
+
+    async def listen_async(self, max_rate=10.0):
+        """Yield server-sent event chunks for one client on an event loop, at most max_rate times a second"""
+        loop = asyncio.get_running_loop()
+        last_seq = 0
+        self._add_listener(1)
+        try:
+            while True:
+                with self.condition:
+                    future = None
+                    if self.seq <= last_seq:
+                        future = self.loop_waiters.get(loop)
+                        if future is None:
+                            future = self.loop_waiters[loop] = loop.create_future()
+                if future is not None:
+                    try:
+                        # Shielded: the future is shared by every listener on this loop
+                        await asyncio.wait_for(asyncio.shield(future), self.keepalive_seconds)
+                    except asyncio.TimeoutError:
+                        yield KEEPALIVE
+                        continue
+
+                with self.condition:
+                    if self.seq <= last_seq:
+                        continue
+                    last_seq, chunk = self._changes(last_seq)
+                yield chunk
+                if max_rate:
+                    await asyncio.sleep(1.0 / max_rate)
+        finally:
+            self._add_listener(-1)
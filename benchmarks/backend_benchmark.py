@@ -0,0 +1,166 @@
+"""
+Latency comparison and parity check of the ObjectDetector inference backends.
+Every backend runs the same images; detections are matched against the
+PyTorch ('torch') backend by class and IoU. The script exits with status 1
+if any backend's parity is below --min-iou or --min-match on any image.
+
+Usage: python -m benchmarks.backend_benchmark [--backends torch onnx openvino] [--int8]
+                                              [--threads 4] [--imgsz 640] [--runs 50] [images ...]
+                                              [--workers 1 2 4] [--min-iou 0.85] [--min-match 0.9]
+Without images, the sample images bundled with ultralytics are used.
+With --workers, the first backend's throughput is also measured through a
+ProcessPoolDetector with each number of worker processes, against in-process.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import cv2
+import numpy as np
+from app.detection.object_detection import ObjectDetector
+from app.detection.process_pool import ProcessPoolDetector
+
+def box_iou(a, b):
+    """IoU of two (x1, y1, x2, y2) boxes"""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0
+
+def compare(reference, candidate):
+    """Match candidate detections to reference ones by class and best IoU"""
+    matched, ious, confidence_diffs = 0, [], []
+    for ref in reference:
+        best = max(
+            (det for det in candidate if det['class'] == ref['class']),
+            key=lambda det: box_iou(ref['bbox'], det['bbox']),
+            default=None,
+        )
+        if best is not None and box_iou(ref['bbox'], best['bbox']) > 0.5:
+            matched += 1
+            ious.append(box_iou(ref['bbox'], best['bbox']))
+            confidence_diffs.append(abs(ref['confidence'] - best['confidence']))
+    return {
+        'reference_detections': len(reference),
+        'candidate_detections': len(candidate),
+        'matched': matched,
+        # Matched share of the larger of the two sets, so both missed and extra detections count
+        'match_ratio': matched / max(len(reference), len(candidate)) if reference or candidate else 1.0,
+        'mean_iou': float(np.mean(ious)) if ious else None,
+        'max_confidence_diff': float(np.max(confidence_diffs)) if confidence_diffs else None,
+    }
+
+def parity_failures(report, min_iou, min_match):
+    """Describe every (backend, image) whose parity is below the thresholds"""
+    failures = []
+    for name, result in report['backends'].items():
+        for path, parity in result.get('parity', {}).items():
+            if parity['match_ratio'] < min_match:
+                failures.append(f"{name} on {path}: match ratio {parity['match_ratio']:.2f} < {min_match}")
+            if parity['mean_iou'] is not None and parity['mean_iou'] < min_iou:
+                failures.append(f"{name} on {path}: mean IoU {parity['mean_iou']:.2f} < {min_iou}")
+    return failures
+
+def load_images(paths):
+    if not paths:
+        from ultralytics.utils import ASSETS
+        paths = [str(ASSETS / 'bus.jpg'), str(ASSETS / 'zidane.jpg')]
+    return {path: cv2.imread(path) for path in paths}
+
+def benchmark(detector, images, runs, warmup=5):
+    """Time detect() over every image; returns latency stats in ms and the detections"""
+    frames = list(images.values())
+    for i in range(warmup):
+        detector.detect(frames[i % len(frames)])
+
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        detector.detect(frames[i % len(frames)])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    detections = {path: detector.detect(frame)[1] for path, frame in images.items()}
+    stats = {
+        'mean_ms': float(np.mean(latencies)),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+    }
+    return stats, detections
+
+def pool_throughput(detector, images, runs):
+    """Frames per second with every frame submitted without waiting; results are consumed in order"""
+    frames = list(images.values())
+    # Warm every worker up
+    for i in range(2 * detector.workers):
+        detector.detect_batch([frames[i % len(frames)]], draw=False)
+
+    results = detector.results()
+    consumer = threading.Thread(target=lambda: [next(results) for _ in range(runs)])
+    start = time.perf_counter()
+    consumer.start()
+    for i in range(runs):
+        detector.submit([frames[i % len(frames)]])
+    consumer.join()
+    return runs / (time.perf_counter() - start)
+
+def in_process_throughput(detector, images, runs):
+    """Frames per second with detect() in a loop"""
+    frames = list(images.values())
+    start = time.perf_counter()
+    for i in range(runs):
+        detector.detect(frames[i % len(frames)])
+    return runs / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('images', nargs='*')
+    parser.add_argument('--backends', nargs='+', default=['torch', 'onnx', 'openvino'])
+    parser.add_argument('--int8', action='store_true', help='use INT8-quantized exports for onnx/openvino')
+    parser.add_argument('--threads', type=int, default=0)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--workers', type=int, nargs='*', default=[], help='worker process counts to measure throughput with')
+    parser.add_argument('--min-iou', type=float, default=0.85, help='lowest acceptable mean IoU of matched detections')
+    parser.add_argument('--min-match', type=float, default=0.9, help='lowest acceptable share of detections matched by class')
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    backends = ['torch'] + [name for name in args.backends if name != 'torch']
+
+    report = {'images': list(images), 'imgsz': args.imgsz, 'threads': args.threads, 'backends': {}}
+    reference = None
+    for name in backends:
+        try:
+            detector = ObjectDetector(backend=name, imgsz=args.imgsz, threads=args.threads, int8=args.int8)
+        except ImportError as e:
+            report['backends'][name] = {'skipped': f"missing dependency: {e.name}"}
+            continue
+
+        stats, detections = benchmark(detector, images, args.runs)
+        result = {'latency': stats}
+        if reference is None:
+            reference = detections
+        else:
+            result['parity'] = {path: compare(reference[path], detections[path]) for path in images}
+        report['backends'][name] = result
+
+        if args.workers and 'throughput_fps' not in report:
+            report['throughput_fps'] = {'backend': name, 'in_process': in_process_throughput(detector, images, args.runs)}
+            for workers in args.workers:
+                pool = ProcessPoolDetector(workers=workers, backend=name, imgsz=args.imgsz,
+                                           threads=args.threads, int8=args.int8)
+                report['throughput_fps'][f'{workers}_workers'] = pool_throughput(pool, images, args.runs)
+                pool.close()
+
+    print(json.dumps(report, indent=2))
+
+    failures = parity_failures(report, args.min_iou, args.min_match)
+    for failure in failures:
+        print(f"Parity mismatch: {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Per-frame memory allocation of the capture -> motion -> overlay path,
+comparing the old copy-per-stage handoff with pooled, reference-counted frames.
+
+Usage: python -m benchmarks.frame_alloc_benchmark [--frames 300] [--width 1280] [--height 720]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+import numpy as np
+from app.detection.motion import MotionDetector
+from app.pipeline.frame_pool import FramePool
+
+def make_source_frames(width, height, count=30):
+    """Synthetic clip: a bright block moving across a noisy background"""
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 40, (height, width, 3), dtype=np.uint8)
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        x = (i * width // count) % (width - width // 8)
+        frame[height // 3:height // 3 + height // 4, x:x + width // 8] = 255
+        frames.append(frame)
+    return frames
+
+def run_copy_path(sources, frames):
+    """Each stage copies the frame and OpenCV allocates every output"""
+    detector = MotionDetector()
+    latest = None
+
+    def step(i):
+        nonlocal latest
+        frame = sources[i % len(sources)].copy()  # camera read allocates a new array
+        _, diff, motion, _ = detector.detect_motion(frame.copy())
+        overlay = frame.copy()  # object overlay drawn on a copy
+        latest = (frame, diff, motion, overlay)  # held by the feeds until replaced
+
+    return measure(step, frames)
+
+def run_pooled_path(sources, frames):
+    """Frames are read into pooled buffers and outputs drawn into pooled dst buffers"""
+    detector = MotionDetector()
+    camera_pool, motion_pool, diff_pool, object_pool = (FramePool(name) for name in ("camera", "motion", "diff", "object"))
+    latest = []
+
+    def step(i):
+        nonlocal latest
+        source = sources[i % len(sources)]
+        frame = camera_pool.acquire(source.shape)
+        np.copyto(frame.array, source)  # stands in for cap.read(buffer)
+        frame.freeze()
+
+        motion = motion_pool.acquire(frame.shape)
+        diff = diff_pool.acquire(frame.shape)
+        detector.detect_motion(frame.array, dst=motion.array, mask_dst=diff.array)
+
+        overlay = object_pool.acquire(frame.shape)
+        np.copyto(overlay.array, frame.array)
+
+        # The feeds hold the newest frames and release the ones they replace
+        for held in latest:
+            held.release()
+        latest = [frame, motion.freeze(), diff.freeze(), overlay.freeze()]
+
+    result = measure(step, frames)
+    result['pool_allocations'] = sum(pool.allocations for pool in (camera_pool, motion_pool, diff_pool, object_pool))
+    return result
+
+def measure(step, frames, warmup=20):
+    """Run step once per frame and record transient allocation and time per frame"""
+    for i in range(warmup):
+        step(i)
+
+    peaks = []
+    start = time.perf_counter()
+    for i in range(frames):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        step(warmup + i)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'mean_alloc_bytes_per_frame': float(np.mean(peaks)),
+        'max_alloc_bytes_per_frame': int(np.max(peaks)),
+        'ms_per_frame': elapsed / frames * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    args = parser.parse_args()
+
+    sources = make_source_frames(args.width, args.height)
+    tracemalloc.start()
+    report = {
+        'resolution': f"{args.width}x{args.height}",
+        'frames': args.frames,
+        'copy': run_copy_path(sources, args.frames),
+        'pooled': run_pooled_path(sources, args.frames),
+    }
+    tracemalloc.stop()
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
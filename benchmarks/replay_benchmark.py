@@ -0,0 +1,163 @@
+"""
+Replay recorded clips through MotionDetector and ObjectDetector without a camera.
+Each frame is decoded, run through motion detection, object detection and JPEG
+encoding in turn; the report has FPS, per-stage latency percentiles and peak RSS.
+
+Usage: python -m benchmarks.replay_benchmark [clips ...] [--realtime] [--max-frames 300]
+                                             [--no-objects] [--backend torch] [--imgsz 640]
+                                             [--roi] [--motion-scale 1.0] [--gate]
+Without clips, a synthetic clip is written to a temporary file and replayed.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+from app.camera.filecam import FileCamera
+from app.detection.gating import DetectionGate
+from app.detection.motion import MotionDetector
+from app.pipeline.frame_pool import FramePool
+
+STAGES = ('decode', 'motion', 'inference', 'encode', 'total')
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def write_synthetic_clip(path, frames=150, width=1280, height=720, fps=30):
+    """Write a clip of a bright block moving over a noisy background"""
+    from benchmarks.frame_alloc_benchmark import make_source_frames
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    sources = make_source_frames(width, height, count=30)
+    for i in range(frames):
+        writer.write(sources[i % len(sources)])
+    writer.release()
+
+def summarize(latencies):
+    """Latency percentiles in ms"""
+    if not latencies:
+        return None
+    ms = np.array(latencies) * 1000
+    return {
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max()),
+    }
+
+def replay(path, args, object_detector=None):
+    """Run one clip through the stages; returns its report entry"""
+    camera = FileCamera(path, realtime=args.realtime, loop=False)
+    motion_detector = MotionDetector(analysis_scale=args.motion_scale)
+    gate = DetectionGate(mode='motion' if args.gate else 'always')
+    # Frames are read-only once decoded; overlays go into pooled buffers as in CameraPipeline
+    overlay_pool, mask_pool, object_pool = FramePool("overlay"), FramePool("mask"), FramePool("object")
+    encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), 95]
+    latencies = {stage: [] for stage in STAGES}
+    frames = detections = 0
+    last_frame = None
+
+    start = time.perf_counter()
+    while frames < args.max_frames and not camera.finished:
+        frame_start = time.perf_counter()
+        success, frame = camera.get_frame_ref()
+        if not success or frame is None:
+            if camera.finished:
+                break
+            time.sleep(0.001)
+            continue
+        if frame is last_frame:
+            # Realtime mode: the next frame hasn't been decoded yet
+            frame.release()
+            time.sleep(0.001)
+            continue
+        last_frame = frame
+        # In realtime mode decoding happens on the reader thread
+        decode_end = time.perf_counter()
+        latencies['decode'].append(frame.read_seconds if args.realtime else decode_end - frame_start)
+
+        overlay, mask = overlay_pool.acquire(frame.shape), mask_pool.acquire(frame.shape)
+        motion_start = time.perf_counter()
+        motion_detected, _, _, rois = motion_detector.detect_motion(frame.array, dst=overlay.array, mask_dst=mask.array)
+        latencies['motion'].append(time.perf_counter() - motion_start)
+        gate.update_motion(motion_detected)
+
+        if object_detector is not None and gate.should_detect():
+            object_frame = object_pool.acquire(frame.shape)
+            inference_start = time.perf_counter()
+            _, found = object_detector.detect(frame.array, rois=rois, dst=object_frame.array)
+            latencies['inference'].append(time.perf_counter() - inference_start)
+            detections += len(found)
+            object_frame.release()
+
+        encode_start = time.perf_counter()
+        cv2.imencode('.jpg', overlay.array, encode_params)
+        latencies['encode'].append(time.perf_counter() - encode_start)
+
+        overlay.release()
+        mask.release()
+        frame.release()
+        latencies['total'].append(time.perf_counter() - (decode_end if args.realtime else frame_start))
+        frames += 1
+    elapsed = time.perf_counter() - start
+    camera.stop()
+
+    return {
+        'clip': path,
+        'native_fps': camera.fps,
+        'frames': frames,
+        'fps': frames / elapsed if elapsed > 0 else 0,
+        'detections': detections,
+        'inferences': len(latencies['inference']),
+        'latency': {stage: summarize(values) for stage, values in latencies.items()},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('clips', nargs='*')
+    parser.add_argument('--realtime', action='store_true', help='decode at the native frame rate instead of max speed')
+    parser.add_argument('--max-frames', type=int, default=300, help='frames per clip')
+    parser.add_argument('--no-objects', action='store_true', help='skip object detection')
+    parser.add_argument('--backend', default='torch')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--roi', action='store_true', help='detect objects on motion crops')
+    parser.add_argument('--motion-scale', type=float, default=1.0)
+    parser.add_argument('--gate', action='store_true', help='only run object detection around motion')
+    args = parser.parse_args()
+
+    object_detector = None
+    if not args.no_objects:
+        from app.detection.object_detection import ObjectDetector
+        object_detector = ObjectDetector(roi_mode=args.roi, backend=args.backend, imgsz=args.imgsz)
+
+    clips = list(args.clips)
+    temp_dir = None
+    if not clips:
+        temp_dir = tempfile.TemporaryDirectory()
+        clips = [os.path.join(temp_dir.name, 'synthetic.avi')]
+        write_synthetic_clip(clips[0])
+
+    report = {
+        'config': {
+            'realtime': args.realtime, 'objects': object_detector is not None, 'backend': args.backend,
+            'imgsz': args.imgsz, 'roi': args.roi, 'motion_scale': args.motion_scale, 'gate': args.gate,
+        },
+        'clips': [replay(path, args, object_detector) for path in clips],
+    }
+    total_frames = sum(clip['frames'] for clip in report['clips'])
+    report['frames'] = total_frames
+    report['peak_rss_mb'] = peak_rss_mb()
+    print(json.dumps(report, indent=2))
+
+    if temp_dir is not None:
+        temp_dir.cleanup()
+
+if __name__ == '__main__':
+    main()
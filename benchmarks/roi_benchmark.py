@@ -0,0 +1,98 @@
+"""
+Model cost of ROI mode against full-frame detection on the same frames.
+Every frame gets one to three random motion ROIs; the report has, per mode,
+the model input pixels per frame (YOLO FLOPs scale with them, so the ratio is
+the relative FLOPs) and the detect() latency. The script exits with status 1
+if ROI mode costs more model input than full-frame mode.
+
+Usage: python -m benchmarks.roi_benchmark [--backend torch] [--imgsz 640] [--frames 100]
+                                          [--width 1280] [--height 720]
+With --backend null no model is loaded: only the input sizes mean anything.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import numpy as np
+from app.detection.object_detection import BACKENDS, ObjectDetector
+
+class NullBackend:
+    """Stands in for a model: detects nothing, so only the input sizes are measured"""
+    def __init__(self, imgsz=640, **kwargs):
+        self.imgsz = imgsz
+        self.names = {0: 'person'}
+
+    def predict(self, images, conf, imgsz=None):
+        return [np.zeros((0, 6), dtype=np.float32) for _ in images]
+
+BACKENDS['null'] = NullBackend
+
+def record_input_sizes(detector):
+    """Wrap the backend's predict() to log the model input side of every image it runs"""
+    sizes = []
+    predict = detector.backend.predict
+
+    def recording_predict(images, conf, imgsz=None):
+        sizes.extend([imgsz or detector.backend.imgsz] * len(images))
+        return predict(images, conf, imgsz)
+
+    detector.backend.predict = recording_predict
+    return sizes
+
+def make_frames(count, width, height, seed=0):
+    """Noisy frames, each with one to three random motion ROIs of 40-240 px"""
+    rng = random.Random(seed)
+    noise = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        frame = noise.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        rois = []
+        for _ in range(rng.randint(1, 3)):
+            box_width, box_height = rng.randint(40, 240), rng.randint(40, 240)
+            x1, y1 = rng.randint(0, width - box_width), rng.randint(0, height - box_height)
+            rois.append((x1, y1, x1 + box_width, y1 + box_height))
+        frames.append((frame, rois))
+    return frames
+
+def measure(detector, frames, roi):
+    sizes = record_input_sizes(detector)
+    latencies = []
+    for frame, rois in frames:
+        start = time.perf_counter()
+        detector.detect_batch([frame], [rois if roi else None], draw=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        'input_pixels_per_frame': sum(size * size for size in sizes) / len(frames),
+        'model_images': len(sizes),
+        'mean_ms': float(np.mean(latencies)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backend', default='torch')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames, args.width, args.height)
+    report = {'backend': args.backend, 'imgsz': args.imgsz, 'frames': args.frames}
+    for mode, roi in (('full_frame', False), ('roi', True)):
+        detector = ObjectDetector(roi_mode=roi, backend=args.backend, imgsz=args.imgsz)
+        # Warm up outside the measurement
+        detector.detect_batch([frames[0][0]], [frames[0][1] if roi else None], draw=False)
+        report[mode] = measure(detector, frames, roi)
+
+    report['relative_flops'] = report['roi']['input_pixels_per_frame'] / report['full_frame']['input_pixels_per_frame']
+    report['speedup'] = report['full_frame']['mean_ms'] / report['roi']['mean_ms']
+    print(json.dumps(report, indent=2))
+
+    if report['relative_flops'] > 1:
+        print("ROI mode runs more model input than full-frame mode", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+Load test for the async MJPEG feeds: hundreds of concurrent viewers on one core.
+By default the ASGI feed handler is driven in-process: a FrameBroadcaster is fed
+synthetic frames at --fps and every viewer is a coroutine with its own simulated
+link speed; --slow-fraction of them are too slow to keep up and must skip frames.
+With --url, raw socket clients connect to a running server (SERVER_MODE=asgi) instead.
+
+Usage: python -m benchmarks.stream_load_test [--viewers 300] [--duration 10] [--fps 30]
+                                             [--slow-fraction 0.2] [--slow-fps 5]
+                                             [--width 640] [--height 480] [--cores 1]
+       python -m benchmarks.stream_load_test --url http://host:5000/video_feed [--viewers 300]
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+import numpy as np
+from benchmarks.replay_benchmark import peak_rss_mb
+from app.monitoring.prometheus import Counter
+from app.pipeline.frame_pool import FramePool
+from app.streaming.asgi_feed import serve_feed
+from app.streaming.broadcaster import FrameBroadcaster
+
+def publish_frames(broadcaster, args, stop):
+    """Publish synthetic frames at args.fps until stop is set"""
+    from benchmarks.frame_alloc_benchmark import make_source_frames
+    sources = make_source_frames(args.width, args.height, count=30)
+    pool = FramePool("load-test")
+    interval = 1.0 / args.fps
+    next_frame = time.perf_counter()
+    i = 0
+    while not stop.is_set():
+        frame = pool.acquire(sources[0].shape)
+        np.copyto(frame.array, sources[i % len(sources)])
+        broadcaster.publish(frame.freeze())
+        frame.release()
+        i += 1
+        next_frame += interval
+        time.sleep(max(0.0, next_frame - time.perf_counter()))
+    return i
+
+class Viewer:
+    """One simulated client: counts what it receives and sleeps to model its link speed"""
+    def __init__(self, max_fps=None):
+        self.delay = 1.0 / max_fps if max_fps else 0.0
+        self.frames = 0
+        self.bytes = 0
+        self.skipped = Counter("skipped_frames", "Frames this viewer skipped", []).labels()
+        self.disconnect = asyncio.Event()
+
+    async def receive(self):
+        await self.disconnect.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] != 'http.response.body':
+            return
+        self.frames += 1
+        self.bytes += len(message['body'])
+        # A slow link: the next send() can't start until this one has drained
+        await asyncio.sleep(self.delay)
+
+def summarize(viewers, duration):
+    """Per-viewer delivery figures for one group of viewers"""
+    if not viewers:
+        return None
+    fps = np.array([viewer.frames / duration for viewer in viewers])
+    return {
+        'viewers': len(viewers),
+        'fps_mean': float(fps.mean()),
+        'fps_min': float(fps.min()),
+        'skipped_frames': int(sum(viewer.skipped.value for viewer in viewers)),
+        'mbytes': sum(viewer.bytes for viewer in viewers) / 1e6,
+    }
+
+async def run_in_process(args):
+    """Drive serve_feed with simulated viewers; returns the report"""
+    broadcaster = FrameBroadcaster("load-test")
+    slow_count = int(args.viewers * args.slow_fraction)
+    viewers = [Viewer(args.slow_fps if i < slow_count else None) for i in range(args.viewers)]
+
+    stop = threading.Event()
+    published = []
+    publisher = threading.Thread(target=lambda: published.append(publish_frames(broadcaster, args, stop)), daemon=True)
+    publisher.start()
+
+    start, cpu_start = time.perf_counter(), time.process_time()
+    tasks = [asyncio.ensure_future(serve_feed(broadcaster, viewer.receive, viewer.send, skipped=viewer.skipped))
+             for viewer in viewers]
+    await asyncio.sleep(args.duration)
+    for viewer in viewers:
+        viewer.disconnect.set()
+    await asyncio.gather(*tasks)
+    elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+    stop.set()
+    publisher.join()
+
+    return {
+        'frames_published': published[0],
+        'fast': summarize(viewers[slow_count:], elapsed),
+        'slow': summarize(viewers[:slow_count], elapsed),
+        'elapsed_seconds': elapsed,
+        'cpu_percent': 100 * cpu / elapsed,
+        'threads': threading.active_count(),
+    }
+
+async def remote_viewer(url, deadline, stats):
+    """Read an MJPEG feed over a raw socket until the deadline, counting parts"""
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    writer.write(f"GET {parts.path or '/'} HTTP/1.1\r\nHost: {parts.netloc}\r\n\r\n".encode())
+    await writer.drain()
+    tail = b''
+    try:
+        while time.perf_counter() < deadline:
+            data = await asyncio.wait_for(reader.read(65536), max(0.01, deadline - time.perf_counter()))
+            if not data:
+                break
+            stats['bytes'] += len(data)
+            # Count boundaries, including one split across two reads
+            chunk = tail + data
+            stats['frames'] += chunk.count(b'--frame\r\n')
+            tail = chunk[-9:]
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        writer.close()
+
+async def run_remote(args):
+    """Connect args.viewers socket clients to args.url; returns the report"""
+    start = time.perf_counter()
+    deadline = start + args.duration
+    stats = [{'frames': 0, 'bytes': 0} for _ in range(args.viewers)]
+    results = await asyncio.gather(*(remote_viewer(args.url, deadline, s) for s in stats), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    fps = np.array([s['frames'] / elapsed for s in stats])
+    return {
+        'url': args.url,
+        'viewers': args.viewers,
+        'failed_connections': sum(isinstance(result, Exception) for result in results),
+        'fps_mean': float(fps.mean()),
+        'fps_min': float(fps.min()),
+        'mbytes': sum(s['bytes'] for s in stats) / 1e6,
+        'elapsed_seconds': elapsed,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--viewers', type=int, default=300)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds')
+    parser.add_argument('--fps', type=float, default=30.0, help='frames published per second')
+    parser.add_argument('--slow-fraction', type=float, default=0.2, help='share of viewers on a slow link')
+    parser.add_argument('--slow-fps', type=float, default=5.0, help='frames per second a slow link can take')
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--cores', type=int, default=1, help='pin the process to this many cores (Linux)')
+    parser.add_argument('--url', help='load a running server instead of the in-process handler')
+    args = parser.parse_args()
+
+    if args.cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, sorted(os.sched_getaffinity(0))[:args.cores])
+
+    report = {
+        'config': {
+            'viewers': args.viewers, 'duration': args.duration, 'fps': args.fps,
+            'slow_fraction': args.slow_fraction, 'slow_fps': args.slow_fps,
+            'resolution': f"{args.width}x{args.height}",
+            'cores': len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else None,
+        },
+    }
+    if args.url:
+        report.update(asyncio.run(run_remote(args)))
+    else:
+        report.update(asyncio.run(run_in_process(args)))
+    report['peak_rss_mb'] = peak_rss_mb()
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,27 @@
+import logging
+import multiprocessing
+import os
 from app import create_app
 
-app = create_app()
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+# 'threaded' (Flask's server, a thread per viewer) or 'asgi' (uvicorn, async feeds)
+SERVER_MODE = os.getenv('SERVER_MODE', 'threaded')
+
+# Detection worker processes are spawned and re-import this module as __mp_main__
+# (named after the worker by then, before parent_process() is set); only the main
+# process may open the cameras and start the pipelines
+start_services = multiprocessing.current_process().name == "MainProcess"
+
+if SERVER_MODE == "asgi":
+    from app.asgi import create_asgi_app
+    app = create_asgi_app(start_services=start_services)
+else:
+    app = create_app(start_services=start_services)
 
 if __name__ == "__main__":
-    app.run(host ="0.0.0.0", port=5000, debug=False, threaded=True)
\ No newline at end of file
+    if SERVER_MODE == "asgi":
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=5000)
+    else:
+        app.run(host ="0.0.0.0", port=5000, debug=False, threaded=True)
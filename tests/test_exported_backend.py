@@ -0,0 +1,75 @@
+"""
+Post-processing of exported-model outputs (ExportedModelBackend): decoding,
+per-class NMS and undoing the letterbox, against hand-computed rows.
+Only needs OpenCV and NumPy; no model is loaded.
+
+Usage: python -m pytest tests
+"""
+import importlib.util
+import unittest
+
+MISSING = [name for name in ('cv2', 'numpy') if importlib.util.find_spec(name) is None]
+
+if not MISSING:
+    import numpy as np
+    from app.detection.object_detection import ExportedModelBackend, letterbox
+
+def make_backend(iou_threshold=0.7, max_detections=300):
+    """An ExportedModelBackend with only its post-processing settings, skipping export and load"""
+    backend = ExportedModelBackend.__new__(ExportedModelBackend)
+    backend.iou_threshold = iou_threshold
+    backend.max_detections = max_detections
+    return backend
+
+def raw_output(anchors, classes=2):
+    """A model output (4 + classes, anchors) from (cx, cy, w, h, class_id, score) per anchor"""
+    output = np.zeros((4 + classes, len(anchors)), dtype=np.float32)
+    for i, (cx, cy, width, height, class_id, score) in enumerate(anchors):
+        output[:4, i] = cx, cy, width, height
+        output[4 + class_id, i] = score
+    return output
+
+@unittest.skipIf(MISSING, f"missing {', '.join(MISSING)}")
+class PostprocessTest(unittest.TestCase):
+    def setUp(self):
+        # A 640x480 frame letterboxed to 320: half size, 40 px of padding above and below
+        self.shape = (480, 640, 3)
+        _, self.scale, self.pad = letterbox(np.zeros(self.shape, dtype=np.uint8), 320)
+
+    def test_letterbox_geometry(self):
+        self.assertEqual(self.scale, 0.5)
+        self.assertEqual(self.pad, (0, 40))
+
+    def test_nms_and_letterbox_inverse(self):
+        output = raw_output([
+            (100, 100, 40, 60, 0, 0.9),
+            # Overlaps the first box in the same class: suppressed
+            (102, 100, 40, 60, 0, 0.6),
+            # The same box in another class: kept, NMS is per class
+            (102, 100, 40, 60, 1, 0.8),
+            # Below the confidence threshold
+            (200, 200, 20, 20, 0, 0.2),
+            # Runs past the bottom-right corner of the frame: clipped
+            (310, 270, 40, 40, 1, 0.5),
+        ])
+        detections = make_backend().postprocess(output, 0.25, self.scale, self.pad, self.shape)
+        np.testing.assert_allclose(detections, [
+            [160, 60, 240, 180, 0.9, 0],
+            [164, 60, 244, 180, 0.8, 1],
+            [580, 420, 640, 480, 0.5, 1],
+        ], rtol=0, atol=1e-4)
+        self.assertEqual(detections.dtype, np.float32)
+
+    def test_max_detections(self):
+        output = raw_output([(50 * i + 25, 100, 20, 20, 0, 0.3 + 0.1 * i) for i in range(5)])
+        detections = make_backend(max_detections=2).postprocess(output, 0.25, self.scale, self.pad, self.shape)
+        self.assertEqual(len(detections), 2)
+        np.testing.assert_allclose(detections[:, 4], [0.7, 0.6], atol=1e-6)
+
+    def test_nothing_above_threshold(self):
+        output = raw_output([(100, 100, 40, 60, 0, 0.1)])
+        detections = make_backend().postprocess(output, 0.25, self.scale, self.pad, self.shape)
+        self.assertEqual(detections.shape, (0, 6))
+
+if __name__ == '__main__':
+    unittest.main()